@@ -21,12 +21,16 @@
 #
  
 import sys
+import concurrent.futures
+import functools
 import json
 import re
 import time
 import traceback
-from threading import Thread
+from threading import Thread, Event, Lock
 import urllib
+import select
+import socket
 import os
 import importlib
 import random
@@ -46,11 +50,34 @@ except ValueError:
     _trans = glocale.translation
 _ = _trans.gettext
 
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MAX_SEARCHES = 2 # searches running at the same time, the others wait
+
 class Request:
-    pass
+    "The data of one HTTP request, given to the functions in routes.py"
+    def __init__(self, handler, dbdata):
+        self.handler = handler
+        self.dbdata = dbdata # the same data for the whole request even if reloaded meanwhile
+        self.cancelled = Event()
+        i = handler.path.find("?")
+        if i > 0:
+            self.path = handler.path[:i]
+            self.qs = handler.path[i+1:]
+            self.args = urllib.parse.parse_qs(self.qs)
+        else:
+            self.path = handler.path
+            self.qs = None
+            self.args = None
 
-request = Request()
+    def client_gone(self):
+        "Returns True if the browser has closed the connection"
+        sock = self.handler.connection
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
 
 basedir = os.path.split(__file__)[0]
 sys.path.append(basedir)
@@ -58,6 +85,7 @@ os.chdir(basedir)
 
 import routes
 import connections
+import snapshot
 
 def get_func(path, server):
     if server.gramplet.development_mode.get_active():
@@ -65,11 +93,9 @@ def get_func(path, server):
         importlib.reload(connections)
         importlib.reload(routes)
         sys.path = saved_path
-    routes.dbdata = server.dbdata
-    routes.request = request
     routes.basedir = basedir
     routes.server = server
-    return routes.map[path]
+    return routes.map.get(path)
 
 class WebServer(Thread):
     def __init__(self, gramplet, port=8888):
@@ -77,8 +103,23 @@ class WebServer(Thread):
         self.gramplet = gramplet
         self.port = port
         self.running = False
-        self.dbdata = connections.load_dbdata(gramplet.dbstate)
+        self.dbdata = snapshot.get_dbdata(gramplet.dbstate)
         self.refresh_needed = False
+        self.search_pool = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_SEARCHES)
+        self.requests = set() # requests being handled
+        self.lock = Lock()
+
+    def cancel_requests(self):
+        with self.lock:
+            for request in self.requests:
+                request.cancelled.set()
+
+    def stop(self):
+        self.running = False
+        self.cancel_requests()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.search_pool.shutdown(wait=False)
 
     def run(self):
         server = self
@@ -94,34 +135,35 @@ class WebServer(Thread):
             
             def do_GET(self):
                 #print(self.path)
+                try:
+                    self.handle_get()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass # the browser did not wait for the response
+
+            def handle_get(self):
                 if self.path == "/favicon.ico": return
                 if self.path == "/": self.path = "/static/index.html"
                 if self.path.startswith("/static/"):
                     fname = os.path.join(basedir,self.path[1:])
-                    data = open(fname,"rb").read()
+                    with open(fname,"rb") as f:
+                        data = f.read()
                     #print("data:"+data.decode("utf-8"))
                     self.send(data)
                     return
-                i = self.path.find("?")
-                #request = Request()
-                if i > 0:
-                    request.path = self.path[:i]
-                    request.qs = self.path[i+1:]
-                    request.args = urllib.parse.parse_qs(request.qs)
-                else:
-                    request.path = self.path
-                    request.qs = None
-                    request.args = None
-
+                request = Request(self, server.dbdata)
                 f = get_func(request.path, server)
                 if f: 
-                    rsp = ["?"]
-                    exec("rsp[0] = f()",locals())
-                    r = rsp[0]
+                    with server.lock:
+                        server.requests.add(request)
+                    try:
+                        r = f(request)
+                    finally:
+                        with server.lock:
+                            server.requests.discard(request)
                     if type(r) == str:
                         self.send(r.encode("utf-8"), content_type='application/json')
                     elif r.status != 200:
-                        self.send_response(404)
+                        self.send_response(r.status)
                         self.end_headers()
                     else:
                         self.send(r.data, r.content_type)
@@ -131,7 +173,7 @@ class WebServer(Thread):
                     self.wfile.write("Not found".encode("utf-8"))
 
         server_address = ('127.0.0.1', self.port)
-        self.httpd = HTTPServer(server_address, Handler)
+        self.httpd = ThreadingHTTPServer(server_address, Handler)
         server.gramplet.append_text("running at port {}\n".format(self.port))
         self.running = True
         self.httpd.serve_forever()
@@ -157,26 +199,36 @@ class DeepConnectionsGraph(Gramplet):
     def db_changed(self):
         self.__clear(None)
         if self.server:
-            self.server.dbdata = connections.load_dbdata(self.dbstate)
+            self.server.dbdata = snapshot.get_dbdata(self.dbstate)
 
         """Connect the signals that trigger an update."""
-        self.connect(self.dbstate.db, 'person-update', self.updated)
-        self.connect(self.dbstate.db, 'person-add', self.updated)
-        self.connect(self.dbstate.db, 'person-delete', self.updated)
-        self.connect(self.dbstate.db, 'person-rebuild', self.updated)
-        self.connect(self.dbstate.db, 'family-rebuild', self.updated)
-        self.connect(self.dbstate.db, 'family-add', self.updated)
-        self.connect(self.dbstate.db, 'family-delete', self.updated)
-        self.connect(self.dbstate.db, 'family-update', self.updated)
-        self.connect(self.dbstate.db, 'event-rebuild', self.updated)
-        self.connect(self.dbstate.db, 'event-add', self.updated)
-        self.connect(self.dbstate.db, 'event-delete', self.updated)
-        self.connect(self.dbstate.db, 'event-update', self.updated)
-        
-    def updated(self, *args):
+        for object_type in ('Person', 'Family', 'Event'):
+            prefix = object_type.lower()
+            for action in ('add', 'update', 'delete'):
+                self.connect(self.dbstate.db, prefix + '-' + action,
+                             functools.partial(self.updated, object_type))
+            self.connect(self.dbstate.db, prefix + '-rebuild', self.rebuilt)
+        for action in ('add', 'update', 'delete'):
+            self.connect(self.dbstate.db, 'note-' + action, self.notes_updated)
+        self.connect(self.dbstate.db, 'note-rebuild', self.rebuilt)
+
+    def updated(self, object_type, handles):
+        "Update only the changed objects"
+        if self.server:
+            self.server.refresh_needed = True
+            connections.update_dbdata(self.dbstate, self.server.dbdata, object_type, handles)
+
+    def notes_updated(self, handles):
+        "Update the note links of the objects that have the notes"
+        if self.server:
+            self.server.refresh_needed = True
+            connections.update_notes(self.dbstate, self.server.dbdata, handles)
+
+    def rebuilt(self, *args):
         if self.server:
             self.server.refresh_needed = True
             self.server.dbdata = connections.load_dbdata(self.dbstate)
+            self.server.dbdata.modified = True
 
     def __clear(self, obj):
         pass
@@ -255,6 +307,7 @@ class DeepConnectionsGraph(Gramplet):
         self.port = port
         self.append_text("starting server at port {}\n".format(port))
         importlib.reload(connections)
+        importlib.reload(snapshot)
         importlib.reload(routes)
         self.server = WebServer(gramplet=self, port=port)
         self.server.start()
@@ -277,9 +330,9 @@ class DeepConnectionsGraph(Gramplet):
             return
         print("stopping server")
         self.append_text("stopping server\n")
-        self.server.running = False
-        self.server.httpd.shutdown()
-        self.server.httpd.server_close()
+        self.server.stop()
+        if self.server.dbdata.modified:
+            snapshot.save_dbdata(self.dbstate, self.server.dbdata)
         self.server = None
         self.but_start.set_sensitive(True)
         self.but_stop.set_sensitive(False)
@@ -290,6 +343,7 @@ class DeepConnectionsGraph(Gramplet):
     def cb_refresh(self,obj):
         if self.server:
             self.server.dbdata = connections.load_dbdata(self.dbstate)
+            snapshot.save_dbdata(self.dbstate, self.server.dbdata)
             self.server.refresh_needed = False
             self.append_text("loaded new dbdata\n")
 
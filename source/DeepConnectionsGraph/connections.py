@@ -11,7 +11,8 @@ Author: kari.kujansuu@gmail.com, 2019
 # Python modules
 #
 #------------------------------------------------------------------------
-from collections import defaultdict
+from array import array
+from collections import defaultdict, deque
 import json
 import os
 from pprint import pprint
@@ -41,12 +42,137 @@ bgcolor         = "lightsteelblue"
 
 DEBUG = False
 class DBData:
+    """
+    The nodes (people, families, events and objects linked from notes) are
+    numbered from 0: nodes[i] is the key (type, handle) of node i and node_ids
+    maps the keys back to the numbers.
+
+    The links are stored as arrays in CSR form: the links from node i go to
+    targets[offsets[i]:offsets[i+1]] and their roles are in linkroles at the
+    same positions. A role is an index to the roles table of assoc_types,
+    where the reverse links have the assoc_type prefixed with "<". Every link
+    is stored in both directions and the links of a node are sorted by
+    sortkey.
+
+    The arrays are not modified after loading; the links of the nodes changed
+    later are kept in 'changed'. Link objects are created only when needed.
+    """
     def __init__(self):
-        self.xref = defaultdict(list)  # (handle_type,handle) -> [Link(assoc_type, handle_type, handle, [role]), ]
+        self.nodes = [] # node id -> (handle_type,handle)
+        self.node_ids = {} # (handle_type,handle) -> node id
+        self.offsets = array('i', [0])
+        self.targets = array('i')
+        self.linkroles = array('i')
+        self.changed = {} # node id -> (targets, linkroles)
+        self.roles = [] # role -> assoc_type
+        self.role_ids = {} # assoc_type -> role
+        self.reverse_roles = {} # role -> role of the reverse link
         self.names = {} # personhandle -> (name,years)
         self.family_names = {} # family_handle -> name
         self.events = {} # eventhandle -> (type, gramps_id, description)
-    
+        self.modified = False # changed since loaded or saved to the snapshot
+        self.key = None # snapshot key of the database when loaded or saved
+
+    def node_id(self, node):
+        i = self.node_ids.get(node)
+        if i is None:
+            i = len(self.nodes)
+            self.nodes.append(node)
+            self.node_ids[node] = i
+        return i
+
+    def role_id(self, assoc_type):
+        role = self.role_ids.get(assoc_type)
+        if role is None:
+            role = len(self.roles)
+            self.roles.append(assoc_type)
+            self.role_ids[assoc_type] = role
+        return role
+
+    def reverse_role(self, role):
+        reverse = self.reverse_roles.get(role)
+        if reverse is None:
+            assoc_type = self.roles[role]
+            if assoc_type[0] == "<":
+                reverse = self.role_id(assoc_type[1:])
+            else:
+                reverse = self.role_id("<" + assoc_type)
+            self.reverse_roles[role] = reverse
+        return reverse
+
+    def links(self, i):
+        "Returns the links from node i as (target, role) pairs"
+        changed = self.changed.get(i)
+        if changed is not None:
+            return zip(*changed)
+        if i + 1 >= len(self.offsets):
+            return zip()
+        start, end = self.offsets[i], self.offsets[i+1]
+        return zip(self.targets[start:end], self.linkroles[start:end])
+
+    def set_links(self, i, links):
+        "Replaces the links from node i with the (target, role) pairs"
+        roles = self.roles
+        links = sorted(links, key=lambda link: link_sortkey(roles[link[1]]))
+        self.changed[i] = (array('i', [target for target, role in links]),
+                           array('i', [role for target, role in links]))
+
+    def make_link(self, i, role, j):
+        assoc_type = self.roles[role]
+        return Link(assoc_type, self.nodes[i], self.nodes[j], reverse=(assoc_type[0] == "<"))
+
+    def get_links(self, node):
+        "Returns the links from the node (handle_type,handle) as Link objects"
+        i = self.node_ids.get(node)
+        if i is None:
+            return []
+        return [self.make_link(i, role, j) for j, role in self.links(i)]
+
+def link_sortkey(assoc_type):
+    if assoc_type[0] == "<": assoc_type = assoc_type[1:]
+    if assoc_type == "parent_family":
+        return 1
+    if assoc_type == "family":
+        return 2
+    return 3
+
+def build_csr(dbdata, sources, targets, linkroles):
+    """
+    Stores the links sources[k] -> targets[k] and their reverse links as
+    the arrays of dbdata, sorted by node and sortkey
+    """
+    n = len(dbdata.nodes)
+    reverse = [dbdata.reverse_role(role) for role in range(len(dbdata.roles))]
+    keys = [link_sortkey(assoc_type) - 1 for assoc_type in dbdata.roles]
+    # counting sort by (node, sortkey)
+    counts = [0] * (3 * n + 1)
+    for source, target, role in zip(sources, targets, linkroles):
+        counts[3 * source + keys[role] + 1] += 1
+        counts[3 * target + keys[reverse[role]] + 1] += 1
+    for b in range(1, len(counts)):
+        counts[b] += counts[b-1]
+    offsets = array('i', counts[0:3*n+1:3])
+    m = counts[-1]
+    csr_targets = array('i', [0]) * m
+    csr_roles = array('i', csr_targets)
+    for source, target, role in zip(sources, targets, linkroles):
+        b = 3 * source + keys[role]
+        pos = counts[b]
+        csr_targets[pos] = target
+        csr_roles[pos] = role
+        counts[b] = pos + 1
+    for source, target, role in zip(sources, targets, linkroles):
+        role = reverse[role]
+        b = 3 * target + keys[role]
+        pos = counts[b]
+        csr_targets[pos] = source
+        csr_roles[pos] = role
+        counts[b] = pos + 1
+    dbdata.offsets = offsets
+    dbdata.targets = csr_targets
+    dbdata.linkroles = csr_roles
+    dbdata.changed = {}
+
 class Link:
     def __init__(self, assoc_type, from_node, to_node, reverse=False, sortkey=0):  
         # assoc_type = 'family', 'parent_family', 'assoc', <event-role>
@@ -56,13 +182,7 @@ class Link:
         self.from_node = from_node
         self.to_node = to_node
         self.reverse = reverse
-        if assoc_type[0] == "<": assoc_type = assoc_type[1:]
-        if assoc_type == "parent_family": 
-            self.sortkey = 1
-        elif assoc_type == "family": 
-            self.sortkey = 2
-        else:
-            self.sortkey = 3
+        self.sortkey = link_sortkey(assoc_type)
             
     def __hash__(self):
         return hash((self.assoc_type,self.from_node,self.to_node,self.reverse))
@@ -76,6 +196,12 @@ class Link:
     def copy(self):
         return Link(self.assoc_type, self.from_node, self.to_node, self.reverse)
 
+    def reversed(self):
+        "The same link in the opposite direction, like the generated reverse links"
+        if self.assoc_type[0] == "<":
+            return Link(self.assoc_type[1:], self.to_node, self.from_node)
+        return Link("<"+self.assoc_type, self.to_node, self.from_node, reverse=True)
+
     @staticmethod            
     def default(obj):
          #if isinstance(obj, Link):
@@ -93,81 +219,52 @@ class Link:
             return link
         return objdict
 
-def add_notelinks(dbstate, dbdata, key, person):
-    for note_handle in person.get_note_list():
+def get_notelinks(dbstate, key, obj):
+    links = []
+    for note_handle in obj.get_note_list():
         note = dbstate.db.get_note_from_handle(note_handle)
-        links = note.get_links()
-        for link in links:
+        for link in note.get_links():
             #print(link)
             # esim. ('gramps', 'Person', 'handle', 'e6b5be02dfb30ff524c96f5d7d1')
             if link[0] == "gramps": # and link[1] == "Person":
                 if link[2] == "handle":
                     object_type = link[1]
                     linkhandle = link[3]
-                    dbdata.xref[key].append(Link("note",key,(object_type,linkhandle)))
-
-def load_dbdata(dbstate):
-    dbdata = DBData()
-    dbdata.dbname = dbstate.db.get_dbname()
-    "Returns a structure containing the relevant parts of the database (family tree)"
-    for person_handle in dbstate.db.get_person_handles():
-        person = dbstate.db.get_person_from_handle(person_handle)
-        name = name_displayer.display(person)
-        years = utils.get_years( dbstate, person )
-        dbdata.names[person_handle] = (name,years)
-        assoc_list = person.get_person_ref_list()
-        key = ('Person',person_handle)
-        for family_handle in person.get_family_handle_list():
-            dbdata.xref[key].append(Link("family", key, ('Family', family_handle)))
-        for family_handle in person.get_parent_family_handle_list():
-            dbdata.xref[key].append(Link("parent_family", key, ('Family', family_handle)))
-        for eventref in person.get_event_ref_list():
-            event_handle = eventref.ref
-            event = dbstate.db.get_event_from_handle(event_handle)
-            role = str(eventref.role)
-            try:
-                role = role.encode("utf-8").decode("iso8859-1")  # role seems to have an invalid encoding, trying to fix
-            except:
-                pass
-            if True or event.get_type() == "Kaste":
-                dbdata.xref[key].append(Link(role, key, ('Event', event_handle) ))
-        for assoc in assoc_list:
-            assoc_handle = assoc.get_reference_handle()
-            dbdata.xref[key].append(Link("assoc: " + assoc.rel, key, ('Person', assoc_handle)))
-        add_notelinks(dbstate, dbdata, key, person)
-
-    for family_handle in dbstate.db.get_family_handles():
-        family = dbstate.db.get_family_from_handle(family_handle)
-        name = get_family_name(dbstate, family)
-        dbdata.family_names[family_handle] = name
-        key = ('Family',family_handle)
-        for eventref in family.get_event_ref_list():
-            event_handle = eventref.ref
-            role = str(eventref.role)
-            try:
-                role = role.encode("utf-8").decode("iso8859-1")  # role seems to have an invalid encoding, trying to fix
-            except:
-                pass
-            dbdata.xref[key].append(Link(role, key, ('Event', event_handle) ))
-        add_notelinks(dbstate, dbdata, key, family)
-
-    for event_handle in dbstate.db.get_event_handles():
-        event = dbstate.db.get_event_from_handle(event_handle)
-        dbdata.events[event_handle] = ( event.get_type(), event.gramps_id, event.get_description() )
-        key = ('Event',event_handle)
-        add_notelinks(dbstate, dbdata, key, event)
-
-    # generate reverse links
-    dbdata2 = DBData()
-    for links in list(dbdata.xref.values())[:]:
-        for link in links[:]:
-            if link.assoc_type[0] == "<": continue
-            dbdata.xref[link.to_node].append(Link("<"+link.assoc_type, link.to_node, link.from_node, reverse=True))
-    for key,links in dbdata.xref.items():
-        dbdata.xref[key] = sorted(links, key=lambda link: link.sortkey )            
-    print("loaded new dbdata")
-    return dbdata
-    
+                    links.append(Link("note",key,(object_type,linkhandle)))
+    return links
+
+def get_role(eventref):
+    role = str(eventref.role)
+    try:
+        role = role.encode("utf-8").decode("iso8859-1")  # role seems to have an invalid encoding, trying to fix
+    except:
+        pass
+    return role
+
+def get_person_links(dbstate, person):
+    key = ('Person',person.handle)
+    links = []
+    for family_handle in person.get_family_handle_list():
+        links.append(Link("family", key, ('Family', family_handle)))
+    for family_handle in person.get_parent_family_handle_list():
+        links.append(Link("parent_family", key, ('Family', family_handle)))
+    for eventref in person.get_event_ref_list():
+        links.append(Link(get_role(eventref), key, ('Event', eventref.ref) ))
+    for assoc in person.get_person_ref_list():
+        assoc_handle = assoc.get_reference_handle()
+        links.append(Link("assoc: " + assoc.rel, key, ('Person', assoc_handle)))
+    return links + get_notelinks(dbstate, key, person)
+
+def get_family_links(dbstate, family):
+    key = ('Family',family.handle)
+    links = []
+    for eventref in family.get_event_ref_list():
+        links.append(Link(get_role(eventref), key, ('Event', eventref.ref) ))
+    return links + get_notelinks(dbstate, key, family)
+
+def get_event_links(dbstate, event):
+    key = ('Event',event.handle)
+    return get_notelinks(dbstate, key, event)
 
 def get_family_name(dbstate, family):
     father_handle = family.get_father_handle()
@@ -190,6 +287,123 @@ def get_family_name(dbstate, family):
     return family.gramps_id
 
 
+def get_person_name(dbstate, person):
+    name = name_displayer.display(person)
+    years = utils.get_years( dbstate, person )
+    return (name,years)
+
+def get_event_name(dbstate, event):
+    return ( event.get_type(), event.gramps_id, event.get_description() )
+
+# object type -> (names table, name function, links function)
+OBJECT_TYPES = {
+    'Person': ("names", get_person_name, get_person_links),
+    'Family': ("family_names", get_family_name, get_family_links),
+    'Event': ("events", get_event_name, get_event_links),
+}
+
+def load_dbdata(dbstate):
+    "Returns a structure containing the relevant parts of the database (family tree)"
+    dbdata = DBData()
+    dbdata.dbname = dbstate.db.get_dbname()
+    db = dbstate.db
+    sources = array('i')
+    targets = array('i')
+    linkroles = array('i')
+    for object_type, iterfunc in (
+        ('Person', db.iter_people),
+        ('Family', db.iter_families),
+        ('Event', db.iter_events),
+    ):
+        tablename, namefunc, linkfunc = OBJECT_TYPES[object_type]
+        table = getattr(dbdata, tablename)
+        for obj in iterfunc():
+            table[obj.handle] = namefunc(dbstate, obj)
+            i = dbdata.node_id((object_type,obj.handle))
+            for link in linkfunc(dbstate, obj):
+                sources.append(i)
+                targets.append(dbdata.node_id(link.to_node))
+                linkroles.append(dbdata.role_id(link.assoc_type))
+
+    # also generates the reverse links
+    build_csr(dbdata, sources, targets, linkroles)
+    print("loaded new dbdata")
+    return dbdata
+
+def get_object(db, object_type, handle):
+    "Returns the object or None if it has been deleted"
+    if object_type == 'Person' and db.has_person_handle(handle):
+        return db.get_person_from_handle(handle)
+    if object_type == 'Family' and db.has_family_handle(handle):
+        return db.get_family_from_handle(handle)
+    if object_type == 'Event' and db.has_event_handle(handle):
+        return db.get_event_from_handle(handle)
+    return None
+
+def update_dbdata(dbstate, dbdata, object_type, handles):
+    """
+    Updates the data of added, changed or deleted objects and the names
+    that depend on them.
+
+    The links of a node are replaced, never modified in place, so that a
+    search running in a web server thread is not disturbed.
+    """
+    tablename, namefunc, linkfunc = OBJECT_TYPES[object_type]
+    table = getattr(dbdata, tablename)
+    roles = dbdata.roles
+    dbdata.modified = True
+    for handle in handles:
+        i = dbdata.node_id((object_type, handle))
+        # remove the links from this object and the reverse links to it
+        old_links = list(dbdata.links(i))
+        for j in set(j for j, role in old_links if roles[role][0] != "<"):
+            dbdata.set_links(j, [(k, role) for k, role in dbdata.links(j)
+                                 if not (k == i and roles[role][0] == "<")])
+        links = [(j, role) for j, role in old_links if roles[role][0] == "<" and j != i]
+        obj = get_object(dbstate.db, object_type, handle)
+        if obj is None:
+            table.pop(handle, None)
+            dbdata.set_links(i, links)
+            continue
+        table[handle] = namefunc(dbstate, obj)
+        new_links = [(dbdata.node_id(link.to_node), dbdata.role_id(link.assoc_type))
+                     for link in linkfunc(dbstate, obj)]
+        dbdata.set_links(i, new_links + links)
+        reverse_links = defaultdict(list)
+        for j, role in new_links:
+            reverse_links[j].append((i, dbdata.reverse_role(role)))
+        for j, links in reverse_links.items():
+            dbdata.set_links(j, list(dbdata.links(j)) + links)
+
+    # names that include data from the changed objects
+    if object_type == 'Person':
+        for handle in handles:
+            for link in dbdata.get_links(('Person',handle)):
+                if link.assoc_type == "family":
+                    update_name(dbstate, dbdata, 'Family', link.to_node[1])
+    if object_type == 'Event':
+        for handle in handles:
+            for link in dbdata.get_links(('Event',handle)):
+                if link.to_node[0] == 'Person':
+                    update_name(dbstate, dbdata, 'Person', link.to_node[1])
+
+def update_notes(dbstate, dbdata, note_handles):
+    "Updates the note links of the objects that have the changed notes"
+    referrers = defaultdict(set)
+    for note_handle in note_handles:
+        for object_type, handle in dbstate.db.find_backlink_handles(
+                note_handle, include_classes=list(OBJECT_TYPES)):
+            referrers[object_type].add(handle)
+    for object_type, handles in referrers.items():
+        update_dbdata(dbstate, dbdata, object_type, list(handles))
+
+def update_name(dbstate, dbdata, object_type, handle):
+    tablename, namefunc, linkfunc = OBJECT_TYPES[object_type]
+    obj = get_object(dbstate.db, object_type, handle)
+    if obj is not None:
+        getattr(dbdata, tablename)[handle] = namefunc(dbstate, obj)
+    
+
 def generate_graph(dbdata, paths, start_handle, end_handle):
     lines = []
     def emit(s):
@@ -307,7 +521,7 @@ def fix_path(path):
 class VeryDeepConnections:
     """
     Finds deep connections between two people.
-    Uses a breadth-first search algorithm.
+    Uses a bidirectional breadth-first search algorithm.
     In addition to biological relationships also supports connections via
     - events
     - notes
@@ -329,8 +543,8 @@ class VeryDeepConnections:
 
     So from the searching algorithm perspective the nodes can be people, families or events.
     """
-    def __init__(self, server, dbdata, use_relatives, use_events, use_notes, use_associations, use_places):
-        self.server = server
+    def __init__(self, cancelled, dbdata, use_relatives, use_events, use_notes, use_associations, use_places):
+        self.cancelled = cancelled # threading.Event, set to stop the search
         self.dbdata = dbdata
         self.use_relatives = use_relatives
         self.use_events = use_events
@@ -338,18 +552,13 @@ class VeryDeepConnections:
         self.use_associations = use_associations
         self.use_places = use_places
         self.cache = None
+        self.allowed_roles = {} # role -> whether links with the role are used
 
     def get_relatives(self, object_type, handle, path):
         """
         Gets all of the relations of handle.
         """
-        return self.dbdata.xref[(object_type,handle)]
-
-    def contains(self, path, new_handle):
-        for link in path:
-            if link.to_node[1] == new_handle:
-                return True
-        return False
+        return self.dbdata.get_links((object_type,handle))
 
     def getname(self,current_type, current_handle):
         if current_type == 'Person':
@@ -361,83 +570,168 @@ class VeryDeepConnections:
         return "??? " + current_type + ": " + current_handle
         
     def generate_paths(self, person1handle, person2handle, maxpaths, throttle):
-        c  = VeryDeepConnections( self.server, self.dbdata, 
+        c  = VeryDeepConnections( self.cancelled, self.dbdata, 
             use_relatives=True, use_events=False, use_notes=False, use_associations=False, use_places=False)
         #yield from c.generate_paths1(person1handle, person2handle, maxpaths, throttle)
         if self.use_events:        
-            c  = VeryDeepConnections( self.server, self.dbdata, 
+            c  = VeryDeepConnections( self.cancelled, self.dbdata, 
                 use_relatives=True, use_events=True, use_notes=False, use_associations=False, use_places=False)
             yield from c.generate_paths1(person1handle, person2handle, maxpaths, throttle)
         if self.use_notes:        
-            c  = VeryDeepConnections( self.server, self.dbdata, 
+            c  = VeryDeepConnections( self.cancelled, self.dbdata, 
                 use_relatives=True, use_events=self.use_events, use_notes=True, use_associations=False, use_places=False)
             yield from c.generate_paths1(person1handle, person2handle, maxpaths, throttle)
         if self.use_associations:        
-            c  = VeryDeepConnections( self.server, self.dbdata, 
+            c  = VeryDeepConnections( self.cancelled, self.dbdata, 
                 use_relatives=True, use_events=self.use_events, use_notes=self.use_notes, use_associations=True, use_places=False)
             yield from c.generate_paths1(person1handle, person2handle, maxpaths, throttle)
 
+    def allowed_role(self, role):
+        allowed = self.allowed_roles.get(role)
+        if allowed is None:
+            assoc_type = self.dbdata.roles[role]
+            if assoc_type[0] == "<": assoc_type = assoc_type[1:]
+            allowed = not (
+                (not self.use_notes and assoc_type == "note") or
+                (not self.use_associations and assoc_type.startswith("assoc:"))
+            )
+            self.allowed_roles[role] = allowed
+        return allowed
+
+    def allowed(self, i, role, j):
+        "Apply the link type filters to the link from node i to node j"
+        nodes = self.dbdata.nodes
+        if not self.use_events and nodes[i][0] == 'Event': return False
+        if not self.use_events and nodes[j][0] == 'Event': return False
+        if not self.allowed_role(role): return False
+        return i != j
+
     def generate_paths1(self, person1handle, person2handle, maxpaths, throttle):
-        total_relations_found = 0
-        #print("generate_paths", person1handle, person2handle)
-        #throttle = False
-
-        visited = set()
-        link = Link("self", (None,None), ('Person', person1handle))
-        link.counter = 0
-        queue = [[link]]
-        counter1 = 0
-        counter2 = 0
-        import time
-        #time.sleep(10)
-        while queue and self.server.running:
-            counter1 += 1
-            #if counter1 > 500000: break
-            if DEBUG:
-                print("queue:")
-                pprint(self.queue)
-            current_path = queue.pop(0)
-            lastlink = current_path[-1]
-            (current_type, current_handle) = lastlink.to_node
-            if DEBUG and counter1 < 200:
-                print(counter1,"got",self.getname(current_type, current_handle),lastlink.counter)
-            if current_handle == person2handle:
-                total_relations_found += 1
-                #print("---> yield",counter1, current_path)
-                yield current_path
-                if total_relations_found >= maxpaths:
-                    break                   
-            if current_type == 'Person' and current_handle in visited:
-            #if current_handle in visited:
-                if DEBUG and counter1 < 200:
-                    print("- skipped: ", counter1, self.getname(current_type, current_handle))
-                continue
-            visited.add(current_handle)
-            #if len(current_path) > 24: continue
-            for link in self.dbdata.xref[(current_type,current_handle)]:
-                counter2 += 1
-                if DEBUG: 
-                    print(">> path:", link )
-                if not self.use_events and link.from_node[0] == 'Event': continue
-                if not self.use_events and link.to_node[0] == 'Event': continue
-                if not self.use_notes and link.assoc_type in ("note","<note"): continue
-                if (not self.use_associations and (
-                    link.assoc_type.startswith("assoc:") or
-                    link.assoc_type.startswith("<assoc:"))
-                ):
-                    continue
-
-                if DEBUG and counter1 < 200:
-                    print("- link: ", counter1, self.getname(*link.to_node))
-                if self.contains( current_path, link.to_node[1]): 
-                    if DEBUG and counter1 < 200:
-                        print("- skipped2: ", counter1, self.getname(*link.to_node))
-                    continue
-
-                if link.to_node[1] != current_handle and link.to_node[1] != link.from_node[1]:
-                    link.counter = counter1
-                    queue.append( current_path + [link] )
-                    #queue.sort(key=lambda links: links[0].sortkey)
-                    
-                    
-        
+        """
+        Bidirectional breadth-first search from both people, expanded one
+        level at a time, always the side with the smaller frontier. Each
+        search remembers all links through which a node was reached at its
+        first depth, so the predecessors form a DAG, not a tree.
+
+        Every link between a node reached from person 1 and a node reached
+        from person 2 gives paths: each route to the first node combined with
+        each route from the second. A path is accepted if it is simple and
+        not found already. The search stops when there are maxpaths accepted
+        paths that are not longer than any path not found yet. The paths are
+        yielded shortest first.
+        """
+        dbdata = self.dbdata
+        if person1handle == person2handle:
+            yield [Link("self", (None,None), ('Person', person1handle))]
+            return
+        start = dbdata.node_ids.get(('Person', person1handle))
+        goal = dbdata.node_ids.get(('Person', person2handle))
+        if start is None or goal is None:
+            return
+        # the nodes and roles are numbers, see DBData
+        # node -> (distance from start, [(previous node, role of the link previous -> node)])
+        forward = {start: (0, [])}
+        # node -> (distance to goal, [(next node, role of the link node -> next)])
+        backward = {goal: (0, [])}
+        forward_level = deque([start])
+        backward_level = deque([goal])
+        forward_depth = 0
+        backward_depth = 0
+        meetings = set() # (node1, role, node2) already checked
+        accepted = [] # (length, counter, links)
+        seen = set() # nodes of the accepted paths
+
+        def meet(node1, role, node2):
+            key = (node1, role, node2)
+            if key in meetings: return
+            meetings.add(key)
+            # all paths through this link have the same length, so more than
+            # maxpaths of them are never needed
+            count = 0
+            for before in self.forward_routes(forward, node1):
+                for after in self.backward_routes(backward, node2):
+                    links = before + [(node1, role, node2)] + after
+                    nodes = tuple([start] + [link[2] for link in links])
+                    if len(set(nodes)) < len(nodes): continue # not a simple path
+                    if nodes in seen: continue
+                    seen.add(nodes)
+                    accepted.append((len(links), len(accepted), links))
+                    count += 1
+                    if count >= maxpaths: return
+
+        def add(tree, node, depth, other, role):
+            entry = tree.get(node)
+            if entry is None:
+                tree[node] = (depth, [(other, role)])
+                return True
+            if entry[0] == depth and (other, role) not in entry[1]:
+                entry[1].append((other, role)) # another route at the same depth
+            return False
+
+        cancelled = self.cancelled
+        while forward_level and backward_level and not cancelled.is_set():
+            if len(forward_level) <= len(backward_level):
+                next_level = deque()
+                for node in forward_level:
+                    if cancelled.is_set(): break
+                    for to_node, role in dbdata.links(node):
+                        if not self.allowed(node, role, to_node): continue
+                        if add(forward, to_node, forward_depth + 1, node, role):
+                            next_level.append(to_node)
+                        if to_node in backward:
+                            meet(node, role, to_node)
+                forward_level = next_level
+                forward_depth += 1
+            else:
+                next_level = deque()
+                for node in backward_level:
+                    if cancelled.is_set(): break
+                    for from_node, role in dbdata.links(node):
+                        if not self.allowed(node, role, from_node): continue
+                        role = dbdata.reverse_role(role)
+                        if add(backward, from_node, backward_depth + 1, node, role):
+                            next_level.append(from_node)
+                        if from_node in forward:
+                            meet(from_node, role, node)
+                backward_level = next_level
+                backward_depth += 1
+            # paths not found yet are longer than this
+            bound = forward_depth + backward_depth + 1
+            if sum(1 for m in accepted if m[0] <= bound) >= maxpaths:
+                break
+
+        if cancelled.is_set():
+            return
+        for length, _, links in sorted(accepted, key=lambda m: m[:2])[:maxpaths]:
+            yield self.make_path(start, links)
+
+    def forward_routes(self, forward, node):
+        "Yields the routes from the start to the node as lists of (node, role, next node)"
+        _, previous = forward[node]
+        if not previous:
+            yield []
+            return
+        for prev, role in previous:
+            for route in self.forward_routes(forward, prev):
+                yield route + [(prev, role, node)]
+
+    def backward_routes(self, backward, node):
+        "Yields the routes from the node to the goal as lists of (node, role, next node)"
+        _, following = backward[node]
+        if not following:
+            yield []
+            return
+        for next, role in following:
+            for route in self.backward_routes(backward, next):
+                yield [(node, role, next)] + route
+
+    def make_path(self, start, links):
+        """
+        Returns the path as Link objects. Only the links of the returned
+        paths are created as Link objects.
+        """
+        dbdata = self.dbdata
+        path = [Link("self", (None,None), dbdata.nodes[start])]
+        for node1, role, node2 in links:
+            path.append(dbdata.make_link(node1, role, node2))
+        return path
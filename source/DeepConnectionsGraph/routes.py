@@ -1,7 +1,9 @@
+import concurrent.futures
 import json
 import os
 from pprint import pprint
 import subprocess
+import tempfile
 import time
 
 from gramps.gen.display.name import displayer as name_displayer
@@ -9,10 +11,11 @@ from gramps.gen.display.name import displayer as name_displayer
 map = {}
 
 # these global variables are injected into this module:
-# - request
-# - dbdata
 # - basedir
 # - server
+#
+# Each function gets the Request object of its own request (path, args,
+# dbdata, cancelled). The requests are handled in separate threads.
 
 import connections
 import importlib
@@ -34,20 +37,21 @@ class Response:
         self.content_type = content_type
         
 @app("/")
-def index():
+def index(request):
     dirname, fname = os.path.split(__file__)
     index_fname = os.path.join(dirname,"index.html")
     return open(index_fname).read()
 
 @app("/get_dbname")
-def get_dbname():
-    return json.dumps({"dbname":dbdata.dbname})
+def get_dbname(request):
+    return json.dumps({"dbname":request.dbdata.dbname})
 
 @app("/list_persons")
-def list_persons():
+def list_persons(request):
+    dbdata = request.dbdata
     rsp = []
     t1 = time.time()
-    for person_handle,(name,years) in dbdata.names.items():
+    for person_handle,(name,years) in list(dbdata.names.items()): # may be updated while we run
         name = "{name} {years}".format(name=name,years=years)
         rsp.append(dict(
             gramps_id="person.gramps_id",
@@ -58,7 +62,7 @@ def list_persons():
     return json.dumps(rsp)
 
 @app("/get_person")
-def get_person():
+def get_person(request):
     person_handle = request.args['handle'][0]
     include = request.args.get('include',[])
     person = dbstate.db.get_person_from_handle(person_handle)
@@ -84,7 +88,7 @@ def get_person():
     return json.dumps(rsp)
 
 @app("/get_family")
-def get_family():
+def get_family(request):
     family_handle = request.args['handle'][0]
     include = request.args.get('include',[])
     family = dbstate.db.get_family_from_handle(family_handle)
@@ -97,7 +101,7 @@ def get_family():
     return json.dumps(rsp)
 
 @app("/get_connections") # ?handle1=...&handle2=...&use_relatives=true&...
-def get_connections():
+def get_connections(request):
     def bool(s):
         return s == "true"
         
@@ -112,8 +116,12 @@ def get_connections():
     use_places = bool(request.args["use_places"][0])
     maxpaths = int(request.args["max"][0])
     throttle = bool(request.args["throttle"][0])
-    c = connections.VeryDeepConnections(server, dbdata, use_relatives, use_events, use_notes, use_associations, use_places)
-    paths = list(c.generate_paths(handle1, handle2, maxpaths, throttle))
+    c = connections.VeryDeepConnections(request.cancelled, request.dbdata, use_relatives, use_events, use_notes, use_associations, use_places)
+    def search():
+        return list(c.generate_paths(handle1, handle2, maxpaths, throttle))
+    paths = wait(request, server.search_pool.submit(search))
+    if paths is None:
+        return Response(status=503)
     paths = connections.fix_paths(paths)
     rsp = {
         "paths":paths, 
@@ -122,39 +130,54 @@ def get_connections():
         "refresh_needed": server.refresh_needed,
     }
     return json.dumps(rsp, default=connections.Link.default)
+
+def wait(request, future):
+    """
+    Waits for a search running in the search pool. Cancels it and returns
+    None if the browser closes the connection or the server is stopped.
+    """
+    while True:
+        try:
+            return future.result(timeout=0.5)
+        except concurrent.futures.TimeoutError:
+            if request.cancelled.is_set() or request.client_gone():
+                request.cancelled.set()
+                future.cancel()
+                return None
     
 @app("/get_dot")  # ?paths=<paths>
-def get_dot():
+def get_dot(request):
     import time
     #time.sleep(10)
     paths = json.loads(request.args["paths"][0], object_hook=connections.Link.object_hook)
     handle1 = request.args["handle1"][0]
     handle2 = request.args["handle2"][0]
-    lines = connections.generate_graph(dbdata, paths, handle1, handle2)
+    lines = connections.generate_graph(request.dbdata, paths, handle1, handle2)
     dotsrc = "\n".join(lines)
     return dotsrc
 
 @app("/get_image")  # ?paths=<paths>
-def get_image():
+def get_image(request):
     import time
     #time.sleep(10)
     paths = json.loads(request.args["paths"][0], object_hook=connections.Link.object_hook)
     handle1 = request.args["handle1"][0]
     handle2 = request.args["handle2"][0]
-    lines = connections.generate_graph(dbdata, paths, handle1, handle2)
+    lines = connections.generate_graph(request.dbdata, paths, handle1, handle2)
     lines = [line+"\n" for line in lines]
     #print(lines)
     use_tempfiles = True
     if use_tempfiles:
-        utils.removefile("temp.dot")
-        utils.removefile("temp.png")
-        open("temp.dot","w").writelines(lines)
-        # -Goverlap=true -Gsplines=true
-        p = subprocess.Popen("dot  -Gcenter=true -T png temp.dot -o temp.png", shell=True)
-        p.wait()
-        stdout_data = open("temp.png","rb").read()
-        #utils.removefile("temp.dot")
-        #utils.removefile("temp.png")
+        with tempfile.TemporaryDirectory() as tmpdir: # other requests may run at the same time
+            dotfile = os.path.join(tmpdir, "temp.dot")
+            pngfile = os.path.join(tmpdir, "temp.png")
+            with open(dotfile,"w") as f:
+                f.writelines(lines)
+            # -Goverlap=true -Gsplines=true
+            p = subprocess.Popen(["dot", "-Gcenter=true", "-T", "png", dotfile, "-o", pngfile])
+            p.wait()
+            with open(pngfile,"rb") as f:
+                stdout_data = f.read()
     else:
         p = subprocess.Popen("dot -Goverlap=scale -T png", shell=True, 
             stdin=subprocess.PIPE, stdout=subprocess.PIPE)
@@ -163,29 +186,30 @@ def get_image():
     
     
 @app("/get_svg")  # ?paths=<paths>
-def get_svg():
+def get_svg(request):
     import time
     #time.sleep(10)
     paths = json.loads(request.args["paths"][0], object_hook=connections.Link.object_hook)
     handle1 = request.args["handle1"][0]
     handle2 = request.args["handle2"][0]
-    lines = connections.generate_graph(dbdata, paths, handle1, handle2)
+    lines = connections.generate_graph(request.dbdata, paths, handle1, handle2)
     lines = [line+"\n" for line in lines]
     #print(lines)
     use_tempfiles = True
     if use_tempfiles:
-        utils.removefile("temp.dot")
-        utils.removefile("temp.png")
-        open("temp.dot","w").writelines(lines)
-        # -Goverlap=true -Gsplines=true
-        p = subprocess.Popen("dot  -Gcenter=true -T svg temp.dot -o temp.svg", shell=True)
-        p.wait()
-        #stdout_data = open("temp.svg","r", encoding="iso8859-1").read()
-        stdout_data = open("temp.svg","r").read()
+        with tempfile.TemporaryDirectory() as tmpdir: # other requests may run at the same time
+            dotfile = os.path.join(tmpdir, "temp.dot")
+            svgfile = os.path.join(tmpdir, "temp.svg")
+            with open(dotfile,"w") as f:
+                f.writelines(lines)
+            # -Goverlap=true -Gsplines=true
+            p = subprocess.Popen(["dot", "-Gcenter=true", "-T", "svg", dotfile, "-o", svgfile])
+            p.wait()
+            #stdout_data = open(svgfile,"r", encoding="iso8859-1").read()
+            with open(svgfile,"r") as f:
+                stdout_data = f.read()
         i = stdout_data.find("<svg")
         stdout_data = stdout_data[i:].encode("utf-8")
-        #utils.removefile("temp.dot")
-        #utils.removefile("temp.png")
     else:
         p = subprocess.Popen("dot -Goverlap=scale -T svg", shell=True, 
             stdin=subprocess.PIPE, stdout=subprocess.PIPE)
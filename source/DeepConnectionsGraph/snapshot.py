@@ -0,0 +1,271 @@
+"""
+Saves the data built by connections.load_dbdata in a snapshot file so that the
+next start does not need to read the whole family tree.
+
+A snapshot is used only if it was saved from the same database with the same
+contents: the key contains the database id and, for each object type the
+links come from, the number of objects and the latest change time. These are
+read with one SQL query per table; for databases where that is not possible
+no snapshot is used.
+
+Each save writes a new file, named by the time, and removes the older ones,
+so a file that is still memory mapped is never overwritten.
+
+File layout: MAGIC, header length (4 bytes, little endian), header (JSON) and
+then the sections, each starting at a multiple of 8 bytes. The nodes are
+numbered 0...n-1 and the header tells where each section is:
+
+    handles     the handles of the nodes separated by newlines
+    types       array('b'): index of the node type in header["types"]
+    offsets     array('i'): the links of node i are offsets[i]...offsets[i+1]-1
+    targets     array('i'): the node each link points to
+    roles       array('i'): index of the link's assoc_type in header["roles"]
+    names       marshal: (names, family_names, events)
+
+The file is memory mapped when it is read and the arrays are used from it
+as such, see connections.DBData.
+"""
+
+#------------------------------------------------------------------------
+#
+# Python modules
+#
+#------------------------------------------------------------------------
+from array import array
+import json
+import marshal
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+import traceback
+
+#------------------------------------------------------------------------
+#
+# GRAMPS modules
+#
+#------------------------------------------------------------------------
+from gramps.gen.display.name import displayer as name_displayer
+try:
+    from gramps.gen.const import USER_CACHE
+except ImportError:
+    from gramps.gen.const import USER_PLUGINS as USER_CACHE
+
+import connections
+
+SNAPSHOT_DIR = os.path.join(USER_CACHE, "DeepConnectionsGraph")
+MAGIC = b"DCG\x01"
+VERSION = 1
+
+# tables whose objects can add links or names; the gramplet updates the data
+# on the signals of all of them, so data that has been kept up to date matches
+# the key computed when it is saved
+TABLES = ('person', 'family', 'event', 'note')
+
+def get_prefix(db):
+    "The snapshot files of the database are <prefix>-<time>.snapshot"
+    dbid = db.get_dbid() if hasattr(db, "get_dbid") else db.get_dbname()
+    return re.sub(r"[^\w.-]", "_", str(dbid))
+
+def list_files(db):
+    "Returns the snapshot files of the database, newest first"
+    prefix = get_prefix(db) + "-"
+    try:
+        names = os.listdir(SNAPSHOT_DIR)
+    except OSError:
+        return []
+    names = [name for name in names if name.startswith(prefix) and name.endswith(".snapshot")]
+    return [os.path.join(SNAPSHOT_DIR, name) for name in sorted(names, reverse=True)]
+
+def new_filename(db):
+    return os.path.join(SNAPSHOT_DIR, "{}-{:020d}.snapshot".format(get_prefix(db), time.time_ns()))
+
+def table_stamp(db, table):
+    "Returns [number of objects, latest change time], or None if the database cannot tell"
+    if not hasattr(db, "dbapi"):
+        return None
+    serializer = getattr(db, "serializer", None)
+    if getattr(serializer, "data_field", None) == "json_data":
+        change = "json_extract(json_data, '$.change')"
+    else:
+        change = "change" # a secondary column in the SQL databases of Gramps 5.1 and 5.2
+    try:
+        db.dbapi.execute("SELECT COUNT(*), MAX({}) FROM {}".format(change, table))
+        count, change = db.dbapi.fetchone()
+    except Exception:
+        return None
+    return [count, change or 0]
+
+def get_key(db):
+    "Identifies the database and its contents, None if snapshots cannot be used"
+    dbid = db.get_dbid() if hasattr(db, "get_dbid") else db.get_dbname()
+    key = [VERSION, str(dbid), name_displayer.get_default_format()]
+    for table in TABLES:
+        stamp = table_stamp(db, table)
+        if stamp is None:
+            return None
+        key.append(stamp)
+    return key
+
+def compact(dbdata):
+    "Returns the CSR arrays including the links changed after loading"
+    if not dbdata.changed and len(dbdata.offsets) == len(dbdata.nodes) + 1:
+        return dbdata.offsets, dbdata.targets, dbdata.linkroles
+    offsets = array('i', [0])
+    targets = array('i')
+    linkroles = array('i')
+    for i in range(len(dbdata.nodes)):
+        for target, role in dbdata.links(i):
+            targets.append(target)
+            linkroles.append(role)
+        offsets.append(len(targets))
+    return offsets, targets, linkroles
+
+def save(dbdata, filename, key):
+    nodes = list(dbdata.nodes)
+    offsets, targets, linkroles = compact(dbdata)
+    typenames = {} # interned node types -> index
+    types = array('b', [typenames.setdefault(node[0], len(typenames)) for node in nodes])
+    handles = "\n".join(node[1] for node in nodes).encode("utf-8")
+    events = {handle: (str(type), gramps_id, description)
+              for handle, (type, gramps_id, description) in dbdata.events.items()}
+    names = marshal.dumps((dbdata.names, dbdata.family_names, events))
+
+    header = {
+        'version': VERSION,
+        'key': key,
+        'byteorder': sys.byteorder,
+        'itemsize': array('i').itemsize,
+        'types': list(typenames),
+        'roles': list(dbdata.roles),
+        'sections': {},
+    }
+    sections = [
+        ('handles', handles),
+        ('types', types.tobytes()),
+        ('offsets', bytes(offsets)),
+        ('targets', bytes(targets)),
+        ('roles', bytes(linkroles)),
+        ('names', names),
+    ]
+    # the sections start after the header, whose length depends on their positions
+    start = 0
+    while True:
+        pos = start
+        for name, data in sections:
+            header['sections'][name] = [pos, len(data)]
+            pos += (len(data) + 7) // 8 * 8
+        headerdata = json.dumps(header).encode("utf-8")
+        needed = (len(MAGIC) + 4 + len(headerdata) + 7) // 8 * 8
+        if needed <= start: break
+        start = needed
+
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmpname = filename + ".tmp"
+    with open(tmpname, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(headerdata)) + headerdata)
+        for name, data in sections:
+            f.seek(header['sections'][name][0])
+            f.write(data)
+    os.replace(tmpname, filename)
+
+def read(filename, key):
+    "Returns the header and the sections as memoryviews, or None if the snapshot is missing or out of date"
+    try:
+        with open(filename, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if mm[:len(MAGIC)] != MAGIC:
+        return None
+    (headerlen,) = struct.unpack_from("<I", mm, len(MAGIC))
+    start = len(MAGIC) + 4
+    header = json.loads(mm[start:start+headerlen].decode("utf-8"))
+    if (header.get('version') != VERSION or
+        header.get('key') != json.loads(json.dumps(key)) or
+        header.get('byteorder') != sys.byteorder or
+        header.get('itemsize') != array('i').itemsize):
+        return None
+    view = memoryview(mm)
+    sections = {}
+    for name, (pos, length) in header['sections'].items():
+        sections[name] = view[pos:pos+length]
+    for name in ('types', 'offsets', 'targets', 'roles'):
+        sections[name] = sections[name].cast('b' if name == 'types' else 'i')
+    return header, sections
+
+def load(filename, key):
+    "Returns DBData from the snapshot, or None"
+    snapshot = read(filename, key)
+    if snapshot is None:
+        return None
+    header, sections = snapshot
+    nodetypes = header['types']
+    handles = bytes(sections['handles']).decode("utf-8").split("\n")
+    dbdata = connections.DBData()
+    dbdata.nodes = [(nodetypes[t], handle) for t, handle in zip(sections['types'], handles)]
+    dbdata.node_ids = dict(zip(dbdata.nodes, range(len(dbdata.nodes))))
+    dbdata.roles = header['roles']
+    dbdata.role_ids = dict(zip(dbdata.roles, range(len(dbdata.roles))))
+    # the arrays stay in the mapped file
+    dbdata.offsets = sections['offsets']
+    dbdata.targets = sections['targets']
+    dbdata.linkroles = sections['roles']
+    dbdata.names, dbdata.family_names, dbdata.events = marshal.loads(sections['names'])
+    return dbdata
+
+def get_dbdata(dbstate):
+    "Returns the data from the snapshot if the tree has not changed, otherwise from the database"
+    db = dbstate.db
+    if not db.is_open():
+        return connections.load_dbdata(dbstate)
+    key = get_key(db)
+    if key is None:
+        return connections.load_dbdata(dbstate)
+    files = list_files(db)
+    filename = files[0] if files else None
+    try:
+        dbdata = load(filename, key) if filename else None
+    except Exception:
+        traceback.print_exc()
+        dbdata = None
+    if dbdata is not None:
+        dbdata.dbname = db.get_dbname()
+        dbdata.key = key
+        print("loaded dbdata from", filename)
+        return dbdata
+    dbdata = connections.load_dbdata(dbstate)
+    save_dbdata(dbstate, dbdata, key)
+    return dbdata
+
+def save_dbdata(dbstate, dbdata, key=None):
+    """
+    Saves the data for the next start. The data must match the current
+    database: it has been loaded with the given key or updated on every
+    change since.
+    """
+    db = dbstate.db
+    if not db.is_open():
+        return
+    try:
+        if key is None:
+            key = get_key(db)
+            if key is None:
+                return
+            if dbdata.key is not None and key[:3] != dbdata.key[:3]:
+                # another database or name format, the names are out of date
+                return
+        dbdata.key = key
+        filename = new_filename(db)
+        save(dbdata, filename, key)
+        for oldname in list_files(db):
+            if oldname != filename:
+                try:
+                    os.remove(oldname)
+                except OSError:
+                    pass # still mapped (Windows), removed by a later save
+        dbdata.modified = False
+    except Exception:
+        traceback.print_exc()
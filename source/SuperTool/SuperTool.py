@@ -107,6 +107,14 @@ _ = _trans.gettext
 #
 # -------------------------------------------------------------------------
 import supertool_engine as engine
+import supertool_batch
+import supertool_codecache
+import supertool_columns
+import supertool_fetch
+import supertool_incremental
+import supertool_listmodel
+import supertool_parallel
+import supertool_profiler
 import supertool_utils
 from supertool_utils import compile_statements, compile_expression, process_includes
 from supertool_editor import PythonCodeView
@@ -121,6 +129,7 @@ config.register("defaults.last_note", "")
 
 SCRIPTFILE_EXTENSION = ".script"
 STEP_INTERVAL = 100  # call step() only every 100 rows
+BATCH_SIZE = 10000  # rows added to the result list at a time
 
 
 def get_text(textview):
@@ -386,6 +395,27 @@ class CsvFileChooserDialog(Gtk.FileChooserDialog):
         self.add_filter(filter_csv)
 
 
+class JsonFileChooserDialog(Gtk.FileChooserDialog):
+    def __init__(self, uistate):
+        # type: (DisplayState) -> None
+        Gtk.FileChooserDialog.__init__(
+            self,
+            title="Save the profile as a JSON file",
+            transient_for=uistate.window,
+            action=Gtk.FileChooserAction.SAVE,
+        )
+
+        self.add_buttons(
+            _("_Cancel"), Gtk.ResponseType.CANCEL, _("Save"), Gtk.ResponseType.OK
+        )
+        self.set_do_overwrite_confirmation(True)
+
+        filter_json = Gtk.FileFilter()
+        filter_json.set_name("JSON files")
+        filter_json.add_pattern("*.json")
+        self.add_filter(filter_json)
+
+
 class HelpWindow(Gtk.Window):
     def __init__(self, uistate, help_notebook):
         # type: (DisplayState, Gtk.Notenook) -> None
@@ -687,6 +717,7 @@ class Result:
         self.headers = []  # type: List[str]
         self.max = 0
         self.read_limit = 0
+        self.merge_funcs = {}  # type: Dict[str, Callable]
 
     def add_row(
         self,
@@ -734,6 +765,11 @@ class Result:
         self.max = maxcount  # max number of object to display
         self.read_limit = read_limit  # max number of objects to retrieve
 
+    def set_merge(self, **merge_funcs):
+        # type: (Callable) -> None
+        "Set the functions that combine variables in parallel mode"
+        self.merge_funcs.update(merge_funcs)
+
 
 class GrampsEngine:
     def __init__(
@@ -746,8 +782,12 @@ class GrampsEngine:
         step=None,
         env=None,
         raw_values=False,
+        profiler=None,
+        step_interval=STEP_INTERVAL,
+        fetch_size=supertool_fetch.CHUNK_SIZE,
+        storage_order=False,
     ):
-        # type: (DbState, User, supertool_utils.Context, List[str], Query, Callable, Any, bool) -> None
+        # type: (DbState, User, supertool_utils.Context, List[str], Query, Callable, Any, bool, Optional[supertool_profiler.Profiler], int, int, bool) -> None
         self.dbstate = dbstate
         self.db = dbstate.db
         self.user = user
@@ -757,10 +797,22 @@ class GrampsEngine:
         self.total_objects = len(self.selected_handles)
         self.query = query
         self.step = step
+        self.step_interval = step_interval
+        self.fetch_size = fetch_size  # objects read at a time, 0 = one by one
+        # selected_handles come from db.get_person_handles() etc. as such
+        self.storage_order = storage_order
+        self.script_may_write = None  # type: Optional[bool]
         if env is None:
             env = {}
         self.env = env
         self.raw_values = raw_values
+        self.profiler = profiler
+        self.modified_count = 0
+        serializer = getattr(self.db, "serializer", None)
+        if serializer is not None and hasattr(serializer, "object_to_data"):
+            self.serialize = serializer.object_to_data
+        else:
+            self.serialize = lambda obj: obj.serialize()
         self.query.initialize()
 
     def generate_rows(self, res):
@@ -789,24 +841,31 @@ class GrampsEngine:
 
     def evaluate_condition(self, obj, cond, env):
         # type: (Any,str,Dict[str,Any]) -> Tuple[bool, Dict[str,Any]]
-        return self.context.execute_func(self.dbstate, obj, cond, env)
-
-    def generate_values(self, env, result):
-        # type: (Dict[str,Any],Result) -> Iterator[Tuple[Any,Dict[str,Any],List[Any]]]
-        for n, handle in enumerate(self.selected_handles):
+        return self.context.execute_func(self.proxy_dbstate, obj, cond, env)
+
+    def generate_values(self, env, result, handles=None):
+        # type: (Dict[str,Any],Result,Optional[List[str]]) -> Iterator[Tuple[Any,Dict[str,Any],List[Any]]]
+        if handles is None:
+            handles = self.selected_handles
+        objects = self.iter_objects(
+            handles, self.storage_order and handles is self.selected_handles
+        )
+        for n, handle in enumerate(handles):
             if result.read_limit and n >= result.read_limit:
                 return
 
-            if self.step and n % STEP_INTERVAL == 0:
+            if self.step and n % self.step_interval == 0:
                 if self.step():  # user clicked 'Cancel', stop
                     return
 
-            obj = self.context.getfunc(handle)
+            obj = next(objects)
             obj._commit_ok = True
+            if self.query.commit_changes:
+                original = self.serialize(obj)
             try:
                 if self.query.statements_compiled:
                     value, env = self.context.execute_func(
-                        self.dbstate,
+                        self.proxy_dbstate,
                         obj,
                         self.query.statements_compiled,
                         env,
@@ -820,7 +879,11 @@ class GrampsEngine:
                         continue
 
                 if self.query.commit_changes and obj._commit_ok:
-                    self.context.commitfunc(obj, self.trans)
+                    # unchanged objects are not written again
+                    if self.serialize(obj) != original:
+                        self.context.commitfunc(obj, self.trans)
+                        self.cache.invalidate(self.context.objclass, handle)
+                        self.modified_count += 1
 
                 for values in result.fetch_rows():
                     yield None, env, values
@@ -834,7 +897,7 @@ class GrampsEngine:
 
                 if self.query.expressions_compiled:
                     res, env = self.context.execute_func(
-                        self.dbstate,
+                        self.proxy_dbstate,
                         obj,
                         self.query.expressions_compiled,
                         env,
@@ -850,17 +913,47 @@ class GrampsEngine:
                 e.gramps_id = obj.gramps_id  # type: ignore
                 raise e
 
-    def get_values(self, trans, result):
-        # type: (DbTxn, Result) -> Generator
+    def iter_objects(self, handles, storage_order=False):
+        # type: (List[str], bool) -> Iterator[Any]
+        if self.script_may_write is None:
+            self.script_may_write = self.query.commit_changes or (
+                supertool_parallel.may_write(self.query)
+            )
+        if self.script_may_write:
+            # objects read in advance could be changed by the script
+            return map(self.context.getfunc, handles)
+        return supertool_fetch.iter_objects(
+            self.db,
+            self.context,
+            handles,
+            self.fetch_size,
+            self.cache.fetches,
+            storage_order,
+        )
+
+    def make_env(self, trans, result, cache=None):
+        # type: (DbTxn, Result, Optional[engine.ObjectCache]) -> Dict[str,Any]
         self.trans = trans
 
+        # one object cache shared by all proxies created during this run
+        if cache is None:
+            cache = engine.ObjectCache(self.db)
+        self.cache = cache
+        self.proxy_dbstate = SimpleNamespace(db=self.cache)
+        if self.context.objclass:
+            # named filters are applied to all these objects at once
+            engine.Filterfactory.for_db(self.cache).set_candidates(
+                self.context.objclass, self.selected_handles
+            )
+
         self.object_count = 0
+        self.modified_count = 0
         env = supertool_utils.get_globals()  # type: Dict[str,Any]
         env["trans"] = trans
         env["user"] = self.user
         env["uistate"] = self.uistate
         env["dbstate"] = self.dbstate
-        env["db"] = self.db
+        env["db"] = self.cache  # commits through the cache invalidate it
         env["result"] = result
         env["category"] = self.context.category_name
         env["namespace"] = self.context.objclass
@@ -870,10 +963,11 @@ class GrampsEngine:
             )
         )
         env["step"] = self.step
-        env["getproxy"] = functools.partial(supertool_utils.getproxy, self.db)
+        env["getproxy"] = functools.partial(supertool_utils.getproxy, self.cache)
         env["getargs"] = functools.partial(
             supertool_utils.getargs_dialog, self.dbstate, self.uistate, False
         )
+        env["snapshot"] = functools.partial(supertool_columns.snapshot, self.db)
 
         env.update(self.env)
 
@@ -884,24 +978,54 @@ class GrampsEngine:
             else:
                 active_handle = self.uistate.get_active("Person")
             if active_handle:
-                env["active_person"] = engine.PersonProxy(self.db, active_handle)
+                env["active_person"] = self.cache.proxy(
+                    engine.PersonProxy, active_handle
+                )
+        return env
 
+    def run_initial_statements(self, env):
+        # type: (Dict[str,Any]) -> Dict[str,Any]
         if self.query.initial_statements_compiled:
             value, env = self.context.execute_func(
-                self.dbstate, None, self.query.initial_statements_compiled, env, "exec"
+                self.proxy_dbstate, None, self.query.initial_statements_compiled, env, "exec"
             )
-            yield from result.fetch_rows()
+        return env
 
-        for obj, env, values in self.generate_values(env, result):
-            if not self.query.summary_only:
-                # yield from result.fetch_rows()
-                yield values
+    def get_values(self, trans, result, workers=0, incremental=False):
+        # type: (DbTxn, Result, int, bool) -> Generator
+        env = self.make_env(trans, result)
+        if self.profiler:
+            self.profiler.start(self)
+        try:
+            yield from self.generate_all_values(env, result, workers, incremental)
+        finally:
+            if self.profiler:
+                self.profiler.stop()
+
+    def generate_all_values(self, env, result, workers, incremental):
+        # type: (Dict[str,Any], Result, int, bool) -> Generator
+        env = self.run_initial_statements(env)
+        yield from result.fetch_rows()
+
+        if incremental and supertool_incremental.can_run_incremental(self, result):
+            env = yield from supertool_incremental.run_incremental(self, env, result)
+        elif workers > 1 and supertool_parallel.can_run_parallel(self, result):
+            env = yield from supertool_parallel.run_parallel(self, env, result, workers)
+        else:
+            for obj, env, values in self.generate_values(env, result):
+                if not self.query.summary_only:
+                    # yield from result.fetch_rows()
+                    yield values
         # yield from result.fetch_rows()
 
+        yield from self.generate_summary(env, result)
+
+    def generate_summary(self, env, result):
+        # type: (Dict[str,Any], Result) -> Generator
         if self.query.summary_only:
             if self.query.expressions_compiled:
                 res, env = self.context.execute_func(
-                    self.dbstate, None, self.query.expressions_compiled, env
+                    self.proxy_dbstate, None, self.query.expressions_compiled, env
                 )
                 if type(res) != tuple:
                     res = (res,)
@@ -911,6 +1035,90 @@ class GrampsEngine:
                         yield [None] + values + [None, None]
 
 
+class Capturer:
+    LINELIMIT = 1000
+    LIMIT_KB = 100
+    LIMIT = LIMIT_KB * 1000
+
+    def __init__(self):
+        self.data = ""
+        self.size = 0
+        self.overflow = False
+
+    def write(self, data):
+        if self.overflow:
+            return
+        encoded = data.encode("utf-8")
+        numbytes = len(encoded)
+        if self.size + numbytes > Capturer.LIMIT:
+            self.overflow = True
+            return
+        self.data += data
+        self.size += numbytes
+
+
+class LiveProgress:
+    """
+    Keeps the SuperTool window responsive while a read-only query runs.
+
+    The engine calls step() for every object and the rows are passed to
+    add_row(). Every UPDATE_INTERVAL seconds the new rows are added to the
+    result list, the status line is updated and the pending GTK events are
+    processed, so that the 'Stop' button takes effect almost immediately.
+    """
+
+    UPDATE_INTERVAL = 0.05  # seconds
+
+    def __init__(self, tool, total):
+        # type: (SuperTool, int) -> None
+        self.tool = tool
+        self.total = total
+        self.objects = 0
+        self.row_count = 0
+        self.rows = []  # type: List[Any]
+        self.cancelled = False
+        self.t0 = time.perf_counter()
+        self.next_update = self.t0 + self.UPDATE_INTERVAL
+
+    def step(self):
+        # type: () -> bool
+        "Called for every object; returns True if the query should stop"
+        self.objects += 1
+        if time.perf_counter() >= self.next_update:
+            self.update()
+        return self.cancelled
+
+    def add_row(self, values):
+        # type: (List[Any]) -> None
+        self.rows.append(values)
+        self.row_count += 1
+        if time.perf_counter() >= self.next_update:
+            self.update()
+
+    def flush(self):
+        # type: () -> None
+        if self.rows and self.tool.listview:
+            self.tool.store.append_rows(self.rows, notify=True)
+        self.rows = []
+
+    def update(self):
+        # type: () -> None
+        self.flush()
+        elapsed = max(time.perf_counter() - self.t0, 1e-6)
+        self.tool.statusmsg.set_text(
+            "Running... objects: {}/{} ({:.0f}/s); rows: {} ({:.0f}/s)".format(
+                self.objects,
+                self.total,
+                self.objects / elapsed,
+                self.row_count,
+                self.row_count / elapsed,
+            )
+        )
+        while Gtk.events_pending():
+            Gtk.main_iteration_do(False)
+        self.next_update = time.perf_counter() + self.UPDATE_INTERVAL
+
+
 class SuperTool(ManagedWindow):
     def __init__(self, user, dbstate, plugindata):
         # type: (User, DbState, Any) -> None
@@ -934,6 +1142,10 @@ class SuperTool(ManagedWindow):
         self.ignore_changes = True
         self.saved_query = None  # type: Optional[Query]
         self.listview = None  # type: Optional[Gtk.TreeView]
+        self.store = None  # type: Optional[supertool_listmodel.ResultModel]
+        self.live = None  # type: Optional[LiveProgress]
+        self.live_mode = False
+        self.close_pending = False
         #        self.context = None # type: Optional[supertool_utils.Context]
         self.init()
 
@@ -984,8 +1196,11 @@ class SuperTool(ManagedWindow):
     def build_listview(self, values, result):
         # type: (Tuple[Union[int,str,float],...], Result) -> None
         self.listview = Gtk.TreeView()
+        # all rows have the same height so the view need not measure every row
+        self.listview.set_fixed_height_mode(True)
         numcols = len(values)
         renderer = Gtk.CellRendererText()
+        charwidth = self.listview.create_pango_layout("0").get_pixel_size()[0]
 
         coltypes = (
             result.get_coltypes()
@@ -1013,16 +1228,35 @@ class SuperTool(ManagedWindow):
             col = Gtk.TreeViewColumn(title, renderer, text=colnum)
             col.set_clickable(True)
             col.set_resizable(True)
-            col.set_sort_column_id(colnum)
+            # fixed height mode requires fixed width columns; the width is
+            # estimated from the title and the first row
+            chars = max(len(title), len(str(values[colnum])))
+            col.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+            col.set_fixed_width(min(max(chars, 6), 40) * charwidth + 16)
+            col.connect("clicked", self.sort_listview, colnum)
             self.listview.append_column(col)
 
         self.output_window.add(self.listview)
 
-        self.store = Gtk.ListStore(*coltypes)
-        self.listview.set_model(self.store)
+        # the model is attached to the view when all rows have been added
+        self.store = supertool_listmodel.ResultModel(coltypes)
         self.listview.connect("button-press-event", self.button_press)
         self.listview.show()
 
+    def sort_listview(self, col, colnum):
+        # type: (Gtk.TreeViewColumn, int) -> None
+        descending = (
+            self.store.sort_column == colnum and not self.store.descending
+        )
+        self.listview.set_model(None)
+        self.store.sort(colnum, descending)
+        self.listview.set_model(self.store)
+        for c in self.listview.get_columns():
+            c.set_sort_indicator(c is col)
+        col.set_sort_order(
+            Gtk.SortType.DESCENDING if descending else Gtk.SortType.ASCENDING
+        )
+
     def button_press(self, treeview, event):
         # type: (Gtk.TreeView, Gtk.Event) -> bool
         if not self.dbstate.is_open():
@@ -1093,6 +1327,7 @@ class SuperTool(ManagedWindow):
         self.commit_checkbox.set_active(False)
         self.summary_checkbox.set_active(False)
         self.capture_checkbox.set_active(False)
+        self.profile_checkbox.set_active(False)
         self.query = Query()
         if self.desc_win:
             self.desc_win.destroy()
@@ -1100,9 +1335,15 @@ class SuperTool(ManagedWindow):
         self.window.set_title("SuperTool")
 
     def close(self, *args):
-        # type: (Any) -> None
+        # type: (Any) -> Optional[bool]
+        if self.live:
+            # stop the running query first, execute() will close the window
+            self.live.cancelled = True
+            self.close_pending = True
+            return True
         self.exit(None)
         super().close(*args)
+        return None
 
     def content_changed(self, _widget):
         # type: (Gtk.Widget) -> None
@@ -1121,7 +1362,7 @@ class SuperTool(ManagedWindow):
 
         stringio = io.StringIO()
         writer = csv.writer(stringio)
-        for row in self.store:
+        for row in self.store.iter_rows():
             writer.writerow(row)
         clipboard.set_text(stringio.getvalue(), -1)
         OkDialog("Info", "Result list copied to clipboard")
@@ -1147,10 +1388,12 @@ class SuperTool(ManagedWindow):
         self.commit_checkbox = glade.get_child_object("commit_checkbox")
         self.summary_checkbox = glade.get_child_object("summary_checkbox")
         self.capture_checkbox = glade.get_child_object("capture_checkbox")
+        self.profile_checkbox = glade.get_child_object("profile_checkbox")
 
         self.btn_execute = glade.get_child_object("btn_execute")
         self.btn_csv = glade.get_child_object("btn_csv")
         self.btn_copy = glade.get_child_object("btn_copy")
+        self.btn_profile = glade.get_child_object("btn_profile")
 
         self.attributes_list = glade.get_child_object("attributes_list")
 
@@ -1170,11 +1413,15 @@ class SuperTool(ManagedWindow):
         self.output_notebook = glade.get_object("output_notebook")
         self.print_output = glade.get_object("print_output")  # TextView
         self.print_output_buffer = self.print_output.get_buffer()
+        self.profile_output = glade.get_object("profile_output")  # TextView
+        self.profile_output_buffer = self.profile_output.get_buffer()
+        self.profiler = None  # type: Optional[supertool_profiler.Profiler]
 
         self.selected_objects.set_active(True)
         self.btn_execute.connect("clicked", self.execute)
         self.btn_csv.connect("clicked", self.download)
         self.btn_copy.connect("clicked", self.copy)
+        self.btn_profile.connect("clicked", self.save_profile)
 
         glade.connect_signals(
             {
@@ -1357,8 +1604,11 @@ class SuperTool(ManagedWindow):
 
     def db_closed(self):
         # type: () -> None
+        if self.live:
+            self.live.cancelled = True
         if self.listview:
             self.output_window.remove(self.listview)
+            self.store.close()
         self.listview = None
         self.btn_execute.set_sensitive(False)
         self.statusmsg.set_text("Database closed")
@@ -1408,7 +1658,7 @@ class SuperTool(ManagedWindow):
                         open(self.csv_filename, "w", encoding=encoding, newline=""),
                         delimiter=delimiter,
                     )
-                    for row in self.store:
+                    for row in self.store.iter_rows():
                         writer.writerow(row)
                 except Exception as e:
                     msg = traceback.format_exc()
@@ -1418,12 +1668,30 @@ class SuperTool(ManagedWindow):
 
         choose_file_dialog.destroy()
 
+    def save_profile(self, _widget):
+        # type: (Gtk.Widget) -> None
+        choose_file_dialog = JsonFileChooserDialog(self.uistate)
+        choose_file_dialog.set_current_name("profile.json")
+        response = choose_file_dialog.run()
+        if response == Gtk.ResponseType.OK:
+            try:
+                self.profiler.save_json(choose_file_dialog.get_filename())
+            except Exception as e:
+                msg = traceback.format_exc()
+                ErrorDialog("Saving the file failed", msg)
+        choose_file_dialog.destroy()
+
     def execute(self, _widget):
         # type: (Gtk.Widget) -> None
+        if self.live:
+            # the button is 'Stop' while a query is running
+            self.live.cancelled = True
+            return
         self.statusmsg.set_text("")
         self.output_notebook.hide()
         self.btn_csv.hide()
         self.btn_copy.hide()
+        self.btn_profile.hide()
         self.trans = None
         if not self.uistate.viewmanager.active_page:
             return
@@ -1433,27 +1701,6 @@ class SuperTool(ManagedWindow):
         else:
             query.dirname = None
 
-        class Capturer:
-            LINELIMIT = 1000
-            LIMIT_KB = 100
-            LIMIT = LIMIT_KB * 1000
-
-            def __init__(self):
-                self.data = ""
-                self.size = 0
-                self.overflow = False
-
-            def write(self, data):
-                if self.overflow:
-                    return
-                encoded = data.encode("utf-8")
-                numbytes = len(encoded)
-                if self.size + numbytes > Capturer.LIMIT:
-                    self.overflow = True
-                    return
-                self.data += data
-                self.size += numbytes
-
         if query.dirname:
             sys.path.insert(0, query.dirname)
         try:
@@ -1463,17 +1710,18 @@ class SuperTool(ManagedWindow):
                 txtitle += " ({})".format(self.title.get_text())
 
             self.set_error("")
-            with DbTxn(txtitle, self.dbstate.db) as self.trans:
-                self.print_output_buffer.set_text("")
-                if self.capture_checkbox.get_active():
-                    self.output = Capturer()  # self.print_output_buffer)
-                    with redirect_stdout(
-                        self.output
-                    ):  # , redirect_stderr(self.output):
-                        self.execute1(query)
-                else:
-                    self.execute1(query)
-                # profile(self.__execute1, query)
+            query.initialize()
+            # read-only queries run without a transaction and keep the
+            # window responsive (see LiveProgress)
+            self.live_mode = not (
+                self.commit_changes or supertool_parallel.may_write(query)
+            )
+            if self.live_mode:
+                self.execute_with_capture(query)
+            else:
+                with DbTxn(txtitle, self.dbstate.db) as self.trans:
+                    self.execute_with_capture(query)
+                    # profile(self.__execute1, query)
         except Exception as e:
             traceback.print_exc()
             if isinstance(e, engine.SupertoolException):
@@ -1544,6 +1792,19 @@ class SuperTool(ManagedWindow):
                     size += numbytes
                     self.print_output_buffer.insert_at_cursor(line, numbytes)
             self.output_notebook.show()
+            if self.close_pending:
+                self.close_pending = False
+                self.close()
+
+    def execute_with_capture(self, query):
+        # type: (Query) -> None
+        self.print_output_buffer.set_text("")
+        if self.capture_checkbox.get_active():
+            self.output = Capturer()  # self.print_output_buffer)
+            with redirect_stdout(self.output):  # , redirect_stderr(self.output):
+                self.execute1(query)
+        else:
+            self.execute1(query)
 
     def execute1(self, query):
         # type: (Query) -> None
@@ -1560,11 +1821,13 @@ class SuperTool(ManagedWindow):
 
         if self.listview:
             self.output_window.remove(self.listview)
+            self.store.close()
         self.listview = None
         n = 0
 
         if TYPE_CHECKING:
             selected_handles: List[str]
+        storage_order = False
         if self.context.objclass:
             if self.selected_objects.get_active():
                 selected_handles = (
@@ -1572,6 +1835,7 @@ class SuperTool(ManagedWindow):
                 )
             elif self.all_objects.get_active():
                 selected_handles = self.context.get_all_objects_func()
+                storage_order = True
             elif self.filtered_objects.get_active():
                 selected_handles = []  # ???
                 store = self.uistate.viewmanager.active_page.model
@@ -1585,11 +1849,21 @@ class SuperTool(ManagedWindow):
             selected_handles = []
 
         result = Result()
-
-        count = len(selected_handles) // STEP_INTERVAL
-        with self.progress(
-            "SuperTool", "Executing " + self.title.get_text(), count
-        ) as step:
+        self.profiler = None
+        self.profile_output_buffer.set_text("")
+        if self.profile_checkbox.get_active():
+            self.profiler = supertool_profiler.Profiler()
+
+        if not self.live_mode:
+            count = len(selected_handles) // STEP_INTERVAL
+            progress = self.progress(
+                "SuperTool", "Executing " + self.title.get_text(), count
+            )
+            step_interval = STEP_INTERVAL
+        else:
+            progress = self.live_progress(len(selected_handles))
+            step_interval = 1  # LiveProgress decides when to update the window
+        with progress as step:
             gramps_engine = GrampsEngine(
                 self.dbstate,
                 self.user,
@@ -1600,23 +1874,54 @@ class SuperTool(ManagedWindow):
                 env={
                     "supertool_window": self.window,
                 },
-                
+                profiler=self.profiler,
+                step_interval=step_interval,
+                storage_order=storage_order,
             )
+            live = self.live
+            cancelled = False
+            batch = []  # type: List[Tuple[Union[int,str,float],...]]
             for values in gramps_engine.get_values(self.trans, result):
                 if not self.listview:
                     # can build this only after the column types are known
                     # (we assume the types are the same for all rows)
                     self.build_listview(values, result)
+                    if live:
+                        # rows are shown as they arrive
+                        self.listview.set_model(self.store)
 
-                self.store.append(values)
                 n += 1
+                if live:
+                    live.add_row(values)
+                    continue
+                batch.append(values)
+                if len(batch) >= BATCH_SIZE:
+                    self.store.append_rows(batch)
+                    batch = []
+            if live:
+                live.flush()
+                cancelled = live.cancelled
+            elif self.listview:
+                self.store.append_rows(batch)
+                self.listview.set_model(self.store)
         t2 = time.time()
 
-        msg = "Objects: {}/{}; rows: {} ({:.2f}s)".format(
-            gramps_engine.object_count, gramps_engine.total_objects, n, t2 - t1
+        msg = "Objects: {}/{}; rows: {} ({:.2f}s); {}".format(
+            gramps_engine.object_count,
+            gramps_engine.total_objects,
+            n,
+            t2 - t1,
+            gramps_engine.cache,
         )
+        if query.commit_changes:
+            msg += "; modified: {}".format(gramps_engine.modified_count)
+        if cancelled:
+            msg = "Cancelled. " + msg
         # print(msg)
         self.statusmsg.set_text(msg)
+        if self.profiler:
+            self.profile_output_buffer.set_text(self.profiler.format_report())
+            self.btn_profile.show()
         if n > 0:
             self.btn_csv.show()
             self.btn_copy.show()
@@ -1626,6 +1931,9 @@ class SuperTool(ManagedWindow):
 
     def exit(self, _widget):
         # type: (Gtk.WIdget) -> None
+        if self.live:
+            self.close()
+            return
         self.saveconfig()
 
         self.dbstate.disconnect(self.database_changed_key)
@@ -1977,6 +2285,17 @@ class SuperTool(ManagedWindow):
             self.desc_win.destroy()
             self.desc_win = None
 
+    @contextmanager
+    def live_progress(self, total):
+        # type: (int) -> Iterator[Callable]
+        self.live = LiveProgress(self, total)
+        self.btn_execute.set_label("Stop")
+        try:
+            yield self.live.step
+        finally:
+            self.live = None
+            self.btn_execute.set_label("Execute")
+
     @contextmanager
     def progress(self, title1, title2, count):
         # type: (str, str, int) -> Iterator[Callable]
@@ -2232,7 +2551,7 @@ class Tool(tool.Tool):
             print()
             print("SuperTool v" + pd.version)
             do_profile = self.options.handler.options_dict.get("profile")
-            if do_profile:
+            if do_profile == 1:
                 profile(self.run_cli)
             else:
                 self.run_cli()
@@ -2246,6 +2565,22 @@ class Tool(tool.Tool):
 
     def run_cli(self):
         # type: () -> None
+        if self.options.handler.options_dict.get("codecache"):
+            supertool_codecache.persistent = True
+        batch = self.options.handler.options_dict.get("batch")
+        if batch:
+            if not os.path.exists(batch):
+                print("Batch directory or manifest '{}' does not exist".format(batch))
+                return
+            supertool_batch.run_batch(
+                self.dbstate,
+                self.user,
+                batch,
+                output_dir=self.options.handler.options_dict.get("output") or "",
+                format=self.options.handler.options_dict.get("format") or "csv",
+                args=self.options.handler.options_dict["args"],
+            )
+            return
         script_filename = self.options.handler.options_dict["script"]
         if not script_filename:
             print("No script_filename")
@@ -2293,22 +2628,46 @@ class Tool(tool.Tool):
                 "category": category_name,
                 "namespace": context.objclass,
             },
+            storage_order=True,
         )
+        workers = int(self.options.handler.options_dict.get("workers") or 0)
+        incremental = bool(self.options.handler.options_dict.get("incremental"))
+        profile_json = self.options.handler.options_dict.get("profile_json")
+        if self.options.handler.options_dict.get("profile") == 2 or profile_json:
+            gramps_engine.profiler = supertool_profiler.Profiler()
         result = Result()
         if output_filename:
-            f = csv.writer(open(output_filename, open_mode, encoding="utf-8"))
-        with DbTxn("Generating values", self.db) as trans:
-            for values in gramps_engine.get_values(trans, result):
-                if output_filename:
-                    f.writerow(values)
-                else:
-                    print(json.dumps(values))
+            # rows are written as they are generated, never kept in memory
+            sink = supertool_utils.RowSink(output_filename, open_mode)
+        else:
+            sink = lambda values: print(json.dumps(values), flush=True)
+        try:
+            with DbTxn("Generating values", self.db) as trans:
+                for values in gramps_engine.get_values(
+                    trans, result, workers, incremental
+                ):
+                    sink(values)
+        finally:
+            if output_filename:
+                sink.close()
         t2 = time.time()
 
-        msg = "Objects: {}/{} ({:.2f}s)".format(
-            gramps_engine.object_count, gramps_engine.total_objects, t2 - t1
+        msg = "Objects: {}/{} ({:.2f}s); {}".format(
+            gramps_engine.object_count,
+            gramps_engine.total_objects,
+            t2 - t1,
+            gramps_engine.cache,
         )
+        if query.commit_changes:
+            msg += "; modified: {}".format(gramps_engine.modified_count)
         print(msg)
+        if incremental and hasattr(gramps_engine, "evaluated_count"):
+            print("Objects evaluated:", gramps_engine.evaluated_count)
+        if gramps_engine.profiler:
+            print()
+            print(gramps_engine.profiler.format_report())
+            if profile_json:
+                gramps_engine.profiler.save_json(profile_json)
 
     def run(self, plugindata):
         # type: (Any) -> None
@@ -2336,6 +2695,12 @@ class Options(tool.ToolOptions):
             category="",
             args="",
             profile=0,
+            profile_json="",
+            workers=0,
+            incremental=0,
+            batch="",
+            format="csv",
+            codecache=0,
         )
         self.options_help = dict(
             script=(
@@ -2343,7 +2708,11 @@ class Options(tool.ToolOptions):
                 "Script file name",
                 "A {} file name".format(SCRIPTFILE_EXTENSION),
             ),
-            output=("=str", "Output CSV file name (optional)", "a CSV file name"),
+            output=(
+                "=str",
+                "Output CSV or JSON lines (.jsonl) file name (optional)",
+                "a CSV file name",
+            ),
             category=(
                 "=str",
                 "Object category (optional)",
@@ -2361,9 +2730,48 @@ class Options(tool.ToolOptions):
             ),
             args=("=str", "Any string argument", "string"),
             profile=(
-                "=0/1",
+                "=0/1/2",
                 "Display profiling information after execution",
-                ["0 - do not use profiling", "1 - use profiling"],
+                [
+                    "0 - do not use profiling",
+                    "1 - use the Python profiler",
+                    "2 - use the SuperTool script profiler",
+                ],
+                False,
+            ),
+            profile_json=(
+                "=str",
+                "Save the SuperTool script profile in a JSON file (optional)",
+                "a JSON file name",
+            ),
+            workers=(
+                "=num",
+                "Number of worker processes for read-only scripts (optional)",
+                "0 or 1 - no parallel processing",
+                False,
+            ),
+            incremental=(
+                "=0/1",
+                "Process only the objects changed since the previous run",
+                ["0 - process all objects", "1 - reuse the previous results"],
+                False,
+            ),
+            batch=(
+                "=str",
+                "Run all scripts in a directory or listed in a manifest file; "
+                "'output' is then the output directory (optional)",
+                "a directory or manifest file name",
+            ),
+            format=(
+                "=str",
+                "Output file format in batch mode",
+                ["csv", "jsonl"],
+                False,
+            ),
+            codecache=(
+                "=0/1",
+                "Save the compiled scripts in the Gramps cache directory for later runs",
+                ["0 - compile the scripts in each run", "1 - reuse the compiled scripts"],
                 False,
             ),
         )
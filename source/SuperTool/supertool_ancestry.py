@@ -0,0 +1,261 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2026      Kari Kujansuu
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""
+Parent/child index for fast ancestor and descendant queries.
+
+The index maps person handles to small integers and keeps the parent and
+child links of each person as tuples of integers, so that walking the
+family graph does not read the database. It is built from all families
+when it is first needed and kept up to date with the database signals.
+
+The index refers to the database only weakly, so that an index kept in
+_indexes does not keep its database alive. The signals are disconnected when
+a signal arrives after the database has been closed.
+"""
+
+# -------------------------------------------------------------------------
+#
+# Standard Python modules
+#
+# -------------------------------------------------------------------------
+import collections
+import weakref
+
+try:
+    from typing import Any
+    from typing import Dict
+    from typing import List
+    from typing import Optional
+    from typing import Tuple
+    from gramps.gen.db import DbGeneric
+except:
+    pass
+
+_indexes = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+
+
+class AncestryIndex:
+    CACHE_SIZE = 100  # number of remembered ancestor/descendant sets
+
+    def __init__(self, db):
+        # type: (DbGeneric) -> None
+        self.dbref = weakref.ref(db)
+        self.ids = {}  # type: Dict[str, int]
+        self.handles = []  # type: List[str]
+        self.parents = []  # type: List[Tuple[int, ...]]
+        self.children = []  # type: List[Tuple[int, ...]]
+        self.family_links = {}  # type: Dict[str, Tuple[Tuple[int, ...], Tuple[int, ...]]]
+        self.memo = (
+            collections.OrderedDict()
+        )  # type: collections.OrderedDict[Tuple[str, int], Dict[int, int]]
+        for family in db.iter_families():
+            self.add_family(family.handle, family)
+        self.keys = [
+            db.connect("family-add", self.families_changed),
+            db.connect("family-update", self.families_changed),
+            db.connect("family-delete", self.families_deleted),
+            db.connect("person-update", self.people_changed),
+        ]
+
+    def get_db(self):
+        # type: () -> Optional[DbGeneric]
+        "Return the database, or None if it has been closed"
+        db = self.dbref()
+        if db is not None and db.is_open():
+            return db
+        self.close(db)
+        return None
+
+    def close(self, db):
+        # type: (Optional[DbGeneric]) -> None
+        "Disconnect the signals and forget the index"
+        if db is not None:
+            for key in self.keys:
+                db.disconnect(key)
+            if _indexes.get(db) is self:
+                del _indexes[db]
+        self.keys = []
+
+    def getid(self, handle):
+        # type: (str) -> int
+        i = self.ids.get(handle)
+        if i is None:
+            i = self.ids[handle] = len(self.handles)
+            self.handles.append(handle)
+            self.parents.append(())
+            self.children.append(())
+        return i
+
+    # ---------------------------------------------------------------------
+    # Maintaining the links
+    # ---------------------------------------------------------------------
+    def add_family(self, family_handle, family):
+        # type: (str, Any) -> None
+        parents = tuple(
+            self.getid(handle)
+            for handle in (family.get_father_handle(), family.get_mother_handle())
+            if handle
+        )
+        children = tuple(self.getid(ref.ref) for ref in family.get_child_ref_list())
+        self.family_links[family_handle] = (parents, children)
+        for child in children:
+            self.parents[child] += parents
+        for parent in parents:
+            self.children[parent] += children
+
+    def remove_family(self, family_handle):
+        # type: (str) -> None
+        links = self.family_links.pop(family_handle, None)
+        if links is None:
+            return
+        parents, children = links
+        for child in children:
+            self.parents[child] = remove_items(self.parents[child], parents)
+        for parent in parents:
+            self.children[parent] = remove_items(self.children[parent], children)
+
+    def refresh_family(self, db, family_handle):
+        # type: (DbGeneric, str) -> None
+        self.remove_family(family_handle)
+        family = db.get_family_from_handle(family_handle)
+        if family:
+            self.add_family(family_handle, family)
+
+    def families_changed(self, handles):
+        # type: (List[str]) -> None
+        db = self.get_db()
+        if db is None:
+            return
+        for handle in handles:
+            self.refresh_family(db, handle)
+        self.memo.clear()
+
+    def families_deleted(self, handles):
+        # type: (List[str]) -> None
+        if self.get_db() is None:
+            return
+        for handle in handles:
+            self.remove_family(handle)
+        self.memo.clear()
+
+    def people_changed(self, handles):
+        # type: (List[str]) -> None
+        db = self.get_db()
+        if db is None:
+            return
+        for handle in handles:
+            person = db.get_person_from_handle(handle)
+            if not person:
+                continue
+            for family_handle in (
+                person.get_parent_family_handle_list() + person.get_family_handle_list()
+            ):
+                self.refresh_family(db, family_handle)
+        self.memo.clear()
+
+    # ---------------------------------------------------------------------
+    # Queries
+    # ---------------------------------------------------------------------
+    def generations(self, direction, handle):
+        # type: (str, str) -> Dict[int, int]
+        """
+        Return a dict that maps the ancestors (direction="parents") or
+        descendants (direction="children") to the number of generations
+        between them and the person, in breadth-first order.
+        """
+        start = self.ids.get(handle)
+        if start is None:
+            return {}
+        key = (direction, start)
+        result = self.memo.get(key)
+        if result is not None:
+            self.memo.move_to_end(key)
+            return result
+        links = self.parents if direction == "parents" else self.children
+        result = {}
+        level = [start]
+        generation = 0
+        seen = {start}
+        while level:
+            generation += 1
+            next_level = []
+            for i in level:
+                for j in links[i]:
+                    if j not in seen:  # also protects against loops
+                        seen.add(j)
+                        result[j] = generation
+                        next_level.append(j)
+            level = next_level
+        self.memo[key] = result
+        if len(self.memo) > self.CACHE_SIZE:
+            self.memo.popitem(last=False)
+        return result
+
+    def ancestors(self, handle):
+        # type: (str) -> List[str]
+        return [self.handles[i] for i in self.generations("parents", handle)]
+
+    def descendants(self, handle):
+        # type: (str) -> List[str]
+        return [self.handles[i] for i in self.generations("children", handle)]
+
+    def generation_of(self, handle, other_handle):
+        # type: (str, str) -> Optional[int]
+        """
+        Number of generations from the person to the other person: positive
+        for an ancestor, negative for a descendant, 0 for the person
+        themselves and None if neither.
+        """
+        if handle == other_handle:
+            return 0
+        other = self.ids.get(other_handle)
+        if other is None:
+            return None
+        generation = self.generations("parents", handle).get(other)
+        if generation is not None:
+            return generation
+        generation = self.generations("children", handle).get(other)
+        if generation is not None:
+            return -generation
+        return None
+
+    def is_ancestor_of(self, handle, other_handle):
+        # type: (str, str) -> bool
+        i = self.ids.get(handle)
+        return i is not None and i in self.generations("parents", other_handle)
+
+
+def remove_items(items, removed):
+    # type: (Tuple[int, ...], Tuple[int, ...]) -> Tuple[int, ...]
+    "Remove one occurrence of each removed item"
+    result = list(items)
+    for item in removed:
+        if item in result:
+            result.remove(item)
+    return tuple(result)
+
+
+def get_index(db):
+    # type: (DbGeneric) -> AncestryIndex
+    index = _indexes.get(db)
+    if index is None:
+        index = _indexes[db] = AncestryIndex(db)
+    return index
@@ -0,0 +1,331 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2026      Kari Kujansuu
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""
+Running many SuperTool scripts in one pass over the database.
+
+The scripts are grouped by category. The objects of each category are read
+once and every script of the category processes each object in turn. Each
+script gets its own object, made from the raw data that was read once, and
+its own object cache, so changes made by one script are not seen by the
+others. Each script writes its rows to
+its own CSV or JSON lines file.
+
+The scripts are given either as a directory (all .script files in it) or as
+a manifest: a text file with one script file name per line, optionally
+followed by the output file name. Empty lines and lines starting with # are
+ignored. Relative script names are relative to the manifest, relative output
+names to the output directory.
+"""
+
+# -------------------------------------------------------------------------
+#
+# Standard Python modules
+#
+# -------------------------------------------------------------------------
+import collections
+import copy
+import os
+import shlex
+import time
+import traceback
+from pathlib import Path
+
+try:
+    from typing import Any
+    from typing import Dict
+    from typing import Iterable
+    from typing import List
+    from typing import Optional
+    from typing import Tuple
+except:
+    pass
+
+# -------------------------------------------------------------------------
+#
+# Gramps modules
+#
+# -------------------------------------------------------------------------
+from gramps.gen.db import DbTxn
+
+# -------------------------------------------------------------------------
+#
+# Local modules
+#
+# -------------------------------------------------------------------------
+import supertool_engine as engine
+import supertool_utils
+
+
+def find_scripts(source, extension):
+    # type: (str, str) -> List[Tuple[str, Optional[str]]]
+    "Return the script file names and output file names (or None)"
+    if os.path.isdir(source):
+        return [
+            (os.path.join(source, name), None)
+            for name in sorted(os.listdir(source))
+            if name.endswith(extension)
+        ]
+    basedir = os.path.dirname(source)
+    scripts = []  # type: List[Tuple[str, Optional[str]]]
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = shlex.split(line)
+            filename = os.path.join(basedir, parts[0])
+            output = parts[1] if len(parts) > 1 else None
+            scripts.append((filename, output))
+    return scripts
+
+
+class BatchJob:
+    "One script in a batch"
+
+    def __init__(self, filename, output):
+        # type: (str, str) -> None
+        self.filename = filename
+        self.output = output
+        self.name = Path(filename).stem
+        self.query = None  # type: Any
+        self.category = ""
+        self.sink = None  # type: Optional[supertool_utils.RowSink]
+        self.cache = None  # type: Optional[engine.ObjectCache]
+        self.objects = 0
+        self.time = 0.0
+        self.error = ""
+        self.done = False
+
+    def fail(self, e):
+        # type: (Exception) -> None
+        traceback.print_exc()
+        self.error = str(e) or type(e).__name__
+        if hasattr(e, "gramps_id"):
+            self.error += " (while processing {})".format(e.gramps_id)
+        self.done = True
+
+    def load(self, SuperTool):
+        # type: (Any) -> None
+        try:
+            self.query = SuperTool.ScriptFile().load(self.filename)
+            self.query.dirname = str(Path(self.filename).parent)
+            self.category = self.query.category
+            if not self.category:
+                raise engine.SupertoolException("No category in the script")
+            if self.category not in supertool_utils.CATEGORIES:
+                raise engine.SupertoolException("Invalid category: " + self.category)
+        except Exception as e:
+            self.fail(e)
+
+    def start(self, SuperTool, dbstate, user, context, handles, trans, cache, args):
+        # type: (Any, Any, Any, Any, List[str], Any, engine.ObjectCache, str) -> None
+        t = time.perf_counter()
+        self.cache = cache
+        try:
+            self.gramps_engine = SuperTool.GrampsEngine(
+                dbstate,
+                user,
+                context,
+                handles,
+                self.query,
+                env={
+                    "args": args,
+                    "category": self.category,
+                    "namespace": context.objclass,
+                },
+            )
+            self.result = SuperTool.Result()
+            os.makedirs(os.path.dirname(self.output) or ".", exist_ok=True)
+            self.sink = supertool_utils.RowSink(self.output)
+            self.env = self.gramps_engine.make_env(trans, self.result, cache)
+            self.env = self.gramps_engine.run_initial_statements(self.env)
+            self.write(self.result.fetch_rows())
+        except Exception as e:
+            self.fail(e)
+        self.time += time.perf_counter() - t
+
+    def process(self, handle):
+        # type: (str) -> None
+        t = time.perf_counter()
+        try:
+            for obj, env, values in self.gramps_engine.generate_values(
+                self.env, self.result, [handle]
+            ):
+                if not self.query.summary_only:
+                    self.sink(values)
+            self.objects += 1
+            result = self.result
+            if result.max and self.gramps_engine.object_count >= result.max:
+                self.done = True
+            if result.read_limit and self.objects >= result.read_limit:
+                self.done = True
+        except Exception as e:
+            self.fail(e)
+        self.time += time.perf_counter() - t
+
+    def finish(self):
+        # type: () -> None
+        t = time.perf_counter()
+        try:
+            if not self.error and self.sink:
+                self.write(self.gramps_engine.generate_summary(self.env, self.result))
+        except Exception as e:
+            self.fail(e)
+        finally:
+            if self.sink:
+                self.sink.close()
+        self.time += time.perf_counter() - t
+
+    def write(self, rows):
+        # type: (Iterable[List[Any]]) -> None
+        for values in rows:
+            self.sink(values)
+
+
+class SharedReader:
+    """
+    Reads the raw data of the current object once; each script gets its own
+    object made from the data
+    """
+
+    def __init__(self, db, context):
+        # type: (Any, Any) -> None
+        self.getfunc = context.getfunc
+        self.getraw = getattr(db, "get_raw_{}_data".format(context.objclass.lower()), None)
+        objcls = context.objcls
+        serializer = getattr(db, "serializer", None)
+        if serializer is not None and hasattr(serializer, "data_to_object"):
+            self.to_object = lambda data: serializer.data_to_object(data, objcls)
+        else:
+            self.to_object = lambda data: objcls().unserialize(data)  # Gramps 5.x tuples
+        self.handle = None  # type: Optional[str]
+        self.data = None  # type: Any
+        self.reads = 0
+
+    def get(self, handle):
+        # type: (str) -> Any
+        if self.getraw is None:
+            self.reads += 1
+            return self.getfunc(handle)
+        if handle != self.handle:
+            self.data = self.getraw(handle)
+            self.handle = handle
+            self.reads += 1
+        if self.data is None:
+            return self.getfunc(handle)  # raises the usual error
+        return self.to_object(self.data)
+
+
+def run_category(SuperTool, dbstate, user, category, jobs, trans, args):
+    # type: (Any, Any, Any, str, List[BatchJob], Any, str) -> None
+    db = dbstate.db
+    context = supertool_utils.get_context(db, category)
+    if context.objclass:
+        handles = context.get_all_objects_func()
+    else:
+        handles = []
+    reader = SharedReader(db, context)
+    shared_context = copy.copy(context)
+    if context.objclass:
+        shared_context.getfunc = reader.get
+    for job in jobs:
+        cache = engine.ObjectCache(db)
+        job.start(SuperTool, dbstate, user, shared_context, handles, trans, cache, args)
+
+    active = [job for job in jobs if not job.done]
+    for handle in handles:
+        if not active:
+            break
+        for job in active:
+            changes = job.cache.changes
+            job.process(handle)
+            if job.cache.changes != changes:
+                # the script committed changes, the others must read again
+                reader.handle = None
+                for other in jobs:
+                    if other is not job:
+                        other.cache.clear()
+        if any(job.done for job in active):
+            active = [job for job in active if not job.done]
+
+    for job in jobs:
+        job.finish()
+    print(
+        "{}: {} objects, {} read; cache hits: {}, misses: {}".format(
+            category,
+            len(handles),
+            reader.reads,
+            sum(job.cache.hits for job in jobs),
+            sum(job.cache.misses for job in jobs),
+        )
+    )
+
+
+def run_batch(dbstate, user, source, output_dir="", format="csv", args=""):
+    # type: (Any, Any, str, str, str, str) -> List[BatchJob]
+    import SuperTool
+
+    jobs = []  # type: List[BatchJob]
+    for filename, output in find_scripts(source, SuperTool.SCRIPTFILE_EXTENSION):
+        if output is None:
+            output = Path(filename).stem + "." + format
+        job = BatchJob(filename, os.path.join(output_dir, output))
+        job.load(SuperTool)
+        jobs.append(job)
+
+    groups = collections.OrderedDict()  # type: Dict[str, List[BatchJob]]
+    for job in jobs:
+        if not job.done:
+            groups.setdefault(job.category, []).append(job)
+
+    t1 = time.time()
+    with DbTxn("Generating values", dbstate.db) as trans:
+        for category, group in groups.items():
+            run_category(SuperTool, dbstate, user, category, group, trans, args)
+    t2 = time.time()
+
+    print()
+    print(format_summary(jobs))
+    print("Total time: {:.2f}s".format(t2 - t1))
+    return jobs
+
+
+def format_summary(jobs):
+    # type: (List[BatchJob]) -> str
+    out = []
+    out.append(
+        "{:<30} {:<12} {:>10} {:>10} {:>10}  {}".format(
+            "Script", "Category", "Objects", "Rows", "Time (s)", "Output"
+        )
+    )
+    for job in jobs:
+        rows = job.sink.count if job.sink else 0
+        out.append(
+            "{:<30} {:<12} {:>10} {:>10} {:>10.3f}  {}".format(
+                job.name,
+                job.category or "",
+                job.objects,
+                rows,
+                job.time,
+                "ERROR: " + job.error if job.error else job.output,
+            )
+        )
+    return "\n".join(out)
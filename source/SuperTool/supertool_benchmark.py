@@ -0,0 +1,656 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2026      Kari Kujansuu
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""
+Benchmarks for SuperTool over generated family trees.
+
+Run with the Python interpreter that Gramps uses, e.g.
+
+    python3 supertool_benchmark.py --sizes 10k,100k --json results.json
+    python3 supertool_benchmark.py --sizes 10k --compare results.json
+
+For each size a SQLite family tree is generated (in a temporary directory or
+in --dir, where it is reused by later runs) and a fixed set of scripts is run
+with supertool_execute. Each run is made in a new process, so that the peak
+memory use is that of the script (and of opening the tree) only. For each
+script the report shows the objects processed per second, the peak memory use
+and the number of objects read from the database per processed object.
+
+The generated tree starts from one couple. Each family has 0-6 children,
+most children marry a spouse from outside the tree and get their own family,
+so the tree has many generations. Everyone has a birth event, most also a
+death event, the events have places (towns in regions) and some of them
+have citations.
+"""
+
+# -------------------------------------------------------------------------
+#
+# Standard Python modules
+#
+# -------------------------------------------------------------------------
+import argparse
+import collections
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    from typing import Any
+    from typing import Callable
+    from typing import Dict
+    from typing import Iterator
+    from typing import List
+    from typing import Optional
+    from typing import Tuple
+except:
+    pass
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# -------------------------------------------------------------------------
+#
+# Gramps modules
+#
+# -------------------------------------------------------------------------
+from gramps.gen.db import DbTxn
+from gramps.gen.db.utils import make_database
+from gramps.gen.lib import ChildRef
+from gramps.gen.lib import Citation
+from gramps.gen.lib import Date
+from gramps.gen.lib import Event
+from gramps.gen.lib import EventRef
+from gramps.gen.lib import EventType
+from gramps.gen.lib import Family
+from gramps.gen.lib import Name
+from gramps.gen.lib import Person
+from gramps.gen.lib import Place
+from gramps.gen.lib import PlaceName
+from gramps.gen.lib import PlaceRef
+from gramps.gen.lib import PlaceType
+from gramps.gen.lib import Source
+from gramps.gen.lib import Surname
+
+# -------------------------------------------------------------------------
+#
+# Local modules
+#
+# -------------------------------------------------------------------------
+import supertool_fetch
+import supertool_utils
+
+SEED = 1
+TXN_SIZE = 5000  # people per transaction when generating
+CHILDREN = [0, 1, 1, 2, 2, 2, 3, 3, 4, 5, 6]  # children per family, uniformly
+MARRY_PROBABILITY = 0.7
+DEATH_PROBABILITY = 0.8
+CITATION_PROBABILITY = 0.3
+FIRST_NAMES = {
+    Person.MALE: ["John", "Matti", "Karl", "Pierre", "Juan", "Ivan", "Erik", "Ole"],
+    Person.FEMALE: ["Mary", "Maria", "Anna", "Liisa", "Sophie", "Ingrid", "Eva"],
+}
+SURNAMES = ["Smith", "Virtanen", "Müller", "Dubois", "García", "Ivanov", "Berg"]
+
+# -------------------------------------------------------------------------
+#
+# Scripts
+#
+# -------------------------------------------------------------------------
+SCRIPTS = collections.OrderedDict(
+    [
+        (
+            "filter",
+            dict(
+                category="People",
+                filter="gender == 'F' and birth.date and birth.date.ymd[0] >= 1900",
+                expressions="gramps_id, name, birth.date, birth.place",
+            ),
+        ),
+        (
+            "summary",
+            dict(
+                category="People",
+                initial_statements="decades = defaultdict(int)",
+                statements=(
+                    "if birth.date:\n"
+                    "    decades[birth.date.ymd[0] // 10 * 10] += 1"
+                ),
+                expressions="sorted(decades.items())",
+                summary_only=True,
+            ),
+        ),
+        (
+            "ancestors",
+            dict(
+                category="People",
+                expressions="gramps_id, len(ancestors), len(descendants)",
+            ),
+        ),
+        (
+            "parent_walk",
+            dict(
+                category="People",
+                initial_statements=(
+                    "def depth(p, n=0):\n"
+                    "    if n >= 8 or not p.parents:\n"
+                    "        return n\n"
+                    "    return max(depth(parent, n + 1) for parent in p.parents)\n"
+                ),
+                expressions="gramps_id, depth(self)",
+            ),
+        ),
+        (
+            "unwind",
+            dict(
+                category="Families",
+                expressions="gramps_id, [child.name for child in children]",
+                unwind_lists=True,
+            ),
+        ),
+        (
+            "events",
+            dict(
+                category="Events",
+                filter="type == 'Birth'",
+                expressions="gramps_id, date, place, citations",
+            ),
+        ),
+        (
+            "commit",
+            dict(
+                category="Events",
+                # args differs in each run, so every event really changes
+                statements="event.set_description('Benchmark ' + args + ' ' + gramps_id)",
+                commit_changes=True,
+            ),
+        ),
+    ]
+)  # type: collections.OrderedDict[str, Dict[str, Any]]
+
+
+# -------------------------------------------------------------------------
+#
+# Generating the tree
+#
+# -------------------------------------------------------------------------
+def parse_size(text):
+    # type: (str) -> int
+    "Parse a size like 10000, 10k or 1M"
+    text = text.strip().lower()
+    factor = 1
+    if text.endswith("k"):
+        factor = 1000
+        text = text[:-1]
+    elif text.endswith("m"):
+        factor = 1000000
+        text = text[:-1]
+    return int(float(text) * factor)
+
+
+class TreeGenerator:
+    def __init__(self, db, people, seed=SEED):
+        # type: (Any, int, int) -> None
+        self.db = db
+        self.people = people
+        self.random = random.Random(seed)
+        self.count = 0
+        self.places = []  # type: List[str]
+        self.sources = []  # type: List[str]
+
+    def generate(self):
+        # type: () -> None
+        with DbTxn("Generating places", self.db) as trans:
+            self.add_places(trans)
+        # families waiting for children: (family, birth year of the parents, surname)
+        queue = collections.deque()  # type: collections.deque
+        while self.count < self.people:
+            with DbTxn("Generating people", self.db) as trans:
+                limit = min(self.people, self.count + TXN_SIZE)
+                if not queue:
+                    queue.append(self.add_couple(None, "", 1700, trans))
+                while queue and self.count < limit:
+                    family, year, surname = queue.popleft()
+                    children = self.add_children(family, year, surname, limit, trans)
+                    for child, child_year in children:
+                        if self.random.random() < MARRY_PROBABILITY:
+                            queue.append(self.add_couple(child, surname, child_year, trans))
+
+    def add_places(self, trans):
+        # type: (Any) -> None
+        regions = []
+        for i in range(max(1, self.people // 5000)):
+            regions.append(self.add_place("Region {}".format(i), PlaceType.COUNTY, None, trans))
+        for i in range(max(1, self.people // 100)):
+            region = self.random.choice(regions)
+            self.places.append(self.add_place("Town {}".format(i), PlaceType.TOWN, region, trans))
+        for i in range(max(1, self.people // 2000)):
+            source = Source()
+            source.set_title("Parish register {}".format(i))
+            self.sources.append(self.db.add_source(source, trans))
+
+    def add_place(self, name, placetype, enclosed_by, trans):
+        # type: (str, Any, Optional[str], Any) -> str
+        place = Place()
+        place.set_name(PlaceName(value=name))
+        place.set_title(name)
+        place.set_type(placetype)
+        if enclosed_by:
+            placeref = PlaceRef()
+            placeref.ref = enclosed_by
+            place.add_placeref(placeref)
+        return self.db.add_place(place, trans)
+
+    def add_person(self, gender, surname, year, trans):
+        # type: (int, str, int, Any) -> Person
+        person = Person()
+        person.set_gender(gender)
+        name = Name()
+        name.set_first_name(self.random.choice(FIRST_NAMES[gender]))
+        surname_obj = Surname()
+        surname_obj.set_surname(surname)
+        surname_obj.set_primary(True)
+        name.add_surname(surname_obj)
+        person.set_primary_name(name)
+        person.set_birth_ref(self.add_event(person, EventType.BIRTH, year, trans))
+        if self.random.random() < DEATH_PROBABILITY:
+            age = self.random.randint(0, 90)
+            person.set_death_ref(self.add_event(person, EventType.DEATH, year + age, trans))
+        self.db.add_person(person, trans)
+        self.count += 1
+        return person
+
+    def add_event(self, person, eventtype, year, trans):
+        # type: (Person, int, int, Any) -> EventRef
+        event = Event()
+        event.set_type(eventtype)
+        date = Date()
+        date.set_yr_mon_day(year, self.random.randint(1, 12), self.random.randint(1, 28))
+        event.set_date_object(date)
+        event.set_place_handle(self.random.choice(self.places))
+        if self.random.random() < CITATION_PROBABILITY:
+            citation = Citation()
+            citation.set_reference_handle(self.random.choice(self.sources))
+            citation.set_page("Page {}".format(self.random.randint(1, 500)))
+            event.add_citation(self.db.add_citation(citation, trans))
+        eventref = EventRef()
+        eventref.ref = self.db.add_event(event, trans)
+        person.add_event_ref(eventref)
+        return eventref
+
+    def add_couple(self, person, surname, year, trans):
+        # type: (Optional[Person], str, int, Any) -> Tuple[Family, int, str]
+        """
+        Add a family for the person and a new spouse (or a new couple).
+        Returns the family, the birth year and the surname of the children.
+        """
+        if person is None:
+            surname = self.random.choice(SURNAMES)
+            person = self.add_person(Person.MALE, surname, year, trans)
+        gender = Person.FEMALE if person.get_gender() == Person.MALE else Person.MALE
+        spouse_year = year + self.random.randint(-5, 5)
+        spouse_surname = self.random.choice(SURNAMES)
+        spouse = self.add_person(gender, spouse_surname, spouse_year, trans)
+        if gender == Person.FEMALE:
+            father, mother = person, spouse
+        else:
+            father, mother = spouse, person
+            surname = spouse_surname
+        family = Family()
+        family.set_father_handle(father.handle)
+        family.set_mother_handle(mother.handle)
+        self.db.add_family(family, trans)
+        for parent in (father, mother):
+            parent.add_family_handle(family.handle)
+            self.db.commit_person(parent, trans)
+        return family, year, surname
+
+    def add_children(self, family, year, surname, limit, trans):
+        # type: (Family, int, str, int, Any) -> Iterator[Tuple[Person, int]]
+        for _ in range(self.random.choice(CHILDREN)):
+            if self.count >= limit:
+                break
+            gender = self.random.choice([Person.MALE, Person.FEMALE])
+            child_year = year + self.random.randint(20, 40)
+            child = self.add_person(gender, surname, child_year, trans)
+            child.add_parent_family_handle(family.handle)
+            self.db.commit_person(child, trans)
+            childref = ChildRef()
+            childref.ref = child.handle
+            family.add_child_ref(childref)
+            yield child, child_year
+        self.db.commit_family(family, trans)
+
+
+def open_tree(dirname, people, seed):
+    # type: (str, int, int) -> Any
+    "Open the tree in the directory, generating it first if needed"
+    db = make_database("sqlite")
+    exists = os.path.exists(os.path.join(dirname, "sqlite.db"))
+    os.makedirs(dirname, exist_ok=True)
+    db.load(dirname)
+    if not exists:
+        with open(os.path.join(dirname, "name.txt"), "w", encoding="utf-8") as f:
+            f.write("SuperTool benchmark {}".format(people))
+        with open(os.path.join(dirname, "database.txt"), "w", encoding="utf-8") as f:
+            f.write("sqlite")
+        t = time.perf_counter()
+        TreeGenerator(db, people, seed).generate()
+        print(
+            "Generated {} people in {:.1f}s".format(people, time.perf_counter() - t),
+            file=sys.stderr,
+        )
+    return db
+
+
+# -------------------------------------------------------------------------
+#
+# Measuring
+#
+# -------------------------------------------------------------------------
+class ReadCounter:
+    """
+    Counts the objects read from the database: calls of the
+    get_xxx_from_handle methods, objects returned by the iter_xxx methods
+    and rows returned by the "IN (...)" queries made directly by SuperTool.
+    """
+
+    def __init__(self, db):
+        # type: (Any) -> None
+        self.reads = 0
+        self.queries = 0
+        self.batch_query = False  # the last query was a batch read
+        for name in dir(type(db)):
+            if name.startswith("get_") and name.endswith("_from_handle"):
+                setattr(db, name, self.count_call(getattr(db, name)))
+            elif name.startswith("iter_") and name[5:] in supertool_fetch.PLURALS.values():
+                setattr(db, name, self.count_items(getattr(db, name)))
+        dbapi = getattr(db, "dbapi", None)
+        if dbapi is not None:
+            self.dbapi = dbapi
+            dbapi.execute = self.count_query(dbapi.execute)
+            dbapi.fetchall = self.count_rows(dbapi.fetchall)
+
+    def count_call(self, func):
+        # type: (Callable) -> Callable
+        def wrapper(*args, **kwargs):
+            # type: (Any, Any) -> Any
+            self.reads += 1
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    def count_items(self, func):
+        # type: (Callable) -> Callable
+        def wrapper(*args, **kwargs):
+            # type: (Any, Any) -> Any
+            for item in func(*args, **kwargs):
+                self.reads += 1
+                yield item
+
+        return wrapper
+
+    def count_query(self, func):
+        # type: (Callable) -> Callable
+        def wrapper(sql, *args, **kwargs):
+            # type: (str, Any, Any) -> Any
+            self.batch_query = " IN (" in sql  # batch reads of supertool_fetch
+            if self.batch_query:
+                self.queries += 1
+            return func(sql, *args, **kwargs)
+
+        return wrapper
+
+    def count_rows(self, func):
+        # type: (Callable) -> Callable
+        def wrapper(*args, **kwargs):
+            # type: (Any, Any) -> Any
+            rows = func(*args, **kwargs)
+            if self.batch_query:
+                self.reads += len(rows)
+                self.batch_query = False
+            return rows
+
+        return wrapper
+
+    def reset(self):
+        # type: () -> None
+        self.reads = 0
+        self.queries = 0
+
+
+def peak_rss_mb():
+    # type: () -> float
+    "Peak resident set size of this process in megabytes"
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss / (1024.0 * 1024.0)  # bytes
+    return rss / 1024.0  # kilobytes
+
+
+def run_script(db, counter, size, name, params, workers):
+    # type: (Any, ReadCounter, int, str, Dict[str, Any], int) -> Dict[str, Any]
+    context = supertool_utils.get_context(db, params["category"])
+    objects = len(context.get_all_objects_func()) if context.objclass else 0
+    rss_before = peak_rss_mb()
+    counter.reset()
+    t = time.perf_counter()
+    run_id = str(time.time_ns())  # the 'args' of the script, unique for each run
+    rsp = supertool_utils.supertool_execute(db=db, workers=workers, args=run_id, **params)
+    seconds = time.perf_counter() - t
+    reads = counter.reads
+    return dict(
+        size=size,
+        script=name,
+        category=params["category"],
+        objects=objects,
+        rows=len(rsp.rows),
+        seconds=round(seconds, 4),
+        objects_per_s=round(objects / seconds, 1) if seconds else 0.0,
+        peak_rss_mb=round(peak_rss_mb(), 1),
+        peak_rss_growth_mb=round(peak_rss_mb() - rss_before, 1),
+        db_reads=reads,
+        batch_queries=counter.queries,
+        reads_per_object=round(reads / objects, 3) if objects else 0.0,
+        cache_hits=rsp.cache.hits if rsp.cache else 0,
+        cache_misses=rsp.cache.misses if rsp.cache else 0,
+    )
+
+
+def run_one(dirname, size, name, seed, workers, output):
+    # type: (str, int, str, int, int, str) -> None
+    "Run one script on an existing tree and write the result to the output file"
+    db = open_tree(dirname, size, seed)
+    try:
+        result = run_script(db, ReadCounter(db), size, name, SCRIPTS[name], workers)
+    finally:
+        db.close()
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def run_in_subprocess(dirname, size, name, seed, workers):
+    # type: (str, int, str, int, int) -> Dict[str, Any]
+    "Run one script in a new process so that the peak memory use is its own"
+    output = os.path.join(dirname, "result.json")
+    subprocess.check_call(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--run-one",
+            dirname,
+            "--sizes",
+            str(size),
+            "--scripts",
+            name,
+            "--seed",
+            str(seed),
+            "--workers",
+            str(workers),
+            "--json",
+            output,
+        ],
+        stdout=sys.stderr,
+    )
+    with open(output, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_benchmarks(sizes, scripts, basedir, seed=SEED, repeat=1, workers=0):
+    # type: (List[int], List[str], str, int, int, int) -> List[Dict[str, Any]]
+    results = []
+    for size in sizes:
+        dirname = os.path.join(basedir, "tree-{}-{}".format(size, seed))
+        open_tree(dirname, size, seed).close()  # generated here, not in the measured runs
+        for name in scripts:
+            best = None  # type: Optional[Dict[str, Any]]
+            for _ in range(repeat):
+                result = run_in_subprocess(dirname, size, name, seed, workers)
+                if best is None or result["seconds"] < best["seconds"]:
+                    best = result
+            assert best is not None
+            print(format_result(best), file=sys.stderr)
+            results.append(best)
+    return results
+
+
+# -------------------------------------------------------------------------
+#
+# Reporting
+#
+# -------------------------------------------------------------------------
+HEADER = "{:>8} {:<12} {:>9} {:>9} {:>12} {:>10} {:>11}".format(
+    "Size", "Script", "Objects", "Time (s)", "Objects/s", "Peak MB", "Reads/obj"
+)
+
+
+def format_result(r):
+    # type: (Dict[str, Any]) -> str
+    return "{:>8} {:<12} {:>9} {:>9.3f} {:>12.1f} {:>10.1f} {:>11.3f}".format(
+        r["size"],
+        r["script"],
+        r["objects"],
+        r["seconds"],
+        r["objects_per_s"],
+        r["peak_rss_mb"],
+        r["reads_per_object"],
+    )
+
+
+def metadata(seed):
+    # type: (int) -> Dict[str, Any]
+    try:
+        from gramps.version import VERSION as gramps_version
+    except ImportError:
+        gramps_version = ""
+    return dict(
+        time=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        python=platform.python_version(),
+        gramps=gramps_version,
+        platform=platform.platform(),
+        seed=seed,
+    )
+
+
+def compare(results, old_results):
+    # type: (List[Dict[str, Any]], List[Dict[str, Any]]) -> str
+    "Show the speed and read count changes relative to an earlier run"
+    old = {(r["size"], r["script"]): r for r in old_results}
+    out = [
+        "{:>8} {:<12} {:>12} {:>12} {:>8} {:>11}".format(
+            "Size", "Script", "Old obj/s", "New obj/s", "Speedup", "Reads/obj"
+        )
+    ]
+    for r in results:
+        o = old.get((r["size"], r["script"]))
+        if o is None:
+            continue
+        speedup = r["objects_per_s"] / o["objects_per_s"] if o["objects_per_s"] else 0.0
+        out.append(
+            "{:>8} {:<12} {:>12.1f} {:>12.1f} {:>7.2f}x {:>5.2f}->{:<5.2f}".format(
+                r["size"],
+                r["script"],
+                o["objects_per_s"],
+                r["objects_per_s"],
+                speedup,
+                o["reads_per_object"],
+                r["reads_per_object"],
+            )
+        )
+    return "\n".join(out)
+
+
+def main(argv=None):
+    # type: (Optional[List[str]]) -> None
+    parser = argparse.ArgumentParser(description="SuperTool benchmarks")
+    parser.add_argument(
+        "--sizes", default="10k", help="comma separated numbers of people, e.g. 10k,100k,1M"
+    )
+    parser.add_argument(
+        "--scripts",
+        default=",".join(SCRIPTS),
+        help="comma separated script names (default: all of {})".format(", ".join(SCRIPTS)),
+    )
+    parser.add_argument("--dir", help="directory for the generated trees (kept for later runs)")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per script, the fastest is reported")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file ('-' = standard output)")
+    parser.add_argument("--compare", help="compare with the results in this JSON file")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)  # tree directory, internal
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    scripts = [name.strip() for name in args.scripts.split(",")]
+    for name in scripts:
+        if name not in SCRIPTS:
+            parser.error("unknown script: " + name)
+    if args.run_one:
+        run_one(args.run_one, sizes[0], scripts[0], args.seed, args.workers, args.json)
+        return
+
+    basedir = args.dir or tempfile.mkdtemp(prefix="supertool-benchmark-")
+    print(HEADER, file=sys.stderr)
+    try:
+        results = run_benchmarks(sizes, scripts, basedir, args.seed, args.repeat, args.workers)
+    finally:
+        if not args.dir:
+            shutil.rmtree(basedir, ignore_errors=True)
+
+    report = dict(metadata=metadata(args.seed), results=results)
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            old_report = json.load(f)
+        print(compare(results, old_report["results"]), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
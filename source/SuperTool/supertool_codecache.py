@@ -0,0 +1,186 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2026      Kari Kujansuu
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""
+Caches for compiled script code and expanded @include files.
+
+Compiled code objects are keyed by a hash of the source text, the source
+name and the compile mode. They are kept in memory. If persistent is set
+(the command line option codecache=1), they are also saved as marshalled
+bytecode in the SuperTool/codecache directory under the Gramps cache
+directory, so that a new Gramps process does not need to compile the same
+code again.
+
+The result of expanding the @include lines of a script is kept in memory
+and reused as long as the modification times and sizes of the included
+files stay the same.
+"""
+
+# -------------------------------------------------------------------------
+#
+# Standard Python modules
+#
+# -------------------------------------------------------------------------
+import collections
+import hashlib
+import importlib.util
+import marshal
+import os
+
+try:
+    from typing import Any
+    from typing import Dict
+    from typing import List
+    from typing import Optional
+    from typing import Tuple
+except:
+    pass
+
+# -------------------------------------------------------------------------
+#
+# Gramps modules
+#
+# -------------------------------------------------------------------------
+try:
+    from gramps.gen.const import USER_CACHE
+except ImportError:
+    from gramps.gen.const import USER_PLUGINS as USER_CACHE
+
+CACHE_DIR = os.path.join(USER_CACHE, "SuperTool", "codecache")
+MAX_CODES = 500  # code objects kept in memory
+MAX_FILES = 1000  # code files kept on disk
+MAGIC = importlib.util.MAGIC_NUMBER  # bytecode is specific to the Python version
+
+persistent = False  # save the compiled code on disk
+
+_codes = collections.OrderedDict()  # type: collections.OrderedDict[str, Any]
+_includes = {}  # type: Dict[Tuple[str, Optional[str], str], Tuple[str, List[Tuple[str,int,int]], List[Tuple[str, Any]]]]
+
+
+def code_key(source, filename, mode):
+    # type: (str, str, str) -> str
+    h = hashlib.sha1()
+    h.update("{}\0{}\0".format(mode, filename).encode("utf-8"))
+    h.update(source.encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+def compile_cached(source, filename, mode):
+    # type: (str, str, str) -> Any
+    "Like compile() but returns a cached code object if there is one"
+    key = code_key(source, filename, mode)
+    code = _codes.get(key)
+    if code is not None:
+        _codes.move_to_end(key)
+        return code
+    code = load_code(key)
+    if code is None:
+        code = compile(source, filename, mode)
+        save_code(key, code)
+    _codes[key] = code
+    if len(_codes) > MAX_CODES:
+        _codes.popitem(last=False)
+    return code
+
+
+def load_code(key):
+    # type: (str) -> Any
+    if not persistent:
+        return None
+    try:
+        with open(os.path.join(CACHE_DIR, key), "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if not data.startswith(MAGIC):
+        return None
+    try:
+        return marshal.loads(data[len(MAGIC) :])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+
+def save_code(key, code):
+    # type: (str, Any) -> None
+    if not persistent:
+        return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmpname = os.path.join(CACHE_DIR, key + ".tmp")
+        with open(tmpname, "wb") as f:
+            f.write(MAGIC + marshal.dumps(code))
+        os.replace(tmpname, os.path.join(CACHE_DIR, key))
+        prune()
+    except OSError:
+        pass  # e.g. a read-only cache directory
+
+
+def prune():
+    # type: () -> None
+    "Remove the least recently written files if there are too many"
+    names = os.listdir(CACHE_DIR)
+    if len(names) <= MAX_FILES:
+        return
+    paths = [os.path.join(CACHE_DIR, name) for name in names]
+    paths.sort(key=os.path.getmtime)
+    for path in paths[: len(paths) - MAX_FILES]:
+        os.remove(path)
+
+
+# -------------------------------------------------------------------------
+#
+# Include files
+#
+# -------------------------------------------------------------------------
+def file_stamp(filename):
+    # type: (str) -> Any
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def get_includes(key):
+    # type: (Tuple[str, Optional[str], str]) -> Optional[Tuple[str, List[Tuple[str,int,int]]]]
+    "Return the saved expansion if none of the included files has changed"
+    entry = _includes.get(key)
+    if entry is None:
+        return None
+    text, files, stamps = entry
+    for filename, stamp in stamps:
+        if file_stamp(filename) != stamp:
+            del _includes[key]
+            return None
+    return text, list(files)
+
+
+def put_includes(key, text, files):
+    # type: (Tuple[str, Optional[str], str], str, List[Tuple[str,int,int]]) -> None
+    stamps = [(fullname, file_stamp(fullname)) for fullname, _start, _end in files]
+    if len(_includes) >= MAX_CODES:
+        _includes.clear()
+    _includes[key] = (text, list(files), stamps)
+
+
+def clear():
+    # type: () -> None
+    _codes.clear()
+    _includes.clear()
@@ -0,0 +1,317 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2026      Kari Kujansuu
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""
+Columnar snapshots of the family tree for fast statistics.
+
+snapshot(db, "People") returns the commonly used fields of all people as
+NumPy arrays, one array per field. The snapshot is built once and reused
+until an object of the snapshot's type (or an event, place or family that
+the fields depend on) is added, changed or deleted.
+
+The functions count_by, sum_by, min_by and max_by do grouped aggregates
+over the arrays. For example, people per birth decade:
+
+    people = snapshot("People")
+    born = people[people.birth_year > 0]
+    count_by(born.birth_year // 10 * 10)
+
+NumPy is optional; it is needed only when these functions are used.
+"""
+
+# -------------------------------------------------------------------------
+#
+# Standard Python modules
+#
+# -------------------------------------------------------------------------
+import weakref
+
+try:
+    from typing import Any
+    from typing import Dict
+    from typing import List
+    from typing import Tuple
+    from gramps.gen.db import DbGeneric
+except:
+    pass
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# -------------------------------------------------------------------------
+#
+# Local modules
+#
+# -------------------------------------------------------------------------
+import supertool_engine as engine
+
+# objects of these types affect the snapshots
+SIGNAL_PREFIXES = ["person", "family", "event", "place"]
+
+_snapshots = (
+    weakref.WeakKeyDictionary()
+)  # type: weakref.WeakKeyDictionary[DbGeneric, Dict[str, Columns]]
+
+
+class Columns:
+    """
+    A set of equally long NumPy arrays, one per field.
+
+    Indexing with a boolean mask or an index array returns a new Columns
+    object containing only the selected rows.
+    """
+
+    def __init__(self, **arrays):
+        # type: (Any) -> None
+        self.fields = list(arrays)
+        self.__dict__.update(arrays)
+
+    def __len__(self):
+        # type: () -> int
+        return len(getattr(self, self.fields[0])) if self.fields else 0
+
+    def __getitem__(self, index):
+        # type: (Any) -> Columns
+        return Columns(**{name: getattr(self, name)[index] for name in self.fields})
+
+    def __repr__(self):
+        # type: () -> str
+        return "Columns[{}]({})".format(len(self), ", ".join(self.fields))
+
+
+def require_numpy():
+    # type: () -> None
+    if numpy is None:
+        raise engine.SupertoolException(
+            "The NumPy module is needed for snapshot(). Install it with 'pip install numpy'"
+        )
+
+
+# -------------------------------------------------------------------------
+#
+# Building the snapshots
+#
+# -------------------------------------------------------------------------
+def event_info(event):
+    # type: (Any) -> Tuple[int, int, int, str]
+    date = event.get_date_object()
+    return (
+        int(event.get_type()),
+        date.get_sort_value(),
+        date.get_year(),
+        event.get_place_handle() or "",
+    )
+
+
+NO_EVENT = (0, 0, 0, "")
+
+
+def build_events(db):
+    # type: (DbGeneric) -> Columns
+    handles = []
+    infos = []
+    for event in db.iter_events():
+        handles.append(event.handle)
+        infos.append(event_info(event))
+    types, sortvals, years, places = zip(*infos) if infos else ((), (), (), ())
+    return Columns(
+        handle=numpy.array(handles, dtype=object),
+        type=numpy.array(types, dtype=numpy.int32),
+        sortval=numpy.array(sortvals, dtype=numpy.int64),
+        year=numpy.array(years, dtype=numpy.int32),
+        place=numpy.array(places, dtype=object),
+    )
+
+
+def build_people(db):
+    # type: (DbGeneric) -> Columns
+    events = {}  # type: Dict[str, Tuple[int, int, int, str]]
+    for event in db.iter_events():
+        events[event.handle] = event_info(event)
+
+    fields = {
+        name: []
+        for name in (
+            "handle",
+            "gramps_id",
+            "gender",
+            "surname",
+            "firstname",
+            "birth_sortval",
+            "birth_year",
+            "birth_place",
+            "death_sortval",
+            "death_year",
+            "death_place",
+            "parent_family",
+            "family_count",
+        )
+    }  # type: Dict[str, List[Any]]
+    for person in db.iter_people():
+        name = person.get_primary_name()
+        ref = person.get_birth_ref()
+        birth = events.get(ref.ref, NO_EVENT) if ref else NO_EVENT
+        ref = person.get_death_ref()
+        death = events.get(ref.ref, NO_EVENT) if ref else NO_EVENT
+        fields["handle"].append(person.handle)
+        fields["gramps_id"].append(person.gramps_id)
+        fields["gender"].append(person.get_gender())
+        fields["surname"].append(name.get_primary_surname().get_surname())
+        fields["firstname"].append(name.get_first_name())
+        fields["birth_sortval"].append(birth[1])
+        fields["birth_year"].append(birth[2])
+        fields["birth_place"].append(birth[3])
+        fields["death_sortval"].append(death[1])
+        fields["death_year"].append(death[2])
+        fields["death_place"].append(death[3])
+        fields["parent_family"].append(person.get_main_parents_family_handle() or "")
+        fields["family_count"].append(len(person.get_family_handle_list()))
+
+    dtypes = dict(
+        gender=numpy.int8,
+        birth_sortval=numpy.int64,
+        birth_year=numpy.int32,
+        death_sortval=numpy.int64,
+        death_year=numpy.int32,
+        family_count=numpy.int32,
+    )
+    return Columns(
+        **{
+            name: numpy.array(values, dtype=dtypes.get(name, object))
+            for name, values in fields.items()
+        }
+    )
+
+
+def build_families(db):
+    # type: (DbGeneric) -> Columns
+    fields = {
+        name: []
+        for name in ("handle", "gramps_id", "father", "mother", "reltype", "child_count")
+    }  # type: Dict[str, List[Any]]
+    for family in db.iter_families():
+        fields["handle"].append(family.handle)
+        fields["gramps_id"].append(family.gramps_id)
+        fields["father"].append(family.get_father_handle() or "")
+        fields["mother"].append(family.get_mother_handle() or "")
+        fields["reltype"].append(int(family.get_relationship()))
+        fields["child_count"].append(len(family.get_child_ref_list()))
+    dtypes = dict(reltype=numpy.int32, child_count=numpy.int32)
+    return Columns(
+        **{
+            name: numpy.array(values, dtype=dtypes.get(name, object))
+            for name, values in fields.items()
+        }
+    )
+
+
+def build_places(db):
+    # type: (DbGeneric) -> Columns
+    fields = {
+        name: [] for name in ("handle", "gramps_id", "name", "type", "enclosed_by")
+    }  # type: Dict[str, List[Any]]
+    for place in db.iter_places():
+        refs = place.get_placeref_list()
+        fields["handle"].append(place.handle)
+        fields["gramps_id"].append(place.gramps_id)
+        fields["name"].append(place.get_name().get_value())
+        fields["type"].append(str(place.get_type()))
+        fields["enclosed_by"].append(refs[0].ref if refs else "")
+    return Columns(
+        **{name: numpy.array(values, dtype=object) for name, values in fields.items()}
+    )
+
+
+BUILDERS = {
+    "People": build_people,
+    "Families": build_families,
+    "Events": build_events,
+    "Places": build_places,
+}
+
+
+def snapshot(db, category):
+    # type: (DbGeneric, str) -> Columns
+    "Return the columns for the category, building them if needed"
+    require_numpy()
+    if category not in BUILDERS:
+        raise engine.SupertoolException(
+            "snapshot() supports only these categories: " + ", ".join(BUILDERS)
+        )
+    if isinstance(db, engine.ObjectCache):
+        db = db.db
+    snapshots = _snapshots.get(db)
+    if snapshots is None:
+        snapshots = _snapshots[db] = {}
+        for prefix in SIGNAL_PREFIXES:
+            for action in ("add", "update", "delete"):
+                db.connect(prefix + "-" + action, lambda *args: snapshots.clear())
+    if category not in snapshots:
+        snapshots[category] = BUILDERS[category](db)
+    return snapshots[category]
+
+
+# -------------------------------------------------------------------------
+#
+# Grouped aggregates
+#
+# -------------------------------------------------------------------------
+def _groups(keys):
+    # type: (Any) -> Tuple[Any, Any]
+    require_numpy()
+    return numpy.unique(numpy.asarray(keys), return_inverse=True)
+
+
+def count_by(keys):
+    # type: (Any) -> Dict[Any, int]
+    "Number of rows per distinct key"
+    require_numpy()
+    values, counts = numpy.unique(numpy.asarray(keys), return_counts=True)
+    return dict(zip(values.tolist(), counts.tolist()))
+
+
+def sum_by(keys, values):
+    # type: (Any, Any) -> Dict[Any, Any]
+    "Sum of the values per distinct key"
+    groups, inverse = _groups(keys)
+    sums = numpy.bincount(inverse, weights=values, minlength=len(groups))
+    return dict(zip(groups.tolist(), sums.tolist()))
+
+
+def min_by(keys, values):
+    # type: (Any, Any) -> Dict[Any, Any]
+    "Smallest value per distinct key"
+    groups, inverse = _groups(keys)
+    values = numpy.asarray(values)
+    result = numpy.full(len(groups), values.max() if len(values) else 0)
+    numpy.minimum.at(result, inverse, values)
+    return dict(zip(groups.tolist(), result.tolist()))
+
+
+def max_by(keys, values):
+    # type: (Any, Any) -> Dict[Any, Any]
+    "Largest value per distinct key"
+    groups, inverse = _groups(keys)
+    values = numpy.asarray(values)
+    result = numpy.full(len(groups), values.min() if len(values) else 0)
+    numpy.maximum.at(result, inverse, values)
+    return dict(zip(groups.tolist(), result.tolist()))
@@ -32,8 +32,11 @@ Features:
     instead of deleting a single space, when the cursor is only preceded
     by whitespace on the current line.
   - Syntax highlighting (keywords, builtins, strings, comments, numbers,
-    decorators, and def/class names), driven by the stdlib `tokenize`
-    module and refreshed on a short debounce after each edit.
+    decorators, and def/class names), refreshed on a short debounce after
+    each edit. The highlighting of each line is cached and only the changed
+    lines (and the lines after them whose state changed, e.g. inside a
+    triple-quoted string) are tokenized again. Large changes are tokenized
+    in a background thread.
 
 Requires: PyGObject (python3-gi), GTK 3.
 
@@ -41,16 +44,145 @@ Author: Kari Kujansuu with Claude AI
 """
 
 import builtins
-import io
 import keyword
-import tokenize
+import re
+import threading
 
 import gi
 gi.require_version("Gtk", "3.0")
 from gi.repository import Gtk, Gdk, Pango, GLib
 
 
+# ---------------------------------------------------------------------
+# Line tokenizer for highlighting
+# ---------------------------------------------------------------------
+#
+# Each line is tokenized separately. The only state carried from one line
+# to the next is an unterminated string: the quote that is still open
+# (a triple quote, or a single quote continued with a backslash), or None.
+
+_BUILTIN_NAMES = frozenset(dir(builtins))
+_KEYWORD_NAMES = frozenset(keyword.kwlist) | frozenset(getattr(keyword, "softkwlist", []))
+
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<comment>\#.*)
+    | (?P<string>[rRbBuUfF]{0,2}(?:"{3}|'{3}|"|'))
+    | (?P<number>(?:0[xXoObB][0-9a-fA-F_]+|(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d+)?)[jJ]?)
+    | (?P<name>[^\W\d]\w*)
+    | (?P<op>[^\s\w])
+    """,
+    re.VERBOSE,
+)
+
+_STRING_END_RE = {
+    quote: re.compile(r"(?:\\.|[^\\])*?" + re.escape(quote))
+    for quote in ('"' * 3, "'" * 3, '"', "'")
+}
+
+_UNKNOWN = object()  # state of a line that has not been tokenized
+
+
+def _split_lines(text):
+    """Split the text at the same line ends as Gtk.TextBuffer."""
+    if "\r" in text or "\u2029" in text:
+        return re.split("\r\n|\r|\n|\u2029", text)
+    return text.split("\n")
+
+
+def _string_end(line, pos, quote):
+    """Return (end column, state) for a string whose contents start at pos."""
+    m = _STRING_END_RE[quote].match(line, pos)
+    if m:
+        return m.end(), None
+    if len(quote) == 3 or line.endswith("\\"):
+        return len(line), quote  # continues on the next line
+    return len(line), None  # unterminated
+
+
+def _lex_line(line, state):
+    """Return the highlighted spans of the line and the state at its end."""
+    spans = []
+    pos = 0
+    if state is not None:
+        pos, state = _string_end(line, 0, state)
+        spans.append((0, pos, "py-string"))
+        if state is not None:
+            return spans, state
+    prev_tok = None  # previous token on the line
+    while True:
+        m = _TOKEN_RE.search(line, pos)
+        if m is None:
+            break
+        kind = m.lastgroup
+        tokstr = m.group()
+        start, pos = m.span()
+        tag = None
+        if kind == "comment":
+            tag = "py-comment"
+        elif kind == "string":
+            quote = tokstr.lstrip("rRbBuUfF")
+            pos, state = _string_end(line, pos, quote)
+            tag = "py-string"
+        elif kind == "number":
+            tag = "py-number"
+        elif kind == "op":
+            if tokstr == "@":
+                tag = "py-decorator"
+        elif prev_tok == "@":
+            tag = "py-decorator"
+        elif tokstr in ("self", "cls"):
+            tag = "py-self"
+        elif tokstr in _KEYWORD_NAMES:
+            tag = "py-keyword"
+        elif prev_tok in ("def", "class"):
+            tag = "py-defname"
+        elif tokstr in _BUILTIN_NAMES:
+            tag = "py-builtin"
+        if tag:
+            spans.append((start, pos, tag))
+        prev_tok = tokstr
+    return spans, state
+
+
+def _changed_range(old, new):
+    """Return (first, old_end, new_end): old[first:old_end] was replaced by
+    new[first:new_end] and the lines before and after are the same."""
+    n = min(len(old), len(new))
+    first = 0
+    while first < n and old[first] == new[first]:
+        first += 1
+    suffix = 0
+    while suffix < n - first and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    return first, len(old) - suffix, len(new) - suffix
+
+
+def _relex(lines, exits, spans, first, new_end, boundary):
+    """Tokenize lines from first on, updating exits and spans in place, until
+    after the changed lines (first...new_end) a line starts in the same state
+    as before. 'boundary' is the previous state at the start of line new_end.
+    Returns the number of the first line that was not tokenized."""
+    cached = exits[new_end:]  # previous states at the end of unchanged lines
+    state = exits[first - 1] if first > 0 else None
+    linenum = first
+    while linenum < len(lines):
+        if linenum >= new_end:
+            if linenum == new_end:
+                old_state = boundary
+            else:
+                old_state = cached[linenum - new_end - 1]
+            if state == old_state:
+                break
+        spans[linenum], state = _lex_line(lines[linenum], state)
+        exits[linenum] = state
+        linenum += 1
+    return linenum
+
+
 class PythonCodeView(Gtk.TextView):
+    THREAD_LINES = 2000  # tokenized in a background thread if more lines may change
+
     def __init__(self, tab_width=4, **kwargs):
         super().__init__(**kwargs)
 
@@ -69,9 +201,13 @@ class PythonCodeView(Gtk.TextView):
         self.connect("key-press-event", self._on_key_press)
 
         # -- syntax highlighting setup --
-        self._builtin_names = set(dir(builtins))
-        self._keyword_names = set(keyword.kwlist) | set(getattr(keyword, "softkwlist", []))
         self._highlight_source_id = None
+        self._highlight_generation = 0
+        # per line: the text, the tokenizer state at the end of the line
+        # and the highlighted (start column, end column, tag name) spans
+        self._hl_lines = []
+        self._hl_exits = []
+        self._hl_spans = []
         self._setup_highlight_tags(self.get_buffer())
         self.get_buffer().connect("changed", self._schedule_highlight)
         # Highlight whatever is already in the buffer (e.g. set via set_text
@@ -99,77 +235,81 @@ class PythonCodeView(Gtk.TextView):
             buf.create_tag(name, **props)
 
     def _schedule_highlight(self, *_args):
+        self._highlight_generation += 1
         if self._highlight_source_id is not None:
             GLib.source_remove(self._highlight_source_id)
         self._highlight_source_id = GLib.timeout_add(150, self._do_highlight)
 
     def _do_highlight(self):
+        """Re-tokenize the lines changed since the last highlighting, plus
+        the following lines until the tokenizer state is the same as before
+        (e.g. until the end of a triple-quoted string that was opened)."""
         self._highlight_source_id = None
         buf = self.get_buffer()
         start, end = buf.get_bounds()
-        text = buf.get_text(start, end, True)
+        lines = _split_lines(buf.get_text(start, end, True))
+
+        old_lines = self._hl_lines
+        first, old_end, new_end = _changed_range(old_lines, lines)
+        if first == old_end == new_end:
+            return False
+        # cached state for the unchanged lines, placeholders for the others
+        changed = new_end - first
+        exits = self._hl_exits[:first] + [_UNKNOWN] * changed + self._hl_exits[old_end:]
+        spans = self._hl_spans[:first] + [None] * changed + self._hl_spans[old_end:]
+        boundary = self._hl_exits[old_end - 1] if old_end > 0 else None
+        args = (lines, exits, spans, first, new_end, boundary)
+
+        # an edit of one line (e.g. opening a triple-quoted string) can change
+        # the state of all lines after it, so the decision is made by how far
+        # the re-tokenizing may run, not by the number of changed lines
+        if len(lines) - first < self.THREAD_LINES:
+            self._apply_highlight(self._highlight_generation, lines, exits, spans, first,
+                                  _relex(*args))
+            return False
+
+        # large change: tokenize in a thread and apply the tags when done,
+        # unless the buffer has been changed again in the meantime
+        generation = self._highlight_generation
+
+        def run():
+            try:
+                stop = _relex(*args)
+            except Exception:
+                return
+            GLib.idle_add(self._apply_highlight, generation, lines, exits, spans, first, stop)
+
+        threading.Thread(target=run, daemon=True).start()
+        return False
 
+    def _apply_highlight(self, generation, lines, exits, spans, first, stop):
+        if generation != self._highlight_generation:
+            return False  # stale; a new highlighting run has been scheduled
+        buf = self.get_buffer()
+        if buf.get_line_count() != len(lines):
+            # unexpected line ends; never let a highlighting glitch break
+            # editing, just start from scratch next time
+            self._hl_lines, self._hl_exits, self._hl_spans = [], [], []
+            return False
+        self._hl_lines = lines
+        self._hl_exits = exits
+        self._hl_spans = spans
+        if stop <= first:
+            return False
+        start = buf.get_iter_at_line(first)
+        if stop < len(lines):
+            end = buf.get_iter_at_line(stop)
+        else:
+            end = buf.get_end_iter()
         for name in self._tag_names:
             buf.remove_tag_by_name(name, start, end)
-
-        line_count = buf.get_line_count()
-
-        def iter_at(row, col):
-            # tokenize rows are 1-based; clamp defensively since partially
-            # typed code (e.g. an unterminated string) can yield positions
-            # past the buffer's current bounds.
-            line = max(0, min(row - 1, line_count - 1))
-            it = buf.get_iter_at_line(line)
-            line_len = it.copy()
-            if not line_len.ends_line():
-                line_len.forward_to_line_end()
-            max_col = line_len.get_line_offset()
-            it.set_line_offset(min(col, max_col))
-            return it
-
-        def tag_range(name, start_rc, end_rc):
-            s = iter_at(*start_rc)
-            e = iter_at(*end_rc)
-            buf.apply_tag_by_name(name, s, e)
-
-        prev_tok = None  # (toktype, string) of the previous significant token
-        try:
-            for tok in tokenize.generate_tokens(io.StringIO(text).readline):
-                toktype, tokstr, start_rc, end_rc, _line = tok
-
-                if toktype == tokenize.COMMENT:
-                    tag_range("py-comment", start_rc, end_rc)
-                elif toktype == tokenize.STRING:
-                    tag_range("py-string", start_rc, end_rc)
-                elif toktype == tokenize.NUMBER:
-                    tag_range("py-number", start_rc, end_rc)
-                elif toktype == tokenize.OP and tokstr == "@":
-                    tag_range("py-decorator", start_rc, end_rc)
-                elif toktype == tokenize.NAME:
-                    if prev_tok and prev_tok[0] == tokenize.OP and prev_tok[1] == "@":
-                        tag_range("py-decorator", start_rc, end_rc)
-                    elif tokstr in ("self", "cls"):
-                        tag_range("py-self", start_rc, end_rc)
-                    elif tokstr in self._keyword_names:
-                        tag_range("py-keyword", start_rc, end_rc)
-                        if tokstr in ("def", "class"):
-                            prev_tok = (toktype, tokstr)
-                            continue
-                    elif prev_tok and prev_tok[0] == tokenize.NAME and prev_tok[1] in ("def", "class"):
-                        tag_range("py-defname", start_rc, end_rc)
-                    elif tokstr in self._builtin_names:
-                        tag_range("py-builtin", start_rc, end_rc)
-
-                if toktype not in (tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT, tokenize.COMMENT):
-                    prev_tok = (toktype, tokstr)
-        except (tokenize.TokenError, IndentationError, SyntaxError):
-            # Typical while mid-edit (e.g. an unterminated string or an
-            # unbalanced bracket) -- just keep whatever we managed to tag.
-            pass
-        except Exception:
-            # Never let a highlighting glitch break editing.
-            pass
-
+        for linenum in range(first, stop):
+            for col1, col2, name in spans[linenum]:
+                buf.apply_tag_by_name(
+                    name,
+                    buf.get_iter_at_line_offset(linenum, col1),
+                    buf.get_iter_at_line_offset(linenum, col2),
+                )
         return False
 
     # -- helpers ----------------------------------------------------
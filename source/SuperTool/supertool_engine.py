@@ -23,7 +23,10 @@
 # Standard Python modules
 #
 # -------------------------------------------------------------------------
+import collections
 import functools
+import os
+import weakref
 
 try:
     from typing import TYPE_CHECKING
@@ -59,7 +62,6 @@ from gramps.gen.filters import FilterList
 from gramps.gen.lib import Person
 from gramps.gen.lib import Date
 from gramps.gen.lib import Note
-from gramps.gen.proxy.cache import CacheProxyDb
 
 _ = glocale.translation.gettext
 
@@ -69,17 +71,231 @@ gender_map = {
 }
 
 from supertool_utils import makedate
+import supertool_ancestry
 
 class SupertoolException(RuntimeError):
     pass
 
 
+class ObjectCache:
+    """
+    Bounded LRU cache of Gramps objects, shared by all proxies created
+    during one query run. Wraps a database like CacheProxyDb: the
+    get_*_from_handle methods are cached, the commit_* methods drop the
+    committed object from the cache and everything else is delegated.
+
+    The cache is also an identity map for the proxies: proxy() returns the
+    same proxy object for the same handle as long as it stays in the cache.
+    A proxy for an explicitly given object (the object currently processed
+    by the query, possibly modified by the statements) is always recreated.
+    """
+
+    DEFAULT_SIZE = 100000
+
+    def __init__(self, db, size=DEFAULT_SIZE):
+        # type: (DbGeneric, int) -> None
+        self.db = db
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.fetches = collections.Counter()  # type: collections.Counter # misses per object type
+        self.reads = None  # type: Optional[Set[Tuple[str,str]]] # keys read, when tracking dependencies
+        self.objects = collections.OrderedDict()  # type: collections.OrderedDict
+        self.proxies = collections.OrderedDict()  # type: collections.OrderedDict
+        self.changes = 0  # number of objects invalidated, i.e. committed
+
+    def __getattr__(self, attrname):
+        # type: (str) -> Any
+        return getattr(self.db, attrname)
+
+    def __repr__(self):
+        # type: () -> str
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return "cache hits: {}, misses: {} ({:.0f}%)".format(
+            self.hits, self.misses, rate
+        )
+
+    def _put(self, table, key, value):
+        # type: (collections.OrderedDict, Tuple[str,str], Any) -> None
+        table[key] = value
+        if len(table) > self.size:
+            table.popitem(last=False)
+
+    def _get(self, objtype, handle, getfunc):
+        # type: (str, str, Callable) -> Any
+        if isinstance(handle, bytes):
+            handle = str(handle, "utf-8")
+        key = (objtype, handle)
+        if self.reads is not None:
+            self.reads.add(key)
+        obj = self.objects.get(key)
+        if obj is not None:
+            self.hits += 1
+            self.objects.move_to_end(key)
+            return obj
+        self.misses += 1
+        self.fetches[objtype] += 1
+        obj = getfunc(handle)
+        self._put(self.objects, key, obj)
+        return obj
+
+    def proxy(self, proxyclass, handle, obj=None):
+        # type: (Type[Proxy], str, Optional[PrimaryObject]) -> Proxy
+        key = (proxyclass.namespace, handle)
+        p = self.proxies.get(key)
+        if p is not None and obj is None:
+            self.proxies.move_to_end(key)
+            return p
+        p = proxyclass(self, handle, obj)
+        if obj is not None:
+            self._put(self.objects, key, obj)
+        self._put(self.proxies, key, p)
+        return p
+
+    def find_backlink_handles(self, handle, include_classes=None):
+        # type: (str, Optional[List[str]]) -> Any
+        # the result changes whenever a referring object is added, edited or
+        # deleted, so the dependency is on all objects of the referring types
+        self.depends_on_table(*(include_classes or ["*"]))
+        return self.db.find_backlink_handles(handle, include_classes)
+
+    def depends_on_table(self, *objtypes):
+        # type: (str) -> None
+        "Record that the current object depends on all objects of these types"
+        if self.reads is not None:
+            for objtype in objtypes:
+                self.reads.add(("table", objtype))
+
+    def invalidate(self, objtype, handle):
+        # type: (str, str) -> None
+        self.objects.pop((objtype, handle), None)
+        p = self.proxies.pop((objtype, handle), None)
+        if p is not None:
+            p._memo.clear()  # the proxy may still be referenced by the script
+        self.changes += 1
+
+    def clear(self):
+        # type: () -> None
+        for p in self.proxies.values():
+            p._memo.clear()
+        self.objects.clear()
+        self.proxies.clear()
+
+    def get_person_from_handle(self, handle):
+        # type: (str) -> Any
+        return self._get("Person", handle, self.db.get_person_from_handle)
+
+    def get_family_from_handle(self, handle):
+        # type: (str) -> Any
+        return self._get("Family", handle, self.db.get_family_from_handle)
+
+    def get_event_from_handle(self, handle):
+        # type: (str) -> Any
+        return self._get("Event", handle, self.db.get_event_from_handle)
+
+    def get_place_from_handle(self, handle):
+        # type: (str) -> Any
+        return self._get("Place", handle, self.db.get_place_from_handle)
+
+    def get_citation_from_handle(self, handle):
+        # type: (str) -> Any
+        return self._get("Citation", handle, self.db.get_citation_from_handle)
+
+    def get_source_from_handle(self, handle):
+        # type: (str) -> Any
+        return self._get("Source", handle, self.db.get_source_from_handle)
+
+    def get_repository_from_handle(self, handle):
+        # type: (str) -> Any
+        return self._get("Repository", handle, self.db.get_repository_from_handle)
+
+    def get_media_from_handle(self, handle):
+        # type: (str) -> Any
+        return self._get("Media", handle, self.db.get_media_from_handle)
+
+    def get_note_from_handle(self, handle):
+        # type: (str) -> Any
+        return self._get("Note", handle, self.db.get_note_from_handle)
+
+    def get_tag_from_handle(self, handle):
+        # type: (str) -> Any
+        return self._get("Tag", handle, self.db.get_tag_from_handle)
+
+    def commit_person(self, obj, trans, *args):
+        # type: (Any, DbTxn, Any) -> None
+        self.invalidate("Person", obj.handle)
+        self.db.commit_person(obj, trans, *args)
+
+    def commit_family(self, obj, trans, *args):
+        # type: (Any, DbTxn, Any) -> None
+        self.invalidate("Family", obj.handle)
+        self.db.commit_family(obj, trans, *args)
+
+    def commit_event(self, obj, trans, *args):
+        # type: (Any, DbTxn, Any) -> None
+        self.invalidate("Event", obj.handle)
+        self.db.commit_event(obj, trans, *args)
+
+    def commit_place(self, obj, trans, *args):
+        # type: (Any, DbTxn, Any) -> None
+        self.invalidate("Place", obj.handle)
+        self.db.commit_place(obj, trans, *args)
+
+    def commit_citation(self, obj, trans, *args):
+        # type: (Any, DbTxn, Any) -> None
+        self.invalidate("Citation", obj.handle)
+        self.db.commit_citation(obj, trans, *args)
+
+    def commit_source(self, obj, trans, *args):
+        # type: (Any, DbTxn, Any) -> None
+        self.invalidate("Source", obj.handle)
+        self.db.commit_source(obj, trans, *args)
+
+    def commit_repository(self, obj, trans, *args):
+        # type: (Any, DbTxn, Any) -> None
+        self.invalidate("Repository", obj.handle)
+        self.db.commit_repository(obj, trans, *args)
+
+    def commit_media(self, obj, trans, *args):
+        # type: (Any, DbTxn, Any) -> None
+        self.invalidate("Media", obj.handle)
+        self.db.commit_media(obj, trans, *args)
+
+    def commit_note(self, obj, trans, *args):
+        # type: (Any, DbTxn, Any) -> None
+        self.invalidate("Note", obj.handle)
+        self.db.commit_note(obj, trans, *args)
+
+    def commit_tag(self, obj, trans, *args):
+        # type: (Any, DbTxn, Any) -> None
+        self.invalidate("Tag", obj.handle)
+        self.db.commit_tag(obj, trans, *args)
+
+
+def get_cache(db):
+    # type: (Union[DbGeneric, ObjectCache]) -> ObjectCache
+    "Return db itself if it is already a shared cache, otherwise a private one"
+    if isinstance(db, ObjectCache):
+        return db
+    return ObjectCache(db)
+
+
 def listproperty(orig):
     # type: (Any) -> Any
+    # the list is computed once per proxy object (and again after the object
+    # has been committed through the cache); a copy is returned so that the
+    # caller can modify it freely
+    name = orig.__name__
+
     @functools.wraps(orig)
-    def f(*args):
+    def f(self):
         # type: (Any) -> Any
-        return list(orig(*args))
+        values = self._memo.get(name)
+        if values is None:
+            values = list(orig(self))
+            self._memo[name] = values
+        return list(values)
 
     return property(f)
 
@@ -98,8 +314,9 @@ def gentolist(orig):
 class Proxy:
     def __init__(self, db, handle, obj=None):
         # type: (DbGeneric, str, PrimaryObject) -> None
-        self.db = CacheProxyDb(db)
+        self.db = get_cache(db)
         self.handle = handle
+        self._memo = {}  # type: Dict[str, List[Any]]
 
     def __eq__(self, other):
         # type: (Any, Any) -> bool
@@ -130,23 +347,23 @@ class Proxy:
             self.handle, include_classes=[reftype]
         ):
             if reftype == "Person":
-                yield PersonProxy(self.db, handle)
+                yield self.db.proxy(PersonProxy, handle)
             if reftype == "Family":
-                yield FamilyProxy(self.db, handle)
+                yield self.db.proxy(FamilyProxy, handle)
             if reftype == "Event":
-                yield EventProxy(self.db, handle)
+                yield self.db.proxy(EventProxy, handle)
             if reftype == "Place":
-                yield PlaceProxy(self.db, handle)
+                yield self.db.proxy(PlaceProxy, handle)
             if reftype == "Source":
-                yield SourceProxy(self.db, handle)
+                yield self.db.proxy(SourceProxy, handle)
             if reftype == "Citation":
-                yield CitationProxy(self.db, handle)
+                yield self.db.proxy(CitationProxy, handle)
             if reftype == "Repository":
-                yield RepositoryProxy(self.db, handle)
+                yield self.db.proxy(RepositoryProxy, handle)
             if reftype == "Media":
-                yield MediaProxy(self.db, handle)
+                yield self.db.proxy(MediaProxy, handle)
             if reftype == "Note":
-                yield NoteProxy(self.db, handle)
+                yield self.db.proxy(NoteProxy, handle)
 
 class AttributeProxy:
     @listproperty
@@ -272,20 +489,20 @@ class CommonProxy(Proxy):
     def citations(self):
         # type: (Any) -> Iterator
         for handle in self.obj.get_citation_list():
-            yield CitationProxy(self.db, handle)
+            yield self.db.proxy(CitationProxy, handle)
 
     @listproperty
     def notes(self):
         # type: (Any) -> Iterator
         for handle in self.obj.get_note_list():
-            yield NoteProxy(self.db, handle)
+            yield self.db.proxy(NoteProxy, handle)
 
 class MediaListProxy:
     @listproperty
     def media_list(self):
         # type: (Any) -> Iterator
         for mediaref in self.obj.get_media_list():
-            yield MediaProxy(self.db, mediaref.ref)
+            yield self.db.proxy(MediaProxy, mediaref.ref)
 
 class NoteProxy(Proxy):
     namespace = "Note"
@@ -342,13 +559,13 @@ class CitationProxy(Proxy, AttributeProxy, MediaListProxy):
         handle = self.obj.get_reference_handle()
         if not handle:
             return nullproxy
-        return SourceProxy(self.db, handle)
+        return self.db.proxy(SourceProxy, handle)
 
     @listproperty
     def notes(self):
         # type: () -> Iterator[NoteProxy]
         for handle in self.obj.get_note_list():
-            yield NoteProxy(self.db, handle)
+            yield self.db.proxy(NoteProxy, handle)
 
     @property
     def note(self):
@@ -364,11 +581,11 @@ class CitationProxy(Proxy, AttributeProxy, MediaListProxy):
         for _, handle in self.db.find_backlink_handles(
             self.handle, include_classes=["Event"]
         ):
-            yield EventProxy(self.db, handle)
+            yield self.db.proxy(EventProxy, handle)
         for _, handle in self.db.find_backlink_handles(
             self.handle, include_classes=["Person"]
         ):
-            yield PersonProxy(self.db, handle)
+            yield self.db.proxy(PersonProxy, handle)
 
 
 class SourceProxy(Proxy, AttributeProxy, MediaListProxy):
@@ -397,7 +614,7 @@ class SourceProxy(Proxy, AttributeProxy, MediaListProxy):
     def repositories(self):
         # type: () -> Iterator[RepositoryProxy]
         for reporef in self.source.get_reporef_list():
-            yield RepositoryProxy(self.db, reporef.ref)
+            yield self.db.proxy(RepositoryProxy, reporef.ref)
 
     @listproperty
     def citations(self):
@@ -405,13 +622,13 @@ class SourceProxy(Proxy, AttributeProxy, MediaListProxy):
         for _, handle in self.db.find_backlink_handles(
             self.handle, include_classes=["Citation"]
         ):
-            yield CitationProxy(self.db, handle)
+            yield self.db.proxy(CitationProxy, handle)
 
     @listproperty
     def notes(self):
         # type: () -> Iterator[NoteProxy]
         for handle in self.obj.get_note_list():
-            yield NoteProxy(self.db, handle)
+            yield self.db.proxy(NoteProxy, handle)
 
 
 class RepositoryProxy(Proxy):
@@ -440,13 +657,13 @@ class RepositoryProxy(Proxy):
         for _, handle in self.db.find_backlink_handles(
             self.handle, include_classes=["Source"]
         ):
-            yield SourceProxy(self.db, handle)
+            yield self.db.proxy(SourceProxy, handle)
 
     @listproperty
     def notes(self):
         # type: () -> Iterator[NoteProxy]
         for handle in self.obj.get_note_list():
-            yield NoteProxy(self.db, handle)
+            yield self.db.proxy(NoteProxy, handle)
 
 
 class PlaceProxy(CommonProxy, MediaListProxy):
@@ -505,7 +722,7 @@ class PlaceProxy(CommonProxy, MediaListProxy):
     def enclosed_by(self):
         # type: () -> Iterator[PlaceProxy]
         for placeref in self.place.get_placeref_list():
-            yield PlaceProxy(self.db, placeref.ref)
+            yield self.db.proxy(PlaceProxy, placeref.ref)
 
     @listproperty
     def encloses(self):
@@ -513,7 +730,7 @@ class PlaceProxy(CommonProxy, MediaListProxy):
         for _, handle in self.db.find_backlink_handles(
             self.handle, include_classes=["Place"]
         ):
-            yield PlaceProxy(self.db, handle)
+            yield self.db.proxy(PlaceProxy, handle)
 
     @property
     def events(self):
@@ -553,7 +770,7 @@ class EventProxy(CommonProxy, AttributeProxy, MediaListProxy):
         handle = self.event.get_place_handle()
         if not handle:
             return nullproxy
-        return PlaceProxy(self.db, handle)
+        return self.db.proxy(PlaceProxy, handle)
 
     @property
     def placename(self):
@@ -588,12 +805,12 @@ class EventProxy(CommonProxy, AttributeProxy, MediaListProxy):
             if class_name == "Family":
                 family = self.db.get_family_from_handle(referrer_handle)
                 if family.father_handle:
-                    yield PersonProxy(self.db, family.father_handle)
+                    yield self.db.proxy(PersonProxy, family.father_handle)
                 if family.mother_handle:
-                    yield PersonProxy(self.db, family.mother_handle)
+                    yield self.db.proxy(PersonProxy, family.mother_handle)
             if class_name == "Person":
                 # print(role,type(role),self.list[2],role != self.list[2])
-                yield PersonProxy(self.db, referrer_handle)
+                yield self.db.proxy(PersonProxy, referrer_handle)
 
     def get_role_of_eventref(self, db, referrer_handle, event_handle):
         # type: (Any, Any, Any, Any) -> Any
@@ -668,7 +885,7 @@ class PersonProxy(CommonProxy, AttributeProxy, MediaListProxy):
         eventref = self.person.get_birth_ref()
         if not eventref:
             return nullproxy
-        return EventProxy(self.db, eventref.ref)
+        return self.db.proxy(EventProxy, eventref.ref)
 
     @property
     def death(self):
@@ -676,7 +893,7 @@ class PersonProxy(CommonProxy, AttributeProxy, MediaListProxy):
         eventref = self.person.get_death_ref()
         if not eventref:
             return nullproxy
-        return EventProxy(self.db, eventref.ref)
+        return self.db.proxy(EventProxy, eventref.ref)
 
     @listproperty
     def events(self):
@@ -688,13 +905,13 @@ class PersonProxy(CommonProxy, AttributeProxy, MediaListProxy):
     def families(self):
         # type: () -> Iterator[FamilyProxy]
         for handle in self.person.get_family_handle_list():
-            yield FamilyProxy(self.db, handle)
+            yield self.db.proxy(FamilyProxy, handle)
 
     @listproperty
     def children(self):
         # type: () -> Iterator[PersonProxy]
         for handle in self.person.get_family_handle_list():
-            f = FamilyProxy(self.db, handle)
+            f = self.db.proxy(FamilyProxy, handle)
             for c in f.children:
                     yield c
 
@@ -702,7 +919,7 @@ class PersonProxy(CommonProxy, AttributeProxy, MediaListProxy):
     def spouses(self):
         # type: () -> Iterator[PersonProxy]
         for handle in self.person.get_family_handle_list():
-            f = FamilyProxy(self.db, handle)
+            f = self.db.proxy(FamilyProxy, handle)
             if f.father and f.father.handle != self.handle:
                 if TYPE_CHECKING:
                     assert isinstance(f.father, PersonProxy)
@@ -716,13 +933,13 @@ class PersonProxy(CommonProxy, AttributeProxy, MediaListProxy):
     def parent_families(self):
         # type: () -> Iterator[FamilyProxy]
         for handle in self.person.get_parent_family_handle_list():
-            yield FamilyProxy(self.db, handle)
+            yield self.db.proxy(FamilyProxy, handle)
 
     @listproperty
     def parents(self):
         # type: () -> Iterator[PersonProxy]
         for handle in self.person.get_parent_family_handle_list():
-            f = FamilyProxy(self.db, handle)
+            f = self.db.proxy(FamilyProxy, handle)
             father = f.father
             if father: 
                 if TYPE_CHECKING:
@@ -734,11 +951,42 @@ class PersonProxy(CommonProxy, AttributeProxy, MediaListProxy):
                     assert isinstance(mother, PersonProxy)
                 yield mother
 
+    @listproperty
+    def ancestors(self):
+        # type: () -> Iterator[PersonProxy]
+        self.db.depends_on_table("Person", "Family")
+        index = supertool_ancestry.get_index(self.db.db)
+        for handle in index.ancestors(self.handle):
+            yield self.db.proxy(PersonProxy, handle)
+
+    @listproperty
+    def descendants(self):
+        # type: () -> Iterator[PersonProxy]
+        self.db.depends_on_table("Person", "Family")
+        index = supertool_ancestry.get_index(self.db.db)
+        for handle in index.descendants(self.handle):
+            yield self.db.proxy(PersonProxy, handle)
+
+    def generation_of(self, other):
+        # type: (Union[PersonProxy, str]) -> Optional[int]
+        "Generations up to an ancestor (positive) or down to a descendant (negative)"
+        other_handle = other if isinstance(other, str) else other.handle
+        self.db.depends_on_table("Person", "Family")
+        index = supertool_ancestry.get_index(self.db.db)
+        return index.generation_of(self.handle, other_handle)
+
+    def is_ancestor_of(self, other):
+        # type: (Union[PersonProxy, str]) -> bool
+        other_handle = other if isinstance(other, str) else other.handle
+        self.db.depends_on_table("Person", "Family")
+        index = supertool_ancestry.get_index(self.db.db)
+        return index.is_ancestor_of(self.handle, other_handle)
+
     @property
     def mother(self):
         # type: () -> Union[PersonProxy, NullProxy]
         for handle in self.person.get_parent_family_handle_list():
-            f = FamilyProxy(self.db, handle)
+            f = self.db.proxy(FamilyProxy, handle)
             return f.mother
         return nullproxy
 
@@ -746,7 +994,7 @@ class PersonProxy(CommonProxy, AttributeProxy, MediaListProxy):
     def father(self):
         # type: () -> Union[PersonProxy, NullProxy]
         for handle in self.person.get_parent_family_handle_list():
-            f = FamilyProxy(self.db, handle)
+            f = self.db.proxy(FamilyProxy, handle)
             return f.father
         return nullproxy
 
@@ -754,7 +1002,7 @@ class PersonProxy(CommonProxy, AttributeProxy, MediaListProxy):
     def citations(self):
         # type: () -> Iterator[CitationProxy]
         for handle in self.obj.get_citation_list():
-            yield CitationProxy(self.db, handle)
+            yield self.db.proxy(CitationProxy, handle)
 
 
 class FamilyProxy(CommonProxy, AttributeProxy, MediaListProxy):
@@ -780,7 +1028,7 @@ class FamilyProxy(CommonProxy, AttributeProxy, MediaListProxy):
     def events(self):
         # type: () -> Iterator[EventProxy]
         for eventref in self.family.get_event_ref_list():
-            yield EventProxy(self.db, eventref.ref)
+            yield self.db.proxy(EventProxy, eventref.ref)
 
     @property
     def father(self):
@@ -788,7 +1036,7 @@ class FamilyProxy(CommonProxy, AttributeProxy, MediaListProxy):
         handle = self.family.get_father_handle()
         if handle is None:
             return nullproxy
-        return PersonProxy(self.db, handle)
+        return self.db.proxy(PersonProxy, handle)
 
     @property
     def mother(self):
@@ -796,13 +1044,13 @@ class FamilyProxy(CommonProxy, AttributeProxy, MediaListProxy):
         handle = self.family.get_mother_handle()
         if handle is None:
             return nullproxy
-        return PersonProxy(self.db, handle)
+        return self.db.proxy(PersonProxy, handle)
 
     @listproperty
     def children(self):
         # type: () -> Iterator[PersonProxy]
         for childref in self.family.get_child_ref_list():
-            yield PersonProxy(self.db, childref.ref)
+            yield self.db.proxy(PersonProxy, childref.ref)
 
 
 class MediaProxy(CommonProxy, AttributeProxy):
@@ -829,22 +1077,85 @@ class MediaProxy(CommonProxy, AttributeProxy):
         db.commit_media(self.obj, trans)
 
 class Filterfactory:
-    filterdb = None
+    """
+    Implements the 'filter' function for the user code. There is one
+    instance per database (i.e. per query run since each run has its own
+    ObjectCache). A named filter is applied once to all objects processed by
+    the query; other objects are checked one at a time and the results are
+    remembered.
+    """
+    filterdb = None  # type: Optional[FilterList]
+    filterdb_mtime = None  # type: Optional[float]
+    instances = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
 
     def __init__(self, db):
         # type: (DbGeneric) -> None
         self.db = db
+        self.candidates = {}  # type: Dict[str, Set[str]]
+        self.filterfuncs = {}  # type: Dict[Tuple[str,str], Callable]
+
+    @staticmethod
+    def for_db(db):
+        # type: (DbGeneric) -> Filterfactory
+        filterfactory = Filterfactory.instances.get(db)
+        if filterfactory is None:
+            filterfactory = Filterfactory(db)
+            Filterfactory.instances[db] = filterfactory
+        return filterfactory
+
+    @staticmethod
+    def get_filterdb():
+        # type: () -> FilterList
+        # reload only if custom_filters.xml has changed
+        try:
+            mtime = os.path.getmtime(CUSTOM_FILTERS)  # type: Optional[float]
+        except OSError:
+            mtime = None
+        if Filterfactory.filterdb is None or mtime != Filterfactory.filterdb_mtime:
+            Filterfactory.filterdb = FilterList(CUSTOM_FILTERS)
+            Filterfactory.filterdb.load()
+            Filterfactory.filterdb_mtime = mtime
+        return Filterfactory.filterdb
+
+    def set_candidates(self, namespace, handles):
+        # type: (str, List[str]) -> None
+        "Set the handles that the query will process in this namespace"
+        self.candidates[namespace] = set(handles)
+        self.filterfuncs = {}
+
+    def make_filterfunc(self, filt, namespace):
+        # type: (Any, str) -> Callable
+        candidates = self.candidates.get(namespace, set())
+        matches = set()  # type: Set[str]
+        if candidates:
+            matches = set(filt.apply(self.db, list(candidates)))
+        others = {}  # type: Dict[str, bool]
+
+        def check(obj):
+            # type: (Proxy) -> bool
+            handle = obj.handle
+            if handle in candidates:
+                return handle in matches
+            ok = others.get(handle)
+            if ok is None:
+                ok = filt.apply(self.db, [handle]) != []
+                others[handle] = ok
+            return ok
+
+        return check
 
     def getfilter(self, namespace):
         # type: (str) -> Callable
         def filterfunc(filtername, namespace=namespace):
             # type: (str, str) -> Callable
-            if 1 or not Filterfactory.filterdb:
-                Filterfactory.filterdb = FilterList(CUSTOM_FILTERS)
-                Filterfactory.filterdb.load()
-            filter_dict = Filterfactory.filterdb.get_filters_dict(namespace)
-            filt = filter_dict[filtername]
-            return lambda obj: filt.apply(self.db, [obj.handle]) != []
+            key = (namespace, filtername)
+            func = self.filterfuncs.get(key)
+            if func is None:
+                filter_dict = self.get_filterdb().get_filters_dict(namespace)
+                filt = filter_dict[filtername]
+                func = self.make_filterfunc(filt, namespace)
+                self.filterfuncs[key] = func
+            return func
 
         return filterfunc
 
@@ -859,15 +1170,16 @@ def execute(dbstate, obj, code, proxyclass, env, exectype):
     # type: (DbState, PrimaryObject, str, Any, Any, str) -> Tuple[Any, Dict]
     env["env"] = env
     env["code"] = code
+    # attribute values are reused only within one expression
+    cache_values = exectype != "exec"
     if obj:
-        p = proxyclass(dbstate.db, obj.handle, obj)
+        p = get_cache(dbstate.db).proxy(proxyclass, obj.handle, obj)
         env["self"] = p
-        env.obj = p # for Lazyenv
         get_attrs(proxyclass, p)
-        env.attrs = proxyclass._attrs.copy()
+        env.set_object(p, proxyclass._attrs, cache_values) # for Lazyenv
     else:
-        env.attrs = set()
-    filterfactory = Filterfactory(dbstate.db)
+        env.set_object(None, frozenset())
+    filterfactory = Filterfactory.for_db(dbstate.db)
     if proxyclass:
         env["filter"] = filterfactory.getfilter(proxyclass.namespace)
 
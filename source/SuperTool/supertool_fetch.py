@@ -0,0 +1,193 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2026      Kari Kujansuu
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""
+Reading the processed objects from the database in batches.
+
+iter_objects() yields the objects for a list of handles, in the same order,
+without reading each object with a separate database call:
+
+- if the handles are the list from db.get_person_handles() etc. as such
+  (storage_order=True), the table is read in the same order with
+  db.iter_people() etc.
+- otherwise, for SQL databases, the objects are read with one
+  "WHERE handle IN (...)" query per chunk of handles (if that fails, e.g.
+  because of a different database schema, the reason is printed to stderr
+  and the rest of the objects are read one by one)
+- otherwise (or for a handle that was not found this way) the object is read
+  with db.get_person_from_handle() etc.
+
+The objects are read only when needed, at most one chunk ahead, so stopping
+the iteration early does not read the rest of the objects.
+"""
+
+# -------------------------------------------------------------------------
+#
+# Standard Python modules
+#
+# -------------------------------------------------------------------------
+import pickle
+import sqlite3
+import sys
+
+try:
+    from typing import Any
+    from typing import Callable
+    from typing import Dict
+    from typing import Iterator
+    from typing import List
+    from typing import Optional
+    from gramps.gen.db import DbGeneric
+except:
+    pass
+
+# errors from a database whose tables or data are not as expected
+READ_ERRORS = (sqlite3.Error, pickle.UnpicklingError, ValueError, TypeError)  # type: tuple
+try:
+    import psycopg2  # type: ignore # the PostgreSQL backend
+
+    READ_ERRORS += (psycopg2.Error,)
+except ImportError:
+    pass
+
+CHUNK_SIZE = 500  # handles per IN (...) query
+MAX_AHEAD = 10000  # objects kept when the storage order differs from the handle order
+
+PLURALS = {
+    "Person": "people",
+    "Family": "families",
+    "Event": "events",
+    "Place": "places",
+    "Citation": "citations",
+    "Source": "sources",
+    "Repository": "repositories",
+    "Media": "media",
+    "Note": "notes",
+}
+
+
+def iter_objects(
+    db, context, handles, chunk_size=CHUNK_SIZE, fetches=None, storage_order=False
+):
+    # type: (DbGeneric, Any, List[str], int, Any, bool) -> Iterator[Any]
+    """
+    Yield the objects for the handles. The number of objects read in
+    batches is added to fetches[objclass] (a Counter) if given.
+    """
+    getfunc = context.getfunc
+    objclass = context.objclass
+    if len(handles) < 2 or chunk_size < 2 or objclass not in PLURALS:
+        for handle in handles:
+            yield getfunc(handle)
+        return
+    plural = PLURALS[objclass]
+    iterfunc = getattr(db, "iter_" + plural, None)
+    if storage_order and iterfunc:
+        yield from iter_storage_order(iterfunc, getfunc, handles, objclass, fetches)
+        return
+    read_chunk = chunk_reader(db, context)
+    if read_chunk:
+        yield from iter_chunks(read_chunk, getfunc, handles, chunk_size, objclass, fetches)
+        return
+    for handle in handles:
+        yield getfunc(handle)
+
+
+def iter_storage_order(iterfunc, getfunc, handles, objclass, fetches):
+    # type: (Callable, Callable, List[str], str, Any) -> Iterator[Any]
+    objects = iterfunc()
+    ahead = {}  # type: Dict[str, Any]
+    exhausted = False
+    for handle in handles:
+        obj = ahead.pop(handle, None)
+        while obj is None and not exhausted:
+            o = next(objects, None)
+            if o is None:
+                exhausted = True
+            elif o.handle == handle:
+                obj = o
+            elif len(ahead) < MAX_AHEAD:
+                ahead[o.handle] = o
+            if o is not None and fetches is not None:
+                fetches[objclass] += 1
+        if obj is None:
+            obj = getfunc(handle)
+        yield obj
+
+
+def chunk_reader(db, context):
+    # type: (DbGeneric, Any) -> Optional[Callable[[List[str]], Dict[str, Any]]]
+    "Return a function that reads a list of handles with one SQL query, if possible"
+    dbapi = getattr(db, "dbapi", None)
+    if dbapi is None:
+        return None
+    objcls = context.objcls
+    table = context.objclass.lower()
+    serializer = getattr(db, "serializer", None)
+    if serializer is None:
+        # Gramps 5.x: pickled tuples in the blob_data column
+        field = "blob_data"
+
+        def to_object(data):
+            # type: (Any) -> Any
+            return objcls().unserialize(pickle.loads(data))
+
+    elif hasattr(serializer, "data_to_object") and hasattr(
+        serializer, "string_to_data"
+    ):
+        field = serializer.data_field
+
+        def to_object(data):
+            # type: (Any) -> Any
+            return serializer.data_to_object(serializer.string_to_data(data), objcls)
+
+    else:
+        return None
+
+    def read_chunk(handles):
+        # type: (List[str]) -> Dict[str, Any]
+        sql = "SELECT handle, {} FROM {} WHERE handle IN ({})".format(
+            field, table, ",".join("?" * len(handles))
+        )
+        dbapi.execute(sql, handles)
+        return {handle: to_object(data) for handle, data in dbapi.fetchall()}
+
+    return read_chunk
+
+
+def iter_chunks(read_chunk, getfunc, handles, chunk_size, objclass, fetches):
+    # type: (Callable, Callable, List[str], int, str, Any) -> Iterator[Any]
+    for start in range(0, len(handles), chunk_size):
+        chunk = handles[start : start + chunk_size]
+        objects = {}  # type: Dict[str, Any]
+        if read_chunk:
+            try:
+                objects = read_chunk(chunk)
+            except READ_ERRORS as e:
+                print("Reading objects one by one:", e, file=sys.stderr)
+                read_chunk = None
+        if fetches is not None:
+            fetches[objclass] += len(objects)
+        for handle in chunk:
+            obj = objects.get(handle)
+            if obj is None:
+                obj = getfunc(handle)
+            yield obj
+
@@ -27,6 +27,8 @@ import functools
 import sys
 import traceback
 
+from types import SimpleNamespace
+
 try:
     from typing import TYPE_CHECKING
     from typing import Any
@@ -64,6 +66,7 @@ _ = glocale.translation.gettext
 #
 # -------------------------------------------------------------------------
 import supertool_engine as engine
+import supertool_columns
 import supertool_utils
 
 # -------------------------------------------------------------------------
@@ -140,47 +143,55 @@ class GenericFilterRule(Rule):
         self.db = db
         self.user = user
         dbstate = self  # self emulates dbstate (i.e. contains dbstate.db)
+        # one object cache shared by all proxies while this filter is applied
+        self.cache = engine.ObjectCache(db)
+        self.proxy_dbstate = SimpleNamespace(db=self.cache)
         self.rule = self.list[0].replace("<br>", " ").strip()
+        self.rule = supertool_utils.compile_expression(self.rule, "filter")
 
         context = supertool_utils.get_context(db, self.category_name)
 
         self.initial_statements = self.list[1].replace("<br>", "\n").strip()
         self.initial_statements, files = supertool_utils.process_includes(self.initial_statements)
-        self.initial_statements = compile(self.initial_statements, "initial_statements", 'exec')
+        self.initial_statements = supertool_utils.compile_statements(self.initial_statements, "initial_statements")
 
         self.statements = self.list[2].replace("<br>", "\n").strip()
         self.statements, files = supertool_utils.process_includes(self.statements)
-        self.statements = compile(self.statements, "statements", 'exec')
+        self.statements = supertool_utils.compile_statements(self.statements, "statements")
 
         self.init_env = supertool_utils.get_globals()  # type: Dict[str,Any]
         self.init_env["trans"] = None
         self.init_env["user"] = user
         self.init_env["uistate"] = user.uistate 
         self.init_env["dbstate"] = dbstate
-        self.init_env["db"] = db
+        self.init_env["db"] = self.cache
 
         self.init_env["result"] = None
         self.init_env["category"] = self.category_name
         self.init_env["namespace"] = context.objclass
-        self.init_env["getproxy"] = functools.partial(supertool_utils.getproxy, db)
+        self.init_env["getproxy"] = functools.partial(supertool_utils.getproxy, self.cache)
         self.init_env["getargs"] = functools.partial(supertool_utils.getargs_dialog, dbstate, user.uistate, True)
+        self.init_env["snapshot"] = functools.partial(supertool_columns.snapshot, db)
 
         s = self.initial_statements
         if s:
             value, self.init_env = self.execute_func(
-                dbstate, None, s, self.init_env, "exec"
+                self.proxy_dbstate, None, s, self.init_env, "exec"
             )
 
     def apply(self, db, obj):
         # type: (DbGeneric, PrimaryObject) -> bool
         self.db = db
-        dbstate = self  # self emulates dbstate
+        dbstate = self.proxy_dbstate
         try:
-            env = supertool_utils.Lazyenv()
-            env.update(self.init_env)
+            # variables set for this object go in a fresh overlay,
+            # the initial environment is shared and not copied
+            env = supertool_utils.Lazyenv(parent=self.init_env)
             s = self.statements
             if s:
                 value, env = self.execute_func(dbstate, obj, s, env, "exec")
+            if self.rule is None:
+                return True
             res, env = self.execute_func(dbstate, obj, self.rule, env)
             return res
         except Exception as e:
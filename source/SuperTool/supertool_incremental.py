@@ -0,0 +1,340 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2026      Kari Kujansuu
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""
+Incremental execution of SuperTool queries.
+
+The rows generated for each object are saved together with the keys of the
+objects that were read while processing it (its dependencies). When the same
+query is run again for the same family tree, only the objects that are new
+or whose dependencies have changed are processed again; the saved rows are
+used for the others.
+
+Changes are found with the Gramps database signals (*-add, *-update and
+*-delete) while Gramps is running. Results saved by an earlier Gramps
+session are checked against the change times of the dependencies.
+
+Properties computed from back references (e.g. the citations of a source)
+and from the ancestry index depend on all objects of the referring types;
+they are recorded as ("table", type) dependencies, which are invalidated by
+a change to any object of that type.
+
+This assumes that the rows of an object depend only on the objects that the
+query reads while processing it. Variables that carry values from one object
+to the next, named custom filters and summaries are not tracked; queries
+with initial statements or with the properties listed in BACKLINK_NAMES are
+not run incrementally.
+"""
+
+# -------------------------------------------------------------------------
+#
+# Standard Python modules
+#
+# -------------------------------------------------------------------------
+import functools
+import hashlib
+import json
+import os
+import pickle
+import re
+import sys
+import uuid
+import weakref
+
+try:
+    from typing import Any
+    from typing import Dict
+    from typing import Generator
+    from typing import List
+    from typing import Optional
+    from typing import Set
+    from typing import Tuple
+    from gramps.gen.db import DbGeneric
+except:
+    pass
+
+# -------------------------------------------------------------------------
+#
+# Gramps modules
+#
+# -------------------------------------------------------------------------
+try:
+    from gramps.gen.const import USER_CACHE
+except ImportError:
+    from gramps.gen.const import USER_PLUGINS as USER_CACHE
+
+# -------------------------------------------------------------------------
+#
+# Local modules
+#
+# -------------------------------------------------------------------------
+import supertool_engine as engine
+
+STEP_INTERVAL = 100
+STATE_DIR = os.path.join(USER_CACHE, "SuperTool", "incremental")
+
+OBJTYPES = {
+    "person": "Person",
+    "family": "Family",
+    "event": "Event",
+    "place": "Place",
+    "citation": "Citation",
+    "source": "Source",
+    "repository": "Repository",
+    "media": "Media",
+    "note": "Note",
+}
+
+# properties that only read back references; every change to the referring
+# objects would make the saved rows of all objects out of date
+BACKLINK_NAMES = ("referrers", "citators", "encloses", "participants", "refs")
+BACKLINK_RE = re.compile(r"\b(?:{})\b".format("|".join(BACKLINK_NAMES)))
+
+_trackers = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+_states = {}  # type: Dict[str, Dict[str, Any]] # latest state per query in this session
+
+
+class ChangeTracker:
+    "Records the objects changed in a database while Gramps is running"
+
+    def __init__(self, db):
+        # type: (DbGeneric) -> None
+        self.session = uuid.uuid4().hex
+        self.serial = 0
+        self.changes = {}  # type: Dict[Tuple[str,str], int]
+        for prefix, objtype in OBJTYPES.items():
+            for action in ("add", "update", "delete"):
+                db.connect(prefix + "-" + action, functools.partial(self.changed, objtype))
+
+    def changed(self, objtype, handles):
+        # type: (str, List[str]) -> None
+        self.serial += 1
+        for handle in handles:
+            self.changes[(objtype, handle)] = self.serial
+
+    def changed_since(self, serial):
+        # type: (int) -> Set[Tuple[str,str]]
+        return {key for key, s in self.changes.items() if s > serial}
+
+
+def get_tracker(db):
+    # type: (DbGeneric) -> ChangeTracker
+    tracker = _trackers.get(db)
+    if tracker is None:
+        tracker = _trackers[db] = ChangeTracker(db)
+    return tracker
+
+
+def check_incremental(gramps_engine, result):
+    # type: (Any, Any) -> str
+    "Return the reason why the query cannot be run incrementally, or ''"
+    query = gramps_engine.query
+    if not gramps_engine.context.objclass:
+        return "no objects to process"
+    if query.summary_only:
+        return "'Summary only' is selected"
+    if query.commit_changes:
+        return "'Commit changes' is selected"
+    if result.max or result.read_limit:
+        return "result.set_max() is used"
+    if query.initial_statements_with_includes.strip():
+        # e.g. counters or sets that are updated for every object
+        return "initial statements keep state between objects"
+    for text in (
+        query.statements_with_includes,
+        query.filter,
+        query.expressions,
+    ):
+        m = BACKLINK_RE.search(text or "")
+        if m:
+            return "'{}' uses back references".format(m.group())
+    return ""
+
+
+def can_run_incremental(gramps_engine, result):
+    # type: (Any, Any) -> bool
+    reason = check_incremental(gramps_engine, result)
+    if reason:
+        print("Running non-incrementally:", reason, file=sys.stderr)
+        return False
+    return True
+
+
+# -------------------------------------------------------------------------
+#
+# Saved state
+#
+# -------------------------------------------------------------------------
+def query_key(gramps_engine):
+    # type: (Any) -> str
+    "The state is identified by the family tree and the query text"
+    query = gramps_engine.query
+    db = gramps_engine.db
+    text = json.dumps(
+        [
+            query.category,
+            query.initial_statements_with_includes,
+            query.statements_with_includes,
+            query.filter,
+            query.expressions,
+            query.unwind_lists,
+            repr(gramps_engine.env.get("args", "")),
+            gramps_engine.raw_values,
+        ]
+    )
+    if hasattr(db, "get_dbid"):
+        dbid = db.get_dbid()
+    else:
+        dbid = os.path.basename(db.get_save_path() or "")
+    return dbid + "-" + hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def empty_state():
+    # type: () -> Dict[str, Any]
+    return dict(session="", serial=0, entries={}, stamps={})
+
+
+def load_state(key):
+    # type: (str) -> Dict[str, Any]
+    state = _states.get(key)
+    if state is not None:
+        return state
+    try:
+        with open(os.path.join(STATE_DIR, key + ".pickle"), "rb") as f:
+            return pickle.load(f)
+    except Exception:
+        return empty_state()
+
+
+def save_state(key, state):
+    # type: (str, Dict[str, Any]) -> None
+    _states[key] = state
+    try:
+        data = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+    except Exception:  # e.g. raw values that cannot be pickled
+        return
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(os.path.join(STATE_DIR, key + ".pickle"), "wb") as f:
+        f.write(data)
+
+
+def get_stamp(cache, key):
+    # type: (engine.ObjectCache, Tuple[str,str]) -> Optional[int]
+    "The change time of an object, None if it does not exist"
+    objtype, handle = key
+    if objtype == "table":
+        return None  # see find_changes
+    getfunc = getattr(cache.db, "get_{}_from_handle".format(objtype.lower()))
+    try:
+        obj = cache._get(objtype, handle, getfunc)
+    except Exception:
+        return None
+    return obj.change if obj else None
+
+
+def find_changes(state, tracker, cache):
+    # type: (Dict[str,Any], ChangeTracker, engine.ObjectCache) -> Set[Tuple[str,str]]
+    if state["session"] == tracker.session:
+        changed = tracker.changed_since(state["serial"])
+        types = {objtype for objtype, handle in changed}
+        changed.update(("table", objtype) for objtype in types)
+        if types:
+            changed.add(("table", "*"))
+        return changed
+    # saved by another Gramps session: compare the change times; the
+    # changes to whole tables are not known so they are assumed
+    return {
+        key
+        for key, stamp in state["stamps"].items()
+        if key[0] == "table" or get_stamp(cache, key) != stamp
+    }
+
+
+# -------------------------------------------------------------------------
+#
+# Execution
+#
+# -------------------------------------------------------------------------
+def run_incremental(gramps_engine, env, result):
+    # type: (Any, Dict[str,Any], Any) -> Generator
+    "Yields the rows; returns the environment"
+    tracker = get_tracker(gramps_engine.db)
+    serial = tracker.serial
+    key = query_key(gramps_engine)
+    state = load_state(key)
+    cache = gramps_engine.cache
+    objclass = gramps_engine.context.objclass
+
+    changed = find_changes(state, tracker, cache) if state["entries"] else set()
+    dirty = set()  # type: Set[str]
+    for handle, (passed, rows, deps) in state["entries"].items():
+        if not changed.isdisjoint(deps):
+            dirty.add(handle)
+
+    entries = {}  # type: Dict[str, Tuple[bool, List[Any], Set[Tuple[str,str]]]]
+    stamps = {}  # type: Dict[Tuple[str,str], Optional[int]]
+    gramps_engine.evaluated_count = 0
+    step = gramps_engine.step
+    gramps_engine.step = None  # stepping is done here
+    try:
+        for n, handle in enumerate(gramps_engine.selected_handles):
+            if step and n % STEP_INTERVAL == 0:
+                if step():  # user clicked 'Cancel', stop
+                    return env
+            entry = state["entries"].get(handle)
+            if entry is None or handle in dirty:
+                # start with an empty cache so that every object read is recorded
+                cache.clear()
+                cache.reads = set()
+                count = gramps_engine.object_count
+                rows = []
+                try:
+                    for obj, env, values in gramps_engine.generate_values(
+                        env, result, [handle]
+                    ):
+                        rows.append(values)
+                finally:
+                    deps = cache.reads
+                    cache.reads = None
+                deps.add((objclass, handle))
+                entry = (gramps_engine.object_count > count, rows, deps)
+                gramps_engine.evaluated_count += 1
+                for dep in deps:
+                    stamps[dep] = get_stamp(cache, dep)
+            else:
+                if entry[0]:
+                    gramps_engine.object_count += 1
+                for dep in entry[2]:
+                    if dep not in stamps:
+                        stamps[dep] = state["stamps"].get(dep)
+            entries[handle] = entry
+            yield from entry[1]
+    finally:
+        gramps_engine.step = step
+    save_state(
+        key,
+        dict(
+            session=tracker.session,
+            serial=serial,
+            entries=entries,
+            stamps=stamps,
+        ),
+    )
+    return env
@@ -0,0 +1,276 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2026      Kari Kujansuu
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""
+A virtual list model for the SuperTool result list.
+
+The rows are kept as tuples in a RowStore (which moves them to a temporary
+file if there are very many) and the tree view asks for the values of the
+visible rows only, so nothing is copied into GTK when rows are added. Rows are added in batches. Sorting reorders an index array using sort
+keys that are computed once per column. If the rows have been moved to the
+temporary file, the index array is read from SQLite using an index on the
+column instead, so the column values are not loaded into memory (strings are
+then sorted by their code points, not by the locale).
+"""
+
+# -------------------------------------------------------------------------
+#
+# Standard Python modules
+#
+# -------------------------------------------------------------------------
+import array
+
+try:
+    from typing import Any
+    from typing import Dict
+    from typing import Iterable
+    from typing import Iterator
+    from typing import List
+    from typing import Optional
+    from typing import Sequence
+    from typing import Tuple
+    from typing import Type
+except:
+    pass
+
+# -------------------------------------------------------------------------
+#
+# GTK/Gnome modules
+#
+# -------------------------------------------------------------------------
+from gi.repository import Gtk, GObject
+
+# -------------------------------------------------------------------------
+#
+# Gramps modules
+#
+# -------------------------------------------------------------------------
+from gramps.gen.const import GRAMPS_LOCALE as glocale
+
+# -------------------------------------------------------------------------
+#
+# Local modules
+#
+# -------------------------------------------------------------------------
+import supertool_rowstore
+
+GTYPES = {
+    str: GObject.TYPE_STRING,
+    int: GObject.TYPE_INT64,
+    float: GObject.TYPE_DOUBLE,
+}
+
+
+def convert(value, coltype):
+    # type: (Any, Type) -> Any
+    "Convert a value that does not match the column type"
+    if coltype is str:
+        return str(value)
+    try:
+        return coltype(value)
+    except (TypeError, ValueError):
+        return coltype()
+
+
+class ResultModel(GObject.GObject, Gtk.TreeModel):
+    """
+    A flat tree model for the result rows.
+
+    The iter user_data holds the position in the displayed order plus one
+    (so that it is never zero/NULL).
+    """
+
+    def __init__(self, coltypes, spill_rows=supertool_rowstore.SPILL_ROWS):
+        # type: (Sequence[Type], int) -> None
+        GObject.GObject.__init__(self)
+        self.coltypes = list(coltypes)
+        self.rows = supertool_rowstore.RowStore(spill_rows)
+        self.order = None  # type: Optional[array.array] # row indexes when sorted
+        self.sort_keys = {}  # type: Dict[int, List[Any]]
+        self.sort_column = -1
+        self.descending = False
+        self.stamp = id(self) & 0x7FFFFFFF
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.rows)
+
+    # ---------------------------------------------------------------------
+    # Adding and reading rows
+    # ---------------------------------------------------------------------
+    def append_rows(self, rows, notify=False):
+        # type: (Iterable[Sequence[Any]], bool) -> None
+        """
+        Add a batch of rows at the end. If notify is True, the attached
+        views are told about the new rows; otherwise the model should be
+        (re)attached to the view after adding.
+        """
+        start = len(self.rows)
+        self.rows.extend(tuple(row) for row in rows)
+        end = len(self.rows)
+        if self.order is not None:
+            # new rows stay at the end until the list is sorted again
+            self.order.extend(range(start, end))
+        self.sort_keys.clear()
+        if notify:
+            for pos in range(start, end):
+                path = Gtk.TreePath((pos,))
+                self.row_inserted(path, self.new_iter(pos))
+
+    def get_row(self, pos):
+        # type: (int) -> Tuple[Any, ...]
+        "Return the row at the position in the displayed order"
+        if self.order is not None:
+            pos = self.order[pos]
+        return self.rows[pos]
+
+    def iter_rows(self):
+        # type: () -> Iterator[Tuple[Any, ...]]
+        "Iterate over the rows in the displayed order"
+        if self.order is None:
+            return iter(self.rows)
+        return self.rows.iter_indexes(self.order)
+
+    def close(self):
+        # type: () -> None
+        "Release the rows (and remove the temporary file, if any)"
+        self.rows.close()
+        self.order = None
+        self.sort_keys.clear()
+
+    # ---------------------------------------------------------------------
+    # Sorting
+    # ---------------------------------------------------------------------
+    def get_sort_keys(self, colnum):
+        # type: (int) -> List[Any]
+        keys = self.sort_keys.get(colnum)
+        if keys is None:
+            coltype = self.coltypes[colnum]
+            if coltype is str:
+                sort_key = glocale.sort_key
+                keys = [
+                    sort_key(value if type(value) is str else str(value))
+                    for value in self.rows.column(colnum)
+                ]
+            else:
+                keys = [
+                    value if type(value) is coltype else convert(value, coltype)
+                    for value in self.rows.column(colnum)
+                ]
+            self.sort_keys[colnum] = keys
+        return keys
+
+    def sort(self, colnum, descending=False):
+        # type: (int, bool) -> None
+        """
+        Sort by a column. The model should be detached from the view while
+        sorting and reattached afterwards.
+        """
+        if self.rows.spilled and colnum < self.rows.ncols:
+            order = self.rows.sorted_indexes(colnum, descending)  # type: Iterable[int]
+        else:
+            keys = self.get_sort_keys(colnum)
+            order = sorted(range(len(keys)), key=keys.__getitem__, reverse=descending)
+        self.order = array.array("l", order)
+        self.sort_column = colnum
+        self.descending = descending
+
+    # ---------------------------------------------------------------------
+    # Gtk.TreeModel interface
+    # ---------------------------------------------------------------------
+    def new_iter(self, pos):
+        # type: (int) -> Gtk.TreeIter
+        treeiter = Gtk.TreeIter()
+        treeiter.stamp = self.stamp
+        treeiter.user_data = pos + 1
+        return treeiter
+
+    def do_get_flags(self):
+        # type: () -> Gtk.TreeModelFlags
+        return Gtk.TreeModelFlags.LIST_ONLY
+
+    def do_get_n_columns(self):
+        # type: () -> int
+        return len(self.coltypes)
+
+    def do_get_column_type(self, index):
+        # type: (int) -> GObject.GType
+        return GTYPES.get(self.coltypes[index], GObject.TYPE_STRING)
+
+    def do_get_iter(self, path):
+        # type: (Gtk.TreePath) -> Tuple[bool, Gtk.TreeIter]
+        pos = path.get_indices()[0]
+        if 0 <= pos < len(self.rows):
+            return True, self.new_iter(pos)
+        return False, Gtk.TreeIter()
+
+    def do_get_path(self, treeiter):
+        # type: (Gtk.TreeIter) -> Gtk.TreePath
+        return Gtk.TreePath((treeiter.user_data - 1,))
+
+    def do_get_value(self, treeiter, colnum):
+        # type: (Gtk.TreeIter, int) -> Any
+        value = self.get_row(treeiter.user_data - 1)[colnum]
+        coltype = self.coltypes[colnum]
+        if type(value) is not coltype:
+            value = convert(value, coltype)
+        return value
+
+    def do_iter_next(self, treeiter):
+        # type: (Gtk.TreeIter) -> bool
+        pos = treeiter.user_data
+        if pos < len(self.rows):
+            treeiter.user_data = pos + 1
+            return True
+        return False
+
+    def do_iter_previous(self, treeiter):
+        # type: (Gtk.TreeIter) -> bool
+        pos = treeiter.user_data
+        if pos > 1:
+            treeiter.user_data = pos - 1
+            return True
+        return False
+
+    def do_iter_children(self, parent):
+        # type: (Optional[Gtk.TreeIter]) -> Tuple[bool, Gtk.TreeIter]
+        if parent is None and self.rows:
+            return True, self.new_iter(0)
+        return False, Gtk.TreeIter()
+
+    def do_iter_has_child(self, treeiter):
+        # type: (Gtk.TreeIter) -> bool
+        return False
+
+    def do_iter_n_children(self, treeiter):
+        # type: (Optional[Gtk.TreeIter]) -> int
+        if treeiter is None:
+            return len(self.rows)
+        return 0
+
+    def do_iter_nth_child(self, parent, n):
+        # type: (Optional[Gtk.TreeIter], int) -> Tuple[bool, Gtk.TreeIter]
+        if parent is None and 0 <= n < len(self.rows):
+            return True, self.new_iter(n)
+        return False, Gtk.TreeIter()
+
+    def do_iter_parent(self, child):
+        # type: (Gtk.TreeIter) -> Tuple[bool, Gtk.TreeIter]
+        return False, Gtk.TreeIter()
@@ -0,0 +1,437 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2026      Kari Kujansuu
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""
+Parallel execution of read-only SuperTool queries.
+
+The handles are split in consecutive chunks that are processed by forked
+worker processes. Each worker opens the family tree read-only and runs the
+initial statements, statements, filter and expressions for its chunk. The
+rows are returned to the main process in the original handle order.
+
+Variables set by the statements are combined after all chunks are done,
+before the summary expressions are evaluated:
+
+- numbers: the changes made in each chunk are added together
+- lists: the items appended in each chunk are concatenated
+- sets: union
+- dicts: combined key by key with these same rules
+- anything else: the value from the last chunk that changed it
+
+Variables that are not set in the initial statements get the value from the
+last chunk, as if the objects were processed serially.
+
+A different combining function can be given with result.set_merge(), e.g.
+result.set_merge(oldest=max).
+
+Parallel mode is used only from the command line and the supertool_execute
+API, and only on platforms that support 'fork'.
+"""
+
+# -------------------------------------------------------------------------
+#
+# Standard Python modules
+#
+# -------------------------------------------------------------------------
+import copy
+import functools
+import io
+import multiprocessing
+import pickle
+import sys
+import types
+
+from types import SimpleNamespace
+
+try:
+    from typing import Any
+    from typing import Callable
+    from typing import Dict
+    from typing import Generator
+    from typing import List
+    from typing import Set
+except:
+    pass
+
+# -------------------------------------------------------------------------
+#
+# Local modules
+#
+# -------------------------------------------------------------------------
+import supertool_engine as engine
+import supertool_utils
+
+CHUNKS_PER_WORKER = 4
+STEP_INTERVAL = 100
+
+# names whose use means that the script may modify the database
+WRITE_NAMES = {
+    "trans",
+    "DummyTxn",
+    "DbTxn",
+    "supertool_run",
+}
+WRITE_PREFIXES = ("commit_", "remove_", "add_")
+ALLOWED_NAMES = {"add_row"}
+
+# names whose use means that the script may modify the database or
+# needs the user interface
+BLOCKED_NAMES = WRITE_NAMES | {
+    "getargs",
+    "uistate",
+    "supertool_window",
+    "active_person",
+}
+BLOCKED_PREFIXES = WRITE_PREFIXES
+
+# pre-defined names in the environment, these are never combined
+ENV_NAMES = {
+    "__builtins__",
+    "active_person",
+    "args",
+    "category",
+    "code",
+    "db",
+    "dbstate",
+    "env",
+    "filter",
+    "getargs",
+    "getproxy",
+    "namespace",
+    "result",
+    "self",
+    "step",
+    "supertool_run",
+    "supertool_window",
+    "trans",
+    "uistate",
+    "user",
+}
+
+_job = None  # type: Any # state inherited by the forked workers
+
+
+def code_names(code):
+    # type: (types.CodeType) -> Set[str]
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= code_names(const)
+    return names
+
+
+def script_names(query):
+    # type: (Any) -> Set[str]
+    "The global and attribute names used by the compiled script"
+    names = set()  # type: Set[str]
+    for code in (
+        query.initial_statements_compiled,
+        query.statements_compiled,
+        query.filter_compiled,
+        query.expressions_compiled,
+    ):
+        if code:
+            names |= code_names(code)
+    return names
+
+
+def may_write(query):
+    # type: (Any) -> bool
+    "Does the (compiled) script possibly modify the database?"
+    for name in script_names(query):
+        if name in ALLOWED_NAMES:
+            continue
+        if name in WRITE_NAMES or name.startswith(WRITE_PREFIXES):
+            return True
+    return False
+
+
+def check_parallel(gramps_engine, result):
+    # type: (Any, Any) -> str
+    "Return the reason why the query cannot be run in parallel, or ''"
+    query = gramps_engine.query
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return "parallel mode is not supported on this platform"
+    if gramps_engine.uistate:
+        return "parallel mode is not available in the user interface"
+    if not gramps_engine.context.objclass:
+        return "no objects to process"
+    if query.commit_changes:
+        return "'Commit changes' is selected"
+    if result.max:
+        return "result.set_max() is used"
+    if gramps_engine.profiler:
+        return "profiling is on"
+    if not gramps_engine.db.get_save_path():
+        return "the database has no path"
+    for name in sorted(script_names(query)):
+        if name in ALLOWED_NAMES:
+            continue
+        if name in BLOCKED_NAMES or name.startswith(BLOCKED_PREFIXES):
+            return "the script uses '{}'".format(name)
+    return ""
+
+
+def can_run_parallel(gramps_engine, result):
+    # type: (Any, Any) -> bool
+    reason = check_parallel(gramps_engine, result)
+    if reason:
+        print("Running serially:", reason, file=sys.stderr)
+        return False
+    return True
+
+
+# -------------------------------------------------------------------------
+#
+# Transferring rows and variables between processes
+#
+# -------------------------------------------------------------------------
+PROXY_CLASSES = {
+    cls.namespace: cls
+    for cls in (
+        engine.PersonProxy,
+        engine.FamilyProxy,
+        engine.EventProxy,
+        engine.PlaceProxy,
+        engine.CitationProxy,
+        engine.SourceProxy,
+        engine.RepositoryProxy,
+        engine.MediaProxy,
+        engine.NoteProxy,
+    )
+}
+
+
+class _Pickler(pickle.Pickler):
+    "Proxies are sent as references and recreated in the main process"
+
+    def persistent_id(self, obj):
+        # type: (Any) -> Any
+        if obj is engine.nullproxy:
+            return ("null",)
+        if isinstance(obj, engine.Proxy):
+            return ("proxy", obj.namespace, obj.handle)
+        return None
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, f, cache):
+        # type: (io.BytesIO, engine.ObjectCache) -> None
+        pickle.Unpickler.__init__(self, f)
+        self.cache = cache
+
+    def persistent_load(self, pid):
+        # type: (Any) -> Any
+        if pid[0] == "null":
+            return engine.nullproxy
+        _, namespace, handle = pid
+        return self.cache.proxy(PROXY_CLASSES[namespace], handle)
+
+
+def dumps(data):
+    # type: (Any) -> bytes
+    f = io.BytesIO()
+    _Pickler(f, pickle.HIGHEST_PROTOCOL).dump(data)
+    return f.getvalue()
+
+
+def loads(data, cache):
+    # type: (bytes, engine.ObjectCache) -> Any
+    return _Unpickler(io.BytesIO(data), cache).load()
+
+
+def user_variables(env, extra_names):
+    # type: (Dict[str,Any], Set[str]) -> Dict[str,Any]
+    "Return the variables set by the user code"
+    global_names = supertool_utils.get_globals().keys()
+    cached = getattr(env, "cached", {})  # attribute values, not variables
+    variables = {}
+    for name, value in dict.items(env):
+        if name in ENV_NAMES or name in extra_names or name in global_names:
+            continue
+        if name in cached:
+            continue
+        if name.startswith("_"):
+            continue
+        if callable(value) or isinstance(value, types.ModuleType):
+            continue
+        variables[name] = value
+    return variables
+
+
+# -------------------------------------------------------------------------
+#
+# Combining the variables
+#
+# -------------------------------------------------------------------------
+def merge_values(name, initial, values):
+    # type: (str, Any, List[Any]) -> Any
+    if isinstance(initial, bool):
+        changed = [v for v in values if v != initial]
+        return changed[-1] if changed else initial
+    if isinstance(initial, (int, float)):
+        if all(isinstance(v, (int, float)) for v in values):
+            return initial + sum(v - initial for v in values)
+    if isinstance(initial, list):
+        merged = list(initial)
+        for v in values:
+            if not isinstance(v, list) or v[: len(initial)] != initial:
+                raise engine.SupertoolException(
+                    "Cannot combine the values of list '{}' in parallel mode".format(
+                        name
+                    )
+                )
+            merged.extend(v[len(initial) :])
+        return merged
+    if isinstance(initial, set):
+        merged_set = set(initial)
+        for v in values:
+            merged_set |= v
+        return merged_set
+    if isinstance(initial, dict):
+        merged_dict = copy.copy(initial)
+        keys = []  # type: List[Any]
+        for v in values:
+            keys.extend(key for key in v if key not in merged_dict and key not in keys)
+        for key in list(initial) + keys:
+            key_values = [v[key] for v in values if key in v]
+            if key in initial:
+                merged_dict[key] = merge_values(name, initial[key], key_values)
+            else:
+                merged_dict[key] = merge_values(
+                    name, empty_value(key_values[0]), key_values
+                )
+        return merged_dict
+    changed = [v for v in values if v != initial]
+    return changed[-1] if changed else initial
+
+
+def empty_value(value):
+    # type: (Any) -> Any
+    "The starting value for a dict item created in a chunk"
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, list, set, dict)):
+        return type(value)()
+    return None
+
+
+def merge_variables(env, initial, partials, merge_funcs):
+    # type: (Dict[str,Any], Dict[str,Any], List[Dict[str,Any]], Dict[str,Callable]) -> None
+    names = list(initial)
+    for variables in partials:
+        names.extend(name for name in variables if name not in names)
+    for name in names:
+        values = [variables[name] for variables in partials if name in variables]
+        if not values:
+            continue
+        if name in merge_funcs:
+            if name in initial:
+                values = [initial[name]] + values
+            env[name] = functools.reduce(merge_funcs[name], values)
+        elif name in initial:
+            env[name] = merge_values(name, initial[name], values)
+        else:
+            # set only in the statements: the value from the last object
+            env[name] = values[-1]
+
+
+# -------------------------------------------------------------------------
+#
+# Workers
+#
+# -------------------------------------------------------------------------
+def _init_worker():
+    # type: () -> None
+    from gramps.gen.db.dbconst import DBMODE_R
+    from gramps.gen.db.utils import make_database
+
+    db = make_database(_job.dbid)
+    db.load(_job.path, mode=DBMODE_R)
+    _job.db = db
+
+
+def _run_chunk(handles):
+    # type: (List[str]) -> bytes
+    parent = _job.engine
+    context = supertool_utils.get_context(_job.db, parent.context.category_name)
+    gramps_engine = type(parent)(
+        SimpleNamespace(db=_job.db),
+        parent.user,
+        context,
+        handles,
+        parent.query,
+        env=parent.env,
+        raw_values=parent.raw_values,
+    )
+    result = _job.result_class()
+    env = gramps_engine.make_env(None, result)
+    env = gramps_engine.run_initial_statements(env)
+    list(result.fetch_rows())  # these rows were already produced by the main process
+    rows = []
+    for obj, env, values in gramps_engine.generate_values(env, result):
+        if not gramps_engine.query.summary_only:
+            rows.append(values)
+    variables = user_variables(env, set(parent.env))
+    return dumps((rows, gramps_engine.object_count, variables))
+
+
+def run_parallel(gramps_engine, env, result, workers):
+    # type: (Any, Dict[str,Any], Any, int) -> Generator
+    "Yields the rows; returns the environment with the combined variables"
+    global _job
+    from gramps.gen.db.utils import get_dbid_from_path
+
+    handles = list(gramps_engine.selected_handles)
+    if result.read_limit:
+        handles = handles[: result.read_limit]
+    if not handles:
+        return env
+    numchunks = min(len(handles), workers * CHUNKS_PER_WORKER)
+    chunks = [
+        handles[i * len(handles) // numchunks : (i + 1) * len(handles) // numchunks]
+        for i in range(numchunks)
+    ]
+    path = gramps_engine.db.get_save_path()
+    _job = SimpleNamespace(
+        engine=gramps_engine,
+        result_class=type(result),
+        dbid=get_dbid_from_path(path),
+        path=path,
+        db=None,
+    )
+    initial = copy.deepcopy(user_variables(env, set(gramps_engine.env)))
+    partials = []  # type: List[Dict[str,Any]]
+    mp = multiprocessing.get_context("fork")
+    try:
+        with mp.Pool(workers, initializer=_init_worker) as pool:
+            for chunk, data in zip(chunks, pool.imap(_run_chunk, chunks)):
+                rows, count, variables = loads(data, gramps_engine.cache)
+                gramps_engine.object_count += count
+                yield from rows
+                partials.append(variables)
+                if gramps_engine.step:
+                    for _ in range(len(chunk) // STEP_INTERVAL):
+                        if gramps_engine.step():  # user clicked 'Cancel', stop
+                            return env
+    finally:
+        _job = None
+    merge_variables(env, initial, partials, result.merge_funcs)
+    return env
@@ -0,0 +1,284 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2026      Kari Kujansuu
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""
+Profiling of SuperTool scripts.
+
+The profiler measures
+- the wall time and number of executions of each script section
+- the lines of the script where time is spent (by sampling the stack of
+  the executing thread at short intervals)
+- the number of calls and the cumulative time of the proxy properties
+- the number of objects read from the database, by object type
+"""
+
+# -------------------------------------------------------------------------
+#
+# Standard Python modules
+#
+# -------------------------------------------------------------------------
+import collections
+import copy
+import json
+import sys
+import threading
+import time
+
+try:
+    from typing import Any
+    from typing import Callable
+    from typing import Dict
+    from typing import List
+    from typing import Tuple
+except:
+    pass
+
+# -------------------------------------------------------------------------
+#
+# Local modules
+#
+# -------------------------------------------------------------------------
+import supertool_engine as engine
+
+SECTIONS = ["initial_statements", "statements", "filter", "expressions"]
+
+
+class Profiler:
+    SAMPLE_INTERVAL = 0.001  # seconds
+    TOP_LINES = 20
+    TOP_PROPERTIES = 30
+
+    def __init__(self):
+        # type: () -> None
+        self.total_time = 0.0
+        self.samples = 0
+        self.section_calls = collections.Counter()  # type: collections.Counter
+        self.section_times = collections.defaultdict(float)  # type: Dict[str,float]
+        self.lines = collections.Counter()  # type: collections.Counter
+        self.property_calls = collections.Counter()  # type: collections.Counter
+        self.property_times = collections.defaultdict(float)  # type: Dict[str,float]
+        self.fetches = collections.Counter()  # type: collections.Counter
+        self.query = None  # type: Any
+        self.saved_properties = []  # type: List[Tuple[type, str, property]]
+
+    # ---------------------------------------------------------------------
+    # Starting and stopping
+    # ---------------------------------------------------------------------
+    def start(self, gramps_engine):
+        # type: (Any) -> None
+        self.gramps_engine = gramps_engine
+        self.query = gramps_engine.query
+        self.original_context = gramps_engine.context
+        context = copy.copy(gramps_engine.context)
+        context.execute_func = self.timed_execute(context.execute_func)
+        if context.objclass:
+            context.getfunc = self.counted_get(context.getfunc, context.objclass)
+        gramps_engine.context = context
+        self.patch_properties()
+
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+        self.t0 = time.perf_counter()
+
+    def stop(self):
+        # type: () -> None
+        self.total_time += time.perf_counter() - self.t0
+        self.stopped.set()
+        self.sampler.join()
+        self.restore_properties()
+        self.gramps_engine.context = self.original_context
+        self.fetches.update(self.gramps_engine.cache.fetches)
+
+    # ---------------------------------------------------------------------
+    # Measuring
+    # ---------------------------------------------------------------------
+    def timed_execute(self, execute_func):
+        # type: (Callable) -> Callable
+        def f(dbstate, obj, code, env, *args):
+            # type: (Any, Any, Any, Any, Any) -> Any
+            t = time.perf_counter()
+            try:
+                return execute_func(dbstate, obj, code, env, *args)
+            finally:
+                section = code.co_filename
+                self.section_calls[section] += 1
+                self.section_times[section] += time.perf_counter() - t
+
+        return f
+
+    def counted_get(self, getfunc, objclass):
+        # type: (Callable, str) -> Callable
+        def f(handle):
+            # type: (str) -> Any
+            self.fetches[objclass] += 1
+            return getfunc(handle)
+
+        return f
+
+    def timed_property(self, name, prop):
+        # type: (str, property) -> property
+        fget = prop.fget
+        calls = self.property_calls
+        times = self.property_times
+
+        def f(obj):
+            # type: (Any) -> Any
+            t = time.perf_counter()
+            try:
+                return fget(obj)
+            finally:
+                key = type(obj).__name__ + "." + name
+                calls[key] += 1
+                times[key] += time.perf_counter() - t
+
+        return property(f, prop.fset, prop.fdel, prop.__doc__)
+
+    def patch_properties(self):
+        # type: () -> None
+        for cls in vars(engine).values():
+            if not isinstance(cls, type) or not cls.__name__.endswith("Proxy"):
+                continue
+            if cls.__module__ != engine.__name__:
+                continue
+            for name, attr in list(vars(cls).items()):
+                if isinstance(attr, property) and attr.fget:
+                    self.saved_properties.append((cls, name, attr))
+                    setattr(cls, name, self.timed_property(name, attr))
+
+    def restore_properties(self):
+        # type: () -> None
+        for cls, name, attr in self.saved_properties:
+            setattr(cls, name, attr)
+        self.saved_properties = []
+
+    def sample(self):
+        # type: () -> None
+        while not self.stopped.wait(self.SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            self.samples += 1
+            # the innermost frame that executes script code
+            while frame is not None:
+                section = frame.f_code.co_filename
+                if section in SECTIONS:
+                    self.lines[(section, frame.f_lineno)] += 1
+                    break
+                frame = frame.f_back
+
+    # ---------------------------------------------------------------------
+    # Reporting
+    # ---------------------------------------------------------------------
+    def source_line(self, section, linenum):
+        # type: (str, int) -> Tuple[str, int, str]
+        "Return the include file name, line number in that file and the text"
+        query = self.query
+        fname = ""
+        if section == "initial_statements":
+            source = query.initial_statements_with_includes
+            fname, linenum2 = query.get_filename(query.initial_statements_files, linenum)
+        elif section == "statements":
+            source = query.statements_with_includes
+            fname, linenum2 = query.get_filename(query.statements_files, linenum)
+        else:
+            source = getattr(query, section)
+            linenum2 = linenum
+        lines = source.splitlines()
+        text = lines[linenum - 1].strip() if 0 < linenum <= len(lines) else ""
+        return fname, linenum2, text
+
+    def report(self):
+        # type: () -> Dict[str, Any]
+        sections = [
+            dict(
+                section=section,
+                calls=self.section_calls[section],
+                time=round(self.section_times[section], 6),
+            )
+            for section in SECTIONS
+            if self.section_calls[section]
+        ]
+        lines = []
+        for (section, linenum), count in self.lines.most_common():
+            fname, linenum2, text = self.source_line(section, linenum)
+            lines.append(
+                dict(
+                    section=section,
+                    line=linenum2,
+                    file=fname,
+                    samples=count,
+                    source=text,
+                )
+            )
+        properties = [
+            dict(
+                property=key,
+                calls=self.property_calls[key],
+                time=round(self.property_times[key], 6),
+            )
+            for key in sorted(
+                self.property_times, key=self.property_times.get, reverse=True
+            )
+        ]
+        return dict(
+            total_time=round(self.total_time, 6),
+            samples=self.samples,
+            sections=sections,
+            lines=lines,
+            properties=properties,
+            fetches=dict(self.fetches.most_common()),
+        )
+
+    def format_report(self):
+        # type: () -> str
+        rpt = self.report()
+        out = []
+        out.append("Total time: {:.3f}s".format(rpt["total_time"]))
+        out.append("")
+        out.append("{:<20} {:>10} {:>10}".format("Section", "Calls", "Time (s)"))
+        for item in rpt["sections"]:
+            out.append(
+                "{section:<20} {calls:>10} {time:>10.3f}".format(**item)
+            )
+        out.append("")
+        out.append("{:<20} {:>6} {:>8}  {}".format("Line", "", "Samples", "Source"))
+        for item in rpt["lines"][: self.TOP_LINES]:
+            where = item["file"] or item["section"]
+            out.append(
+                "{:<20} {:>6} {:>8}  {}".format(
+                    where, item["line"], item["samples"], item["source"]
+                )
+            )
+        out.append("")
+        out.append("{:<32} {:>10} {:>10}".format("Property", "Calls", "Time (s)"))
+        for item in rpt["properties"][: self.TOP_PROPERTIES]:
+            out.append(
+                "{property:<32} {calls:>10} {time:>10.3f}".format(**item)
+            )
+        out.append("")
+        out.append("{:<20} {:>10}".format("Database reads", ""))
+        for objtype, count in rpt["fetches"].items():
+            out.append("{:<20} {:>10}".format(objtype, count))
+        return "\n".join(out) + "\n"
+
+    def save_json(self, filename):
+        # type: (str) -> None
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=4)
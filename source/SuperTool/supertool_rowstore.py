@@ -0,0 +1,404 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2026      Kari Kujansuu
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""
+A row list that moves to a temporary SQLite file when it gets large.
+
+The rows are kept in memory until there are more than spill_rows of them.
+Then they are written to a temporary database and all further rows go there
+too. Each row is stored pickled, together with the values of its columns as
+separate SQL columns so that the rows can be sorted and paged by SQLite.
+Values that SQLite cannot store are sorted by their string form.
+
+Row number i (from 0) is stored with id i, so reading a row by its index is a
+primary key lookup. Rows are read in blocks and the most recently read blocks
+are kept in memory, so scrolling through the rows does not need a query per
+row.
+
+The file is removed when the store is closed or garbage collected.
+"""
+
+# -------------------------------------------------------------------------
+#
+# Standard Python modules
+#
+# -------------------------------------------------------------------------
+import collections
+import csv
+import os
+import pickle
+import sqlite3
+import tempfile
+import weakref
+
+try:
+    from typing import Any
+    from typing import Dict
+    from typing import Iterable
+    from typing import Iterator
+    from typing import List
+    from typing import Optional
+    from typing import Sequence
+    from typing import Tuple
+except:
+    pass
+
+SPILL_ROWS = 100000  # rows kept in memory before moving to disk
+BLOCK_SIZE = 200  # rows read with one query
+MAX_BLOCKS = 50  # blocks kept in memory
+CHUNK_SIZE = 500  # rows per INSERT or "id IN (...)" query
+
+SQL_TYPES = (type(None), int, float, str, bytes)
+
+
+def sql_value(value):
+    # type: (Any) -> Any
+    "Return the value used for sorting in SQLite"
+    if type(value) in SQL_TYPES:
+        if type(value) is int and not -(2**63) <= value < 2**63:
+            return float(value)
+        return value
+    if isinstance(value, (bool, int, float)):
+        return float(value) if isinstance(value, float) else int(value)
+    return str(value)
+
+
+def sort_value(value):
+    # type: (Any) -> Tuple[int, Any]
+    "Python sort key in the same order as SQLite: NULL, numbers, text, blobs"
+    value = sql_value(value)
+    if value is None:
+        return (0, 0)
+    if type(value) is str:
+        return (2, value)
+    if type(value) is bytes:
+        return (3, value)
+    return (1, value)
+
+
+def remove_file(conn, filename):
+    # type: (sqlite3.Connection, str) -> None
+    conn.close()
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+class RowStore:
+    """
+    A sequence of rows (tuples or lists) that spills to a temporary SQLite
+    file after spill_rows rows (0 = never).
+
+    If the rows contain SuperTool proxy objects, the object cache must be
+    given so that the proxies can be recreated when the rows are read back.
+    """
+
+    def __init__(self, spill_rows=SPILL_ROWS, cache=None, dir=None):
+        # type: (int, Any, Optional[str]) -> None
+        self.spill_rows = spill_rows
+        self.cache = cache
+        self.dir = dir
+        self.rows = []  # type: List[Any] # until spilled
+        self.count = 0  # rows on disk
+        self.ncols = 0  # sortable columns on disk
+        self.conn = None  # type: Optional[sqlite3.Connection]
+        self.filename = ""
+        self.blocks = (
+            collections.OrderedDict()
+        )  # type: collections.OrderedDict[int, List[Any]]
+        self.indexed = set()  # type: set
+        self.finalizer = None  # type: Any
+
+    @property
+    def spilled(self):
+        # type: () -> bool
+        return self.conn is not None
+
+    def __len__(self):
+        # type: () -> int
+        if self.conn is None:
+            return len(self.rows)
+        return self.count
+
+    def __bool__(self):
+        # type: () -> bool
+        return len(self) > 0
+
+    # ---------------------------------------------------------------------
+    # Adding rows
+    # ---------------------------------------------------------------------
+    def append(self, row):
+        # type: (Sequence[Any]) -> None
+        if self.conn is None:
+            self.rows.append(row)
+            if self.spill_rows and len(self.rows) > self.spill_rows:
+                self.spill()
+        else:
+            self.insert([row])
+
+    def extend(self, rows):
+        # type: (Iterable[Sequence[Any]]) -> None
+        if self.conn is None:
+            self.rows.extend(rows)
+            if self.spill_rows and len(self.rows) > self.spill_rows:
+                self.spill()
+        else:
+            self.insert(rows)
+
+    def spill(self):
+        # type: () -> None
+        "Move the rows to a temporary database"
+        fd, self.filename = tempfile.mkstemp(
+            prefix="supertool-", suffix=".sqlite", dir=self.dir
+        )
+        os.close(fd)
+        conn = sqlite3.connect(self.filename)
+        self.finalizer = weakref.finalize(self, remove_file, conn, self.filename)
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        self.ncols = max(len(row) for row in self.rows[:1000])
+        columns = "".join(", c{}".format(i) for i in range(self.ncols))
+        conn.execute(
+            "CREATE TABLE rows (id INTEGER PRIMARY KEY, data BLOB{})".format(columns)
+        )
+        self.conn = conn
+        rows = self.rows
+        self.rows = []
+        self.insert(rows)
+
+    def insert(self, rows):
+        # type: (Iterable[Sequence[Any]]) -> None
+        assert self.conn is not None
+        ncols = self.ncols
+        sql = "INSERT INTO rows VALUES (?, ?{})".format(", ?" * ncols)
+        padding = (None,) * ncols
+        self.blocks.pop(self.count // BLOCK_SIZE, None)  # may be partial
+        batch = []  # type: List[Tuple[Any, ...]]
+        for row in rows:
+            values = tuple(sql_value(value) for value in row[:ncols])
+            if len(values) < ncols:
+                values += padding[len(values) :]
+            batch.append((self.count, self.encode(row)) + values)
+            self.count += 1
+            if len(batch) >= CHUNK_SIZE:
+                self.conn.executemany(sql, batch)
+                batch = []
+        if batch:
+            self.conn.executemany(sql, batch)
+        self.conn.commit()
+
+    def encode(self, row):
+        # type: (Sequence[Any]) -> bytes
+        if self.cache is None:
+            return pickle.dumps(row, pickle.HIGHEST_PROTOCOL)
+        import supertool_parallel
+
+        return supertool_parallel.dumps(row)
+
+    def decode(self, data):
+        # type: (bytes) -> Any
+        if self.cache is None:
+            return pickle.loads(data)
+        import supertool_parallel
+
+        return supertool_parallel.loads(data, self.cache)
+
+    # ---------------------------------------------------------------------
+    # Reading rows
+    # ---------------------------------------------------------------------
+    def __getitem__(self, index):
+        # type: (int) -> Any
+        if self.conn is None:
+            return self.rows[index]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("row index out of range")
+        blocknum = index // BLOCK_SIZE
+        block = self.blocks.get(blocknum)
+        if block is None:
+            start = blocknum * BLOCK_SIZE
+            cursor = self.conn.execute(
+                "SELECT data FROM rows WHERE id >= ? AND id < ? ORDER BY id",
+                (start, start + BLOCK_SIZE),
+            )
+            block = self.blocks[blocknum] = [self.decode(data) for data, in cursor]
+            if len(self.blocks) > MAX_BLOCKS:
+                self.blocks.popitem(last=False)
+        else:
+            self.blocks.move_to_end(blocknum)
+        return block[index % BLOCK_SIZE]
+
+    def __iter__(self):
+        # type: () -> Iterator[Any]
+        if self.conn is None:
+            return iter(self.rows)
+        return self.select("SELECT data FROM rows ORDER BY id")
+
+    def select(self, sql, params=()):
+        # type: (str, Sequence[Any]) -> Iterator[Any]
+        assert self.conn is not None
+        for data, in self.conn.execute(sql, params):
+            yield self.decode(data)
+
+    def iter_indexes(self, indexes):
+        # type: (Iterable[int]) -> Iterator[Any]
+        "Yield the rows with the given indexes, in the given order"
+        if self.conn is None:
+            rows = self.rows
+            for i in indexes:
+                yield rows[i]
+            return
+        chunk = []  # type: List[int]
+        for i in indexes:
+            chunk.append(i)
+            if len(chunk) >= CHUNK_SIZE:
+                yield from self.read_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from self.read_chunk(chunk)
+
+    def read_chunk(self, indexes):
+        # type: (List[int]) -> Iterator[Any]
+        assert self.conn is not None
+        sql = "SELECT id, data FROM rows WHERE id IN ({})".format(
+            ",".join("?" * len(indexes))
+        )
+        rows = dict(self.conn.execute(sql, indexes))
+        for i in indexes:
+            yield self.decode(rows[i])
+
+    def column(self, colnum):
+        # type: (int) -> Iterator[Any]
+        """
+        Yield the values of a column in row order. For rows on disk the
+        values are the sortable SQL values (e.g. a string for a date).
+        """
+        if self.conn is None:
+            return (row[colnum] if colnum < len(row) else None for row in self.rows)
+        if colnum >= self.ncols:
+            return (row[colnum] if colnum < len(row) else None for row in self)
+        sql = "SELECT c{} FROM rows ORDER BY id".format(colnum)
+        return (value for value, in self.conn.execute(sql))
+
+    # ---------------------------------------------------------------------
+    # Sorting, paging and export
+    # ---------------------------------------------------------------------
+    def iter_sorted(self, sort_column=None, descending=False, offset=0, limit=-1):
+        # type: (Optional[int], bool, int, int) -> Iterator[Any]
+        """
+        Yield the rows sorted by a column (or in the original order if
+        sort_column is None), skipping offset rows and yielding at most
+        limit rows (-1 = all). Rows with equal values keep their order.
+        """
+        if self.conn is None or (sort_column is not None and sort_column >= self.ncols):
+            if sort_column is None:
+                rows = list(self)
+            else:
+                rows = sorted(
+                    self,
+                    key=lambda row: sort_value(
+                        row[sort_column] if sort_column < len(row) else None
+                    ),
+                    reverse=descending,
+                )
+            end = None if limit < 0 else offset + limit
+            return iter(rows[offset:end])
+        if sort_column is None:
+            return self.select(
+                "SELECT data FROM rows WHERE id >= ? ORDER BY id LIMIT ?",
+                (offset, limit),
+            )
+        self.create_index(sort_column)
+        return self.select(
+            "SELECT data FROM rows ORDER BY c{} {}, id LIMIT ? OFFSET ?".format(
+                sort_column, "DESC" if descending else "ASC"
+            ),
+            (limit, offset),
+        )
+
+    def sorted_indexes(self, sort_column, descending=False):
+        # type: (int, bool) -> Iterator[int]
+        """
+        Yield the row indexes sorted by a column on disk, in the same order
+        as iter_sorted(), without reading the rows.
+        """
+        assert self.conn is not None and sort_column < self.ncols
+        self.create_index(sort_column)
+        sql = "SELECT id FROM rows ORDER BY c{} {}, id".format(
+            sort_column, "DESC" if descending else "ASC"
+        )
+        return (i for i, in self.conn.execute(sql))
+
+    def page(self, offset, limit, sort_column=None, descending=False):
+        # type: (int, int, Optional[int], bool) -> List[Any]
+        "Return limit rows starting from offset in the given sort order"
+        return list(self.iter_sorted(sort_column, descending, offset, limit))
+
+    def create_index(self, colnum):
+        # type: (int) -> None
+        assert self.conn is not None
+        if colnum not in self.indexed:
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS rows_c{0} ON rows (c{0}, id)".format(colnum)
+            )
+            self.indexed.add(colnum)
+
+    def write_csv(
+        self,
+        filename,
+        headers=None,
+        sort_column=None,
+        descending=False,
+        encoding="utf-8",
+        delimiter=",",
+    ):
+        # type: (str, Optional[Sequence[str]], Optional[int], bool, str, str) -> int
+        "Write the rows to a CSV file and return the number of rows"
+        count = 0
+        with open(filename, "w", encoding=encoding, newline="") as f:
+            writer = csv.writer(f, delimiter=delimiter)
+            if headers:
+                writer.writerow(headers)
+            for row in self.iter_sorted(sort_column, descending):
+                writer.writerow(row)
+                count += 1
+        return count
+
+    def close(self):
+        # type: () -> None
+        "Remove the temporary file; the rows cannot be read after this"
+        if self.finalizer is not None:
+            self.finalizer()
+            self.finalizer = None
+        self.conn = None
+        self.rows = []
+        self.count = 0
+        self.blocks.clear()
+
+    def __enter__(self):
+        # type: () -> RowStore
+        return self
+
+    def __exit__(self, *exc):
+        # type: (Any) -> None
+        self.close()
+
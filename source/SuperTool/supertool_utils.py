@@ -22,8 +22,11 @@
 # Standard Python modules
 #
 # -------------------------------------------------------------------------
+import builtins
 import collections
+import csv
 import functools
+import json
 import os
 import re
 import sys
@@ -35,6 +38,7 @@ from builtins import str
 
 try:
     from typing import TYPE_CHECKING
+    from typing import AbstractSet
     from typing import Any
     from typing import Callable
     from typing import Dict
@@ -141,7 +145,10 @@ from gramps.gui.selectors.selectperson import SelectPerson
 #
 # -------------------------------------------------------------------------
 import supertool_engine as engine
+import supertool_codecache as codecache
+import supertool_columns
 import supertool_genfilter as genfilter
+import supertool_rowstore
 
 
 config = configman.register_manager("supertool")
@@ -344,12 +351,18 @@ def process_includes(code, scriptfile_location=None):
             # include files should be in utf-8 but if that fails then try the default encoding
             return open(filename, 'rt').readlines()
 
-    config.load()
+    if "@include" not in code:
+        return code, []
+    load_config()
     default_location = config.get("defaults.include_location")
     if not default_location:
         TOOL_DIR = "supertool"
         from gramps.gen.const import USER_HOME
         default_location = os.path.join(USER_HOME, TOOL_DIR)
+    key = (code, scriptfile_location, default_location)
+    cached = codecache.get_includes(key)
+    if cached is not None:
+        return cached
     newlines = [] # type: List[str]
     files = []  # type: List[Tuple[str,int,int]]
     for line in code.splitlines(keepends=True):
@@ -366,17 +379,30 @@ def process_includes(code, scriptfile_location=None):
             files.append((fullname,startline,endline))
         else:
             newlines.append(line)
-    return "".join(newlines), files
+    text = "".join(newlines)
+    codecache.put_includes(key, text, files)
+    return text, files
+
+_config_stamp = [None]  # type: List[Any]
+
+def load_config():
+    # type: () -> None
+    "Reload the configuration only if the file has changed"
+    filename = getattr(config, "filename", None)
+    stamp = codecache.file_stamp(filename) if filename else None
+    if stamp is None or stamp != _config_stamp[0]:
+        config.load()
+        _config_stamp[0] = stamp
 
 def compile_statements(statements, source):
     # type: (str, str) -> Any
     if statements.strip() == "": return None
-    return compile(statements, source, 'exec')
+    return codecache.compile_cached(statements, source, 'exec')
 
 def compile_expression(expression, source):
     # type: (str, str) -> Any
     if expression.strip() == "": return None
-    return compile(expression.strip().replace("\n"," "), source, 'eval')
+    return codecache.compile_cached(expression.strip().replace("\n"," "), source, 'eval')
 
 
 def getargs_dialog(dbstate, uistate, from_genfilter, **kwargs):
@@ -697,22 +723,58 @@ class DummyTxn:
 
         self.txn = _Txn
 
+_missing = object()
+
 class Lazyenv(dict):
-    def __init__(self, **kwargs):
-        # type: (Any) -> None
+    """
+    Execution environment for the user code. Names not found in the
+    dictionary itself are looked up in the optional parent environment
+    (which is not copied) and then in the attributes of the current object.
+
+    Names found in the dictionary are looked up by the interpreter without
+    calling any Python code; only the other names go through __missing__.
+    When evaluating an expression (cache_values is True) the attribute
+    values are also stored in the dictionary, so that an attribute used
+    several times is computed only once. They are removed when the next
+    piece of code is executed (see set_object).
+    """
+    def __init__(self, parent=None, **kwargs):
+        # type: (Optional[Lazyenv], Any) -> None
         dict.__init__(self, **kwargs)
+        self.parent = parent
         self.obj = None
-        self.attrs = set() # type: Set[str]
-    def __getitem__(self, attrname):
+        self.attrs = frozenset() # type: AbstractSet[str]
+        self.cache_values = False
+        self.cached = {} # type: Dict[str, Any]
+
+    def set_object(self, obj, attrs, cache_values=False):
+        # type: (Any, AbstractSet[str], bool) -> None
+        "Set the current object and its attribute names; called before executing code"
+        if self.cached:
+            for name, value in self.cached.items():
+                # unless the code has assigned a new value (e.g. with :=)
+                if dict.get(self, name, _missing) is value:
+                    dict.__delitem__(self, name)
+            self.cached = {}
+        self.obj = obj
+        self.attrs = attrs
+        self.cache_values = cache_values
+
+    def __missing__(self, attrname):
         # type: (str) -> Any
-        if attrname in self:
-            return dict.__getitem__(self, attrname)
+        parent = self.parent
+        if parent is not None and attrname in parent:
+            return parent[attrname]
         if attrname in self.attrs:
             value = getattr(self.obj, attrname) # nullproxy)
+            if self.cache_values:
+                dict.__setitem__(self, attrname, value)
+                self.cached[attrname] = value
             return value
-        raise KeyError
-        #return dict.__getitem__(self, attrname)
-        #return self.env[attrname]
+        value = getattr(builtins, attrname, _missing)
+        if value is _missing:
+            raise KeyError(attrname)
+        return value
 
         
 def get_globals():
@@ -731,6 +793,10 @@ def get_globals():
         defaultdict=collections.defaultdict,
         functools=functools,
         pprint=pprint,
+        count_by=supertool_columns.count_by,
+        sum_by=supertool_columns.sum_by,
+        min_by=supertool_columns.min_by,
+        max_by=supertool_columns.max_by,
 
         Address=Address,
         Attribute=Attribute,
@@ -789,12 +855,56 @@ def get_globals():
     )
 
 class Response:
-    def __init__(self, rows, query, result):
-        # type: (List[List[Any]], Any, Any) -> None
-        # xtype: (List[List[Any]], Query, Result) -> None
+    def __init__(self, rows, query, result, cache=None):
+        # type: (Any, Any, Any, Optional[engine.ObjectCache]) -> None
+        # xtype: (List[List[Any]], Query, Result, engine.ObjectCache) -> None
         self.rows = rows
         self.query = query
         self.result = result
+        self.cache = cache  # hit/miss counters of the object cache
+
+
+class RowSink:
+    """
+    Writes rows to a CSV or JSON lines file as they are generated.
+
+    Can be passed as the 'sink' argument of supertool_execute. The format
+    is JSON lines if the file name ends with .jsonl (or format="jsonl"),
+    otherwise CSV.
+    """
+
+    def __init__(self, filename, mode="w", encoding="utf-8", delimiter=",", format=None):
+        # type: (str, str, str, str, Optional[str]) -> None
+        if format is None:
+            format = "jsonl" if filename.endswith(".jsonl") else "csv"
+        self.format = format
+        self.count = 0
+        self.f = open(filename, mode, encoding=encoding, newline="")
+        if format == "jsonl":
+            self.write = self.write_json
+        else:
+            self.write = csv.writer(self.f, delimiter=delimiter).writerow
+
+    def __call__(self, row):
+        # type: (List[Any]) -> None
+        self.write(row)
+        self.count += 1
+
+    def write_json(self, row):
+        # type: (List[Any]) -> None
+        self.f.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+
+    def close(self):
+        # type: () -> None
+        self.f.close()
+
+    def __enter__(self):
+        # type: () -> RowSink
+        return self
+
+    def __exit__(self, *exc):
+        # type: (Any) -> None
+        self.close()
 
 
 import SuperTool
@@ -812,8 +922,12 @@ def supertool_execute( *,
     summary_only=False, 
     unwind_lists=False, 
     commit_changes=False, 
-    args=""):
-        # type: (str,Any,Any,Any,List[str],str,str,str,str,bool,bool,bool,str) -> Any
+    args="",
+    workers=0,
+    sink=None,
+    incremental=False,
+    spill_rows=0):
+        # type: (str,Any,Any,Any,List[str],str,str,str,str,bool,bool,bool,str,int,Optional[Callable],bool,int) -> Any
         query = SuperTool.Query()
         if initial_statements:
             query.initial_statements = textwrap.dedent(initial_statements)
@@ -828,16 +942,16 @@ def supertool_execute( *,
         query.unwind_lists = unwind_lists
         query.commit_changes = commit_changes
         query.summary_only = summary_only
-        return supertool_execute_query(query=query, dbstate=dbstate, db=db, trans=trans, handles=handles, args=args) 
+        return supertool_execute_query(query=query, dbstate=dbstate, db=db, trans=trans, handles=handles, args=args, workers=workers, sink=sink, incremental=incremental, spill_rows=spill_rows) 
 
-def supertool_execute_script(*, script, dbstate=None, db=None, trans=None, handles=None, args=""): 
-        # type: (str,Any,Any,Any,List[str],str) -> Any
+def supertool_execute_script(*, script, dbstate=None, db=None, trans=None, handles=None, args="", workers=0, sink=None, incremental=False, spill_rows=0): 
+        # type: (str,Any,Any,Any,List[str],str,int,Optional[Callable],bool,int) -> Any
         scriptfile = SuperTool.ScriptFile()
         query = scriptfile.load(script)
-        return supertool_execute_query(query=query, dbstate=dbstate, db=db, trans=trans, handles=handles, args=args) 
+        return supertool_execute_query(query=query, dbstate=dbstate, db=db, trans=trans, handles=handles, args=args, workers=workers, sink=sink, incremental=incremental, spill_rows=spill_rows) 
 
-def supertool_execute_query(*, query, dbstate=None, db=None, trans=None, handles=None, args=""): 
-        # type: (SuperTool.Query,Any,Any,Any,List[str],str) -> Any
+def make_engine(query, dbstate, db, handles, args):
+        # type: (SuperTool.Query,Any,Any,List[str],str) -> SuperTool.GrampsEngine
         env = {
             "args": args, 
         }
@@ -860,12 +974,13 @@ def supertool_execute_query(*, query, dbstate=None, db=None, trans=None, handles
                 selected_handles = []
         else:
             selected_handles = handles
+        storage_order = handles is None
 
         user = User()
         user.uistate = None
         
         env = Lazyenv(**env)
-        gramps_engine = SuperTool.GrampsEngine(
+        return SuperTool.GrampsEngine(
             dbstate,
             user,
             context,
@@ -873,31 +988,54 @@ def supertool_execute_query(*, query, dbstate=None, db=None, trans=None, handles
             query,
             env=env,
             raw_values=True,
+            storage_order=storage_order,
         )
-        result = SuperTool.Result()
-        rows = []
+
+def generate_query_rows(gramps_engine, trans, result, workers, incremental=False):
+        # type: (SuperTool.GrampsEngine,Any,SuperTool.Result,int,bool) -> Iterator[List[Any]]
         if trans is not None:
-            for values in gramps_engine.get_values(trans, result):
-                rows.append(values[1:-2])
+            for values in gramps_engine.get_values(trans, result, workers, incremental):
+                yield values[1:-2]
         else:
-            with DbTxn("Generating values", dbstate.db) as trans:
-                for values in gramps_engine.get_values(trans, result):
-                    rows.append(values[1:-2])
-        return Response(rows=rows, query=query, result=result)
-    
+            with DbTxn("Generating values", gramps_engine.db) as trans:
+                for values in gramps_engine.get_values(trans, result, workers, incremental):
+                    yield values[1:-2]
+
+def supertool_execute_query(*, query, dbstate=None, db=None, trans=None, handles=None, args="", workers=0, sink=None, incremental=False, spill_rows=0): 
+        # type: (SuperTool.Query,Any,Any,Any,List[str],str,int,Optional[Callable],bool,int) -> Any
+        gramps_engine = make_engine(query, dbstate, db, handles, args)
+        result = SuperTool.Result()
+        rows = []  # type: Any
+        if spill_rows:
+            # rows beyond spill_rows go to a temporary file
+            rows = supertool_rowstore.RowStore(spill_rows, cache=gramps_engine.cache)
+        # with a sink the rows are passed on as they are generated, not kept
+        write = rows.append if sink is None else sink
+        for row in generate_query_rows(gramps_engine, trans, result, workers, incremental):
+            write(row)
+        return Response(rows=rows, query=query, result=result, cache=gramps_engine.cache)
+
+def supertool_iterate_query(*, query, dbstate=None, db=None, trans=None, handles=None, args="", workers=0, incremental=False): 
+        # type: (SuperTool.Query,Any,Any,Any,List[str],str,int,bool) -> Iterator[List[Any]]
+        "Like supertool_execute_query but yields the rows one at a time"
+        gramps_engine = make_engine(query, dbstate, db, handles, args)
+        result = SuperTool.Result()
+        yield from generate_query_rows(gramps_engine, trans, result, workers, incremental)
+
 
 
 def getproxy(db, obj):
     # type: (DbGeneric, PrimaryObject) -> engine.Proxy
-    if isinstance(obj, Person): return engine.PersonProxy(db, obj.handle)
-    if isinstance(obj, Family): return engine.FamilyProxy(db, obj.handle)
-    if isinstance(obj, Event): return engine.EventProxy(db, obj.handle)
-    if isinstance(obj, Place): return engine.PlaceProxy(db, obj.handle)
-    if isinstance(obj, Citation): return engine.CitationProxy(db, obj.handle)
-    if isinstance(obj, Source): return engine.SourceProxy(db, obj.handle)
-    if isinstance(obj, Repository): return engine.RepositoryProxy(db, obj.handle)
-    if isinstance(obj, Media): return engine.MediaProxy(db, obj.handle)
-    if isinstance(obj, Note): return engine.NoteProxy(db, obj.handle)
+    cache = engine.get_cache(db)
+    if isinstance(obj, Person): return cache.proxy(engine.PersonProxy, obj.handle)
+    if isinstance(obj, Family): return cache.proxy(engine.FamilyProxy, obj.handle)
+    if isinstance(obj, Event): return cache.proxy(engine.EventProxy, obj.handle)
+    if isinstance(obj, Place): return cache.proxy(engine.PlaceProxy, obj.handle)
+    if isinstance(obj, Citation): return cache.proxy(engine.CitationProxy, obj.handle)
+    if isinstance(obj, Source): return cache.proxy(engine.SourceProxy, obj.handle)
+    if isinstance(obj, Repository): return cache.proxy(engine.RepositoryProxy, obj.handle)
+    if isinstance(obj, Media): return cache.proxy(engine.MediaProxy, obj.handle)
+    if isinstance(obj, Note): return cache.proxy(engine.NoteProxy, obj.handle)
     raise engine.SupertoolException("Unknown object type: " + str(type(obj)))
 
     
\ No newline at end of file